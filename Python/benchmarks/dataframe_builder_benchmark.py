@@ -0,0 +1,70 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Compare the columnar DataFrame builder against building DataFrames from row tuples.
+
+Runs on synthetic rows shaped like a wide numeric result set, so no SQL Server is needed:
+
+    python benchmarks/dataframe_builder_benchmark.py --rows 200000 --columns 50
+"""
+
+import argparse
+import datetime
+import random
+import timeit
+
+from pandas import DataFrame
+
+from sqlmlutils.dataframebuilder import build_dataframe
+
+
+def make_result_set(n_rows: int, n_columns: int, null_fraction: float, mixed: bool):
+    types = [int, float, float, bool, datetime.datetime] if mixed else [int, float]
+    description = [("col{}".format(i), types[i % len(types)], None, None, None, None, True)
+                   for i in range(n_columns)]
+    start = datetime.datetime(2020, 1, 1)
+
+    def value(type_code, row):
+        if random.random() < null_fraction:
+            return None
+        if type_code is int:
+            return row
+        if type_code is float:
+            return row * 0.5
+        if type_code is bool:
+            return row % 2 == 0
+        return start + datetime.timedelta(seconds=row)
+
+    rows = [tuple(value(element[1], row) for element in description) for row in range(n_rows)]
+    return description, rows
+
+
+def row_based(description, rows):
+    column_names = [element[0] for element in description]
+    return DataFrame([tuple(t) for t in rows], columns=column_names)
+
+
+def columnar(description, rows):
+    return build_dataframe(description, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=50)
+    parser.add_argument("--null-fraction", type=float, default=0.0)
+    parser.add_argument("--mixed", action="store_true", help="add bit and datetime columns to the numeric ones")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    description, rows = make_result_set(args.rows, args.columns, args.null_fraction, args.mixed)
+
+    for name, builder in [("row tuples", row_based), ("columnar", columnar)]:
+        best = min(timeit.repeat(lambda: builder(description, rows), number=1, repeat=args.repeat))
+        df = builder(description, rows)
+        memory = df.memory_usage(deep=True).sum() / 2 ** 20
+        print("{name:>12}: {seconds:8.3f} s  {memory:8.1f} MiB".format(name=name, seconds=best, memory=memory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Compare SQLPythonExecutor.execute_function_batch against one execute_function_in_sql call per argument set.
+
+Each call of execute_function_in_sql starts the external Python runtime; execute_function_batch starts it once for
+the whole list. Needs a SQL Server with Machine Learning Services:
+
+    python benchmarks/function_batch_benchmark.py --server localhost --database AirlineTestDB --calls 50
+"""
+
+import argparse
+import time
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+
+
+def short_function(alpha, work=1000):
+    # Stands in for a sub-second model fit in a parameter sweep
+    total = 0.0
+    for i in range(work):
+        total += alpha * i
+    return total
+
+
+def separate_calls(sqlpy: SQLPythonExecutor, arg_list: list, work: int):
+    return [sqlpy.execute_function_in_sql(short_function, alpha, work=work) for alpha in arg_list]
+
+
+def batch(sqlpy: SQLPythonExecutor, arg_list: list, work: int):
+    return sqlpy.execute_function_batch(short_function, arg_list, work=work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--driver", default="SQL Server")
+    parser.add_argument("--server", default="localhost")
+    parser.add_argument("--database", default="AirlineTestDB")
+    parser.add_argument("--uid", default="")
+    parser.add_argument("--pwd", default="")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--work", type=int, default=1000, help="loop iterations per call")
+    args = parser.parse_args()
+
+    sqlpy = SQLPythonExecutor(ConnectionInfo(driver=args.driver, server=args.server, database=args.database,
+                                             uid=args.uid, pwd=args.pwd))
+    arg_list = [i / args.calls for i in range(args.calls)]
+
+    # Warm up the connection pool and the script caches
+    sqlpy.execute_function_in_sql(short_function, 0.0, work=args.work)
+
+    results = {}
+    for name, run in [("separate calls", lambda: separate_calls(sqlpy, arg_list, args.work)),
+                      ("batch", lambda: batch(sqlpy, arg_list, args.work))]:
+        start = time.perf_counter()
+        results[name] = run()
+        seconds = time.perf_counter() - start
+        print("{name:>16}: {seconds:8.3f} s  {rate:8.1f} calls/s".format(name=name, seconds=seconds,
+                                                                         rate=args.calls / seconds))
+    assert results["separate calls"] == results["batch"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Compare sending a client DataFrame to a function as input_df against passing it as a pickled argument.
+
+With input_df the rows are bulk loaded into a session temp table with fast_executemany and read through
+@input_data_1; as an argument the DataFrame is pickled into a varbinary(MAX) parameter and unpickled by the script.
+Needs a SQL Server with Machine Learning Services:
+
+    python benchmarks/input_df_benchmark.py --server localhost --database AirlineTestDB --rows 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from pandas import DataFrame
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+
+
+def column_sums(df):
+    return df.sum().tolist()
+
+
+def make_dataframe(rows: int, columns: int) -> DataFrame:
+    rng = np.random.RandomState(0)
+    return DataFrame({"c{}".format(i): rng.rand(rows) for i in range(columns)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--driver", default="SQL Server")
+    parser.add_argument("--server", default="localhost")
+    parser.add_argument("--database", default="AirlineTestDB")
+    parser.add_argument("--uid", default="")
+    parser.add_argument("--pwd", default="")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=10)
+    args = parser.parse_args()
+
+    sqlpy = SQLPythonExecutor(ConnectionInfo(driver=args.driver, server=args.server, database=args.database,
+                                             uid=args.uid, pwd=args.pwd))
+    df = make_dataframe(args.rows, args.columns)
+
+    # Warm up the connection pool and the script caches
+    sqlpy.execute_function_in_sql(column_sums, df.head(10))
+
+    results = {}
+    for name, run in [("pickled argument", lambda: sqlpy.execute_function_in_sql(column_sums, df)),
+                      ("input_df", lambda: sqlpy.execute_function_in_sql(column_sums, input_df=df))]:
+        start = time.perf_counter()
+        results[name] = run()
+        seconds = time.perf_counter() - start
+        print("{name:>16}: {seconds:8.3f} s  {rate:10.0f} rows/s".format(name=name, seconds=seconds,
+                                                                          rate=args.rows / seconds))
+    assert np.allclose(results["pickled argument"], results["input_df"])
+
+
+if __name__ == "__main__":
+    main()
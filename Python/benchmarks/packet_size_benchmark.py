@@ -0,0 +1,79 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Measure binary transfer throughput for several TDS packet sizes and report the fastest one.
+
+Large varbinary values are downloaded (like pickled function results) and uploaded (like pickled arguments and
+CREATE EXTERNAL LIBRARY content) over connections opened with each packet size. Any SQL Server instance works,
+including a local container standing in for the production server; nothing is written to the database:
+
+    python benchmarks/packet_size_benchmark.py --server localhost --database AirlineTestDB --megabytes 64
+
+Then pass the best size to ConnectionInfo(..., packet_size=N).
+"""
+
+import argparse
+import os
+import time
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+
+PACKET_SIZES = [4096, 8192, 16384, 32767]
+
+DOWNLOAD_QUERY = "SELECT CONVERT(varbinary(MAX), REPLICATE(CONVERT(varchar(MAX), 'x'), ?)) AS payload"
+UPLOAD_QUERY = "SELECT DATALENGTH(?) AS size"
+
+
+def download(sqlpy: SQLPythonExecutor, size: int):
+    df = sqlpy.execute_sql_query(DOWNLOAD_QUERY, size)
+    assert len(df["payload"][0]) == size
+
+
+def upload(sqlpy: SQLPythonExecutor, payload: bytes):
+    df = sqlpy.execute_sql_query(UPLOAD_QUERY, payload)
+    assert df["size"][0] == len(payload)
+
+
+def best_of(call, repeat: int) -> float:
+    # The first call opens the pooled connection and is not timed
+    call()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--driver", default="SQL Server")
+    parser.add_argument("--server", default="localhost")
+    parser.add_argument("--database", default="AirlineTestDB")
+    parser.add_argument("--uid", default="")
+    parser.add_argument("--pwd", default="")
+    parser.add_argument("--megabytes", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--packet-sizes", type=int, nargs="+", default=PACKET_SIZES)
+    args = parser.parse_args()
+
+    size = args.megabytes * 1024 * 1024
+    payload = os.urandom(size)
+
+    results = {}
+    for packet_size in args.packet_sizes:
+        connection = ConnectionInfo(driver=args.driver, server=args.server, database=args.database,
+                                    uid=args.uid, pwd=args.pwd, packet_size=packet_size)
+        sqlpy = SQLPythonExecutor(connection)
+        down = best_of(lambda: download(sqlpy, size), args.repeat)
+        up = best_of(lambda: upload(sqlpy, payload), args.repeat)
+        results[packet_size] = (down, up)
+        print("{packet_size:>6} bytes: download {down:8.1f} MB/s  upload {up:8.1f} MB/s".format(
+            packet_size=packet_size, down=args.megabytes / down, up=args.megabytes / up))
+
+    best = min(results, key=lambda packet_size: sum(results[packet_size]))
+    print("best packet_size: {best}".format(best=best))
+
+
+if __name__ == "__main__":
+    main()
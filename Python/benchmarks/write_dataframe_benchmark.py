@@ -0,0 +1,84 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Compare SQLPythonExecutor.write_dataframe against inserting a DataFrame row by row.
+
+Needs a SQL Server database the user can create tables in; the benchmark tables are dropped at the end:
+
+    python benchmarks/write_dataframe_benchmark.py --server localhost --database AirlineTestDB --rows 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyodbc
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+from sqlmlutils.dataframewriter import InsertBuilder, dataframe_rows
+
+TABLE_NAME = "dbo.sqlmlutils_write_benchmark"
+
+
+def make_dataframe(n_rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "id": np.arange(n_rows, dtype=np.int64),
+        "score": rng.random(n_rows),
+        "label": rng.choice(["low", "medium", "high"], n_rows),
+        "flag": rng.random(n_rows) > 0.5,
+        "created": pd.Timestamp("2020-01-01") + pd.to_timedelta(np.arange(n_rows), unit="s"),
+    })
+
+
+def row_by_row(connection: ConnectionInfo, df: pd.DataFrame):
+    sqlpy = SQLPythonExecutor(connection)
+    # Create the empty table with the same schema
+    sqlpy.write_dataframe(df.iloc[:0], TABLE_NAME, mode="replace")
+
+    cnxn = pyodbc.connect(connection.connection_string)
+    try:
+        cursor = cnxn.cursor()
+        query = InsertBuilder(TABLE_NAME, list(df.columns)).base_script
+        for row in dataframe_rows(df):
+            cursor.execute(query, row)
+        cnxn.commit()
+    finally:
+        cnxn.close()
+
+
+def write_dataframe(connection: ConnectionInfo, df: pd.DataFrame, chunksize: int):
+    SQLPythonExecutor(connection).write_dataframe(df, TABLE_NAME, mode="replace", chunksize=chunksize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--driver", default="SQL Server")
+    parser.add_argument("--server", default="localhost")
+    parser.add_argument("--database", default="AirlineTestDB")
+    parser.add_argument("--uid", default="")
+    parser.add_argument("--pwd", default="")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chunksize", type=int, default=10000)
+    args = parser.parse_args()
+
+    connection = ConnectionInfo(driver=args.driver, server=args.server, database=args.database,
+                                uid=args.uid, pwd=args.pwd)
+    df = make_dataframe(args.rows)
+
+    try:
+        for name, write in [("row by row", lambda: row_by_row(connection, df)),
+                            ("write_dataframe", lambda: write_dataframe(connection, df, args.chunksize))]:
+            start = time.perf_counter()
+            write()
+            seconds = time.perf_counter() - start
+            print("{name:>16}: {seconds:8.3f} s  {rate:10.0f} rows/s".format(name=name, seconds=seconds,
+                                                                             rate=len(df) / seconds))
+    finally:
+        SQLPythonExecutor(connection).execute_sql_query(
+            "IF OBJECT_ID(N'{table}', N'U') IS NOT NULL DROP TABLE {table}".format(table=TABLE_NAME))
+
+
+if __name__ == "__main__":
+    main()
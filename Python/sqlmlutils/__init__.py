@@ -3,5 +3,9 @@
 
 from .connectioninfo import ConnectionInfo
 from .sqlpythonexecutor import SQLPythonExecutor
+from .sqlserverexecutor import SQLServerExecutor
+from .sqlqueryexecutor import CancellationToken, QueryCancelledError, QueryTimeoutError
+from .outputcapture import OutputCapture
 from .packagemanagement.scope import Scope
-from .packagemanagement.sqlpackagemanager import SQLPackageManager
\ No newline at end of file
+from .packagemanagement.sqlpackagemanager import SQLPackageManager
+from .asyncsqlpythonexecutor import AsyncSQLPythonExecutor, AsyncSQLPackageManager
@@ -0,0 +1,134 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import datetime
+import decimal
+import itertools
+
+import pandas as pd
+
+"""This module turns pyodbc result rows into Apache Arrow record batches column by column.
+
+Like dataframebuilder, the Arrow type of each column is taken from the type code pyodbc reports in cursor.description.
+Each column is converted to an Arrow array in one call, with NULLs in the validity bitmap, so strings are stored in
+one contiguous buffer instead of as Python objects and integer or bit columns with NULLs keep their type.
+
+pyarrow is an optional dependency, imported when an Arrow result is requested.
+"""
+
+PANDAS = "pandas"
+PANDAS_ARROW = "pandas_arrow"
+ARROW = "arrow"
+ARROW_STREAM = "arrow_stream"
+
+RESULT_FORMATS = (PANDAS, PANDAS_ARROW, ARROW, ARROW_STREAM)
+
+
+def check_result_format(result_format: str):
+    """Raise ValueError if result_format is not one of RESULT_FORMATS."""
+    if result_format not in RESULT_FORMATS:
+        raise ValueError("result_format {result_format} not supported, use one of: {formats}".format(
+            result_format=result_format, formats=", ".join(RESULT_FORMATS)))
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Arrow results need the pyarrow package; install it with: pip install pyarrow")
+    return pyarrow
+
+
+def arrow_schema(description):
+    """Arrow schema of a result set.
+
+    :param description: cursor.description of the result set
+    """
+    pa = import_pyarrow()
+    return pa.schema([pa.field(element[0], _arrow_type(pa, element), nullable=True) for element in description])
+
+
+def build_record_batch(description, rows, schema=None):
+    """Build an Arrow record batch from the rows of a result set.
+
+    :param description: cursor.description of the result set
+    :param rows: sequence of pyodbc rows (or tuples) from fetchall/fetchmany
+    :param schema: arrow_schema(description), if already computed
+    :return: pyarrow.RecordBatch with one typed column per entry in description
+    """
+    pa = import_pyarrow()
+    if schema is None:
+        schema = arrow_schema(description)
+    columns = list(zip(*rows)) if len(rows) > 0 else [() for _ in description]
+    arrays = [_build_array(pa, element[1], field.type, values)
+              for element, field, values in zip(description, schema, columns)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def build_table(description, rows):
+    """Build an Arrow table from the rows of a result set, see build_record_batch."""
+    pa = import_pyarrow()
+    return pa.Table.from_batches([build_record_batch(description, rows)])
+
+
+def empty_table():
+    """Table of a query that returned no result set."""
+    pa = import_pyarrow()
+    return pa.table({})
+
+
+def record_batch_reader(batches):
+    """Wrap an iterator of record batches in a pyarrow.RecordBatchReader.
+
+    The first batch is read right away to get the schema; an iterator without batches gives an empty reader.
+    """
+    pa = import_pyarrow()
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return pa.RecordBatchReader.from_batches(pa.schema([]), iter(()))
+    return pa.RecordBatchReader.from_batches(first.schema, itertools.chain([first], batches))
+
+
+def to_pandas(table):
+    """Convert an Arrow table to a DataFrame backed by the Arrow buffers, without copying the data.
+
+    The DataFrame columns use pandas.ArrowDtype, so strings, decimals and nullable integers keep their Arrow
+    representation instead of becoming object columns.
+    """
+    if not hasattr(pd, "ArrowDtype"):
+        raise ImportError("DataFrames backed by Arrow need pandas 2.0 or later")
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def _arrow_type(pa, element):
+    type_code = element[1]
+    if type_code is bool:
+        return pa.bool_()
+    elif type_code is int:
+        return pa.int64()
+    elif type_code is float:
+        return pa.float64()
+    elif type_code is str:
+        return pa.string()
+    elif type_code is bytes or type_code is bytearray:
+        return pa.binary()
+    elif type_code is datetime.datetime:
+        return pa.timestamp("us")
+    elif type_code is datetime.date:
+        return pa.date32()
+    elif type_code is datetime.time:
+        return pa.time64("us")
+    elif type_code is decimal.Decimal:
+        precision, scale = element[4], element[5]
+        if precision and 0 < precision <= 38:
+            return pa.decimal128(precision, scale or 0)
+        return pa.decimal128(38, 10)
+    # Other types (uniqueidentifier, sql_variant...) are sent as their text
+    return pa.string()
+
+
+def _build_array(pa, type_code, arrow_type, values):
+    if type_code is not str and pa.types.is_string(arrow_type):
+        values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+    return pa.array(values, type=arrow_type)
@@ -0,0 +1,241 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import asyncio
+import functools
+import math
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from pandas import DataFrame
+
+from .connectioninfo import ConnectionInfo
+from .sqlpythonexecutor import SQLPythonExecutor
+from .sqlqueryexecutor import CancellationToken, QueryTimeoutError, iter_raw_query
+from .packagemanagement.sqlpackagemanager import SQLPackageManager
+
+"""asyncio versions of SQLPythonExecutor and SQLPackageManager.
+
+pyodbc calls block, so every call runs on a bounded pool of worker threads and the event loop only awaits its
+completion. When the awaiting task is cancelled, or its timeout expires, the running statement is cancelled on the
+server with cursor.cancel() (see sqlqueryexecutor.CancellationToken) and the connection goes back to the pool. The
+timeout is also set as the query timeout of the statements (rounded up to whole seconds), so the server stops them by
+itself when the cancel cannot reach it.
+"""
+
+DEFAULT_MAX_WORKERS = 16
+
+
+class _AsyncRunner:
+
+    def __init__(self, max_workers: int, timeout: float):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self._threads = ThreadPoolExecutor(max_workers)
+        self._timeout = timeout
+
+    async def run(self, call: Callable, timeout: float = None, token: CancellationToken = None):
+        token = token if token is not None else CancellationToken()
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(self._threads, self._call_with_token, token, call)
+        timeout = timeout if timeout is not None else self._timeout
+        try:
+            if timeout is None:
+                return await future
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            token.cancel()
+            raise
+        except QueryTimeoutError as error:
+            # The server stopped the statement first
+            if timeout is None:
+                raise
+            raise asyncio.TimeoutError(str(error)) from error
+
+    def query_timeout(self, timeout: float = None) -> int:
+        """Query timeout in whole seconds for the statements of a call with the given timeout, None for none."""
+        timeout = timeout if timeout is not None else self._timeout
+        return None if timeout is None else max(1, math.ceil(timeout))
+
+    def run_in_background(self, call: Callable):
+        self._threads.submit(call)
+
+    def close(self, wait: bool = True):
+        self._threads.shutdown(wait)
+
+    @staticmethod
+    def _call_with_token(token: CancellationToken, call: Callable):
+        with token:
+            return call()
+
+
+class AsyncChunkIterator:
+    """Asynchronous iterator over the chunks of a query result, returned by AsyncSQLPythonExecutor.iter_sql_query.
+
+    The connection stays checked out until the iteration ends or aclose() is called.
+    """
+
+    _END = object()
+
+    def __init__(self, runner: _AsyncRunner, generator, timeout: float = None):
+        self._runner = runner
+        self._generator = generator
+        self._timeout = timeout
+        # The query runs on the first chunk; the same token cancels it whichever chunk is being awaited
+        self._token = CancellationToken()
+        # A cancelled step may still be running on its worker thread when the generator is closed
+        self._lock = threading.Lock()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> DataFrame:
+        try:
+            chunk = await self._runner.run(self._next, timeout=self._timeout, token=self._token)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self._runner.run_in_background(self._close)
+            raise
+        if chunk is self._END:
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self):
+        """Stop iterating and return the connection to the pool."""
+        await self._runner.run(self._close)
+
+    def _next(self):
+        with self._lock:
+            return next(self._generator, self._END)
+
+    def _close(self):
+        with self._lock:
+            self._generator.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        await self.aclose()
+
+
+class AsyncSQLPythonExecutor:
+
+    def __init__(self, connection_info: ConnectionInfo, language_name: str = "Python",
+                 max_workers: int = DEFAULT_MAX_WORKERS, timeout: float = None):
+        """Initialize an executor whose methods are coroutines, for use from asyncio code.
+
+        :param connection_info: The ConnectionInfo object that holds the connection string and other information.
+        :param language_name: The name of the language to be executed in sp_execute_external_script, if using
+        EXTERNAL LANGUAGE.
+        :param max_workers: maximum number of calls running at the same time; further calls wait for a free worker.
+        Calls on pooled connections also wait for a free connection (see connectionpool.configure_pool).
+        :param timeout: default number of seconds a call may take before it is cancelled on the server and
+        asyncio.TimeoutError is raised; None for no timeout. Every method also takes a timeout for that call.
+
+        >>> import asyncio
+        >>> from sqlmlutils import ConnectionInfo
+        >>> from sqlmlutils.asyncsqlpythonexecutor import AsyncSQLPythonExecutor
+        >>>
+        >>> def score(x):
+        >>>     return x * 2
+        >>>
+        >>> async def main():
+        >>>     sqlpy = AsyncSQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"), timeout=60)
+        >>>     results = await asyncio.gather(*(sqlpy.execute_function_in_sql(score, x) for x in range(100)))
+        >>>     async for chunk in sqlpy.iter_sql_query("SELECT * FROM airline5000", chunksize=1000):
+        >>>         print(chunk.shape)
+        >>>
+        >>> asyncio.get_event_loop().run_until_complete(main())
+        """
+        self._connection_info = connection_info
+        self._sqlpy = SQLPythonExecutor(connection_info, language_name)
+        self._runner = _AsyncRunner(max_workers, timeout)
+
+    async def execute_function_in_sql(self, func: Callable, *args, timeout: float = None, **kwargs):
+        """Execute a function in SQL Server, see SQLPythonExecutor.execute_function_in_sql.
+
+        :param timeout: seconds before the call is cancelled on the server and asyncio.TimeoutError is raised
+        """
+        return await self._runner.run(functools.partial(self._sqlpy.execute_function_in_sql, func, *args,
+                                                        timeout=self._runner.query_timeout(timeout), **kwargs),
+                                      timeout=timeout)
+
+    async def execute_function_batch(self, func: Callable, arg_list, timeout: float = None, **kwargs) -> list:
+        """Call a function once per argument set in one launch, see SQLPythonExecutor.execute_function_batch.
+
+        :param timeout: seconds before the batch is cancelled on the server and asyncio.TimeoutError is raised
+        """
+        return await self._runner.run(functools.partial(self._sqlpy.execute_function_batch, func, arg_list,
+                                                        timeout=self._runner.query_timeout(timeout), **kwargs),
+                                      timeout=timeout)
+
+    async def execute_script_in_sql(self, path_to_script: str, input_data_query: str = "", timeout: float = None,
+                                    **kwargs):
+        """Execute a script in SQL Server, see SQLPythonExecutor.execute_script_in_sql."""
+        return await self._runner.run(functools.partial(self._sqlpy.execute_script_in_sql, path_to_script,
+                                                        input_data_query, timeout=self._runner.query_timeout(timeout),
+                                                        **kwargs),
+                                      timeout=timeout)
+
+    async def execute_sql_query(self, sql_query: str, params=(), cache: bool = False,
+                                timeout: float = None) -> DataFrame:
+        """Execute a SQL query, see SQLPythonExecutor.execute_sql_query."""
+        return await self._runner.run(functools.partial(self._sqlpy.execute_sql_query, sql_query, params, cache,
+                                                        timeout=self._runner.query_timeout(timeout)),
+                                      timeout=timeout)
+
+    def iter_sql_query(self, sql_query: str, params=(), chunksize: int = 10000, arraysize: int = None,
+                       timeout: float = None) -> AsyncChunkIterator:
+        """Iterate over the result of a SQL query in chunks with `async for`, see SQLPythonExecutor.iter_sql_query.
+
+        :param timeout: seconds each chunk may take to arrive
+        """
+        generator = iter_raw_query(self._connection_info, sql_query, params, chunksize=chunksize, arraysize=arraysize,
+                                   timeout=self._runner.query_timeout(timeout))
+        return AsyncChunkIterator(self._runner, generator, timeout=timeout)
+
+    async def execute_sproc(self, name: str, output_params: dict = None, timeout: float = None, **kwargs):
+        """Call a stored procedure, see SQLPythonExecutor.execute_sproc."""
+        return await self._runner.run(functools.partial(self._sqlpy.execute_sproc, name, output_params,
+                                                        timeout=self._runner.query_timeout(timeout), **kwargs),
+                                      timeout=timeout)
+
+    async def check_sproc(self, name: str, timeout: float = None) -> bool:
+        """Check whether a stored procedure exists, see SQLPythonExecutor.check_sproc."""
+        return await self._runner.run(functools.partial(self._sqlpy.check_sproc, name), timeout=timeout)
+
+    def close(self, wait: bool = True):
+        """Release the worker threads."""
+        self._runner.close(wait)
+
+
+class AsyncSQLPackageManager:
+
+    def __init__(self, connection_info: ConnectionInfo, language_name: str = "Python",
+                 max_workers: int = 4, timeout: float = None):
+        """Initialize a package manager whose methods are coroutines, for use from asyncio code.
+
+        See SQLPackageManager and AsyncSQLPythonExecutor for the parameters.
+        """
+        self._package_manager = SQLPackageManager(connection_info, language_name)
+        self._runner = _AsyncRunner(max_workers, timeout)
+
+    async def install(self, package: str, timeout: float = None, **kwargs):
+        """Install a package, see SQLPackageManager.install."""
+        return await self._runner.run(functools.partial(self._package_manager.install, package, **kwargs),
+                                      timeout=timeout)
+
+    async def uninstall(self, package_name: str, timeout: float = None, **kwargs):
+        """Remove a package, see SQLPackageManager.uninstall."""
+        return await self._runner.run(functools.partial(self._package_manager.uninstall, package_name, **kwargs),
+                                      timeout=timeout)
+
+    async def list(self, timeout: float = None):
+        """List the installed packages, see SQLPackageManager.list."""
+        return await self._runner.run(self._package_manager.list, timeout=timeout)
+
+    def close(self, wait: bool = True):
+        """Release the worker threads."""
+        self._runner.close(wait)
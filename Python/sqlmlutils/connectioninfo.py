@@ -1,13 +1,22 @@
 # Copyright(c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+# ODBC connection attribute setting the TDS packet size, set before the connection is opened
+SQL_ATTR_PACKET_SIZE = 112
+
+APPLICATION_INTENTS = ("ReadWrite", "ReadOnly")
+
+
 class ConnectionInfo:
     """Information needed to connect to SQL Server.
 
     """
 
     def __init__(self, driver: str = "SQL Server", server: str = "localhost", port: str = "", database: str = "master",
-                 uid: str = "", pwd: str = ""):
+                 uid: str = "", pwd: str = "", pooling: bool = True, login_timeout: int = None,
+                 query_timeout: int = None, packet_size: int = None, mars: bool = None,
+                 application_intent: str = None, multi_subnet_failover: bool = None, encrypt = None,
+                 trust_server_certificate: bool = None, attrs_before: dict = None, options: dict = None):
         """
         :param driver: Driver to use to connect to SQL Server.
         :param server: SQL Server hostname or a specific instance to connect to.
@@ -15,16 +24,55 @@ class ConnectionInfo:
         :param database: Database to connect to.
         :param uid: uid to connect with. If not specified, utilizes trusted authentication.
         :param pwd: pwd to connect with. If uid is not specified, pwd is ignored; uses trusted auth instead
+        :param pooling: If True, connections are kept open in a pool and reused between queries.
+        :param login_timeout: seconds to wait for a connection to be opened before QueryTimeoutError is raised.
+        None for the driver default.
+        :param query_timeout: default number of seconds a statement may run before it is cancelled on the server and
+        QueryTimeoutError is raised. None for no timeout. Calls taking a timeout argument override it.
+        :param packet_size: TDS packet size in bytes (512 to 32767). Larger packets mean fewer round trips for large
+        binary values, such as pickled results and package uploads. None for the server default (usually 4096).
+        :param mars: enable Multiple Active Result Sets (MARS_Connection).
+        :param application_intent: "ReadOnly" to be routed to a readable secondary of an availability group, or
+        "ReadWrite".
+        :param multi_subnet_failover: connect to every IP address of a multi-subnet availability group listener in
+        parallel, for faster failover.
+        :param encrypt: encrypt the connection: True, False, or a driver value such as "strict" or "optional".
+        :param trust_server_certificate: do not validate the certificate of the server.
+        :param attrs_before: ODBC connection attributes (attribute number to value) set before connecting, passed
+        to pyodbc.connect.
+        :param options: other connection string keywords, e.g. {"ColumnEncryption": "Enabled"}.
+        None leaves the driver default for every option.
 
         >>> from sqlmlutils import ConnectionInfo
         >>> connection = ConnectionInfo(server="ServerName", database="DatabaseName", uid="Uid", pwd="Pwd")
+        >>> bulk_connection = ConnectionInfo(server="ServerName", database="DatabaseName", packet_size=32767,
+        >>>                                  application_intent="ReadOnly", options={"ConnectRetryCount": 3})
         """
+        if packet_size is not None and not 512 <= packet_size <= 32767:
+            raise ValueError("packet_size must be between 512 and 32767")
+        if application_intent is not None:
+            intents = {intent.lower(): intent for intent in APPLICATION_INTENTS}
+            if application_intent.lower() not in intents:
+                raise ValueError("application_intent must be one of: " + ", ".join(APPLICATION_INTENTS))
+            application_intent = intents[application_intent.lower()]
+
         self._driver = driver
         self._server = server
         self._port = port
         self._database = database
         self._uid = uid
         self._pwd = pwd
+        self._pooling = pooling
+        self._login_timeout = login_timeout
+        self._query_timeout = query_timeout
+        self._packet_size = packet_size
+        self._mars = mars
+        self._application_intent = application_intent
+        self._multi_subnet_failover = multi_subnet_failover
+        self._encrypt = encrypt
+        self._trust_server_certificate = trust_server_certificate
+        self._attrs_before = dict(attrs_before) if attrs_before is not None else {}
+        self._options = dict(options) if options is not None else {}
 
     @property
     def driver(self):
@@ -50,6 +98,54 @@ class ConnectionInfo:
     def pwd(self):
         return self._pwd
 
+    @property
+    def pooling(self):
+        return self._pooling
+
+    @property
+    def login_timeout(self):
+        return self._login_timeout
+
+    @property
+    def query_timeout(self):
+        return self._query_timeout
+
+    @property
+    def packet_size(self):
+        return self._packet_size
+
+    @property
+    def mars(self):
+        return self._mars
+
+    @property
+    def application_intent(self):
+        return self._application_intent
+
+    @property
+    def multi_subnet_failover(self):
+        return self._multi_subnet_failover
+
+    @property
+    def encrypt(self):
+        return self._encrypt
+
+    @property
+    def trust_server_certificate(self):
+        return self._trust_server_certificate
+
+    @property
+    def options(self):
+        return dict(self._options)
+
+    @property
+    def attrs_before(self):
+        """ODBC connection attributes set before connecting, including the packet size."""
+        attrs = dict(self._attrs_before)
+        if self._packet_size is not None:
+            attrs[SQL_ATTR_PACKET_SIZE] = self._packet_size
+        return attrs
+
     @property
     def connection_string(self):
         server = self._server if self._port == "" \
@@ -58,9 +154,30 @@ class ConnectionInfo:
         auth = "Trusted_Connection=Yes" if self._uid == "" \
             else "uid={uid};pwd={{{pwd}}}".format(uid=self._uid, pwd=self._pwd)
 
-        return "Driver={driver};Server={server};Database={database};{auth};".format(
+        options = [("MARS_Connection", self._mars),
+                   ("ApplicationIntent", self._application_intent),
+                   ("MultiSubnetFailover", self._multi_subnet_failover),
+                   ("Encrypt", self._encrypt),
+                   ("TrustServerCertificate", self._trust_server_certificate)]
+        options.extend(self._options.items())
+
+        return "Driver={driver};Server={server};Database={database};{auth};{options}".format(
             driver = self._driver,
             server = server,
             database = self._database,
-            auth = auth
-        )
\ No newline at end of file
+            auth = auth,
+            options = "".join("{keyword}={value};".format(keyword=keyword, value=_format_value(value))
+                              for keyword, value in options if value is not None)
+        )
+
+
+def _format_value(value) -> str:
+    if value is True:
+        return "Yes"
+    if value is False:
+        return "No"
+    value = str(value)
+    # Values with separators or braces are quoted in braces, with closing braces doubled
+    if any(c in value for c in ";{}") or value != value.strip():
+        return "{" + value.replace("}", "}}") + "}"
+    return value
\ No newline at end of file
@@ -0,0 +1,335 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import atexit
+import threading
+import time
+import pyodbc
+
+from collections import deque
+
+from .connectioninfo import ConnectionInfo
+
+"""This module keeps pyodbc connections open between queries so that repeated calls do not pay the TDS login and
+authentication handshake every time.
+
+There is one ConnectionPool per connection string and set of ODBC connection attributes. SQLQueryExecutor checks
+connections out of the pool when it is entered and returns them when it exits, so SQLPythonExecutor,
+SQLPackageManager and execute_query all share pooled connections without any change in how they are called.
+"""
+
+# Driver specific connection attribute (msodbcsql) that asks the driver to reset the session state
+# (temp tables, SET options, open transactions...) before the next statement is sent on the connection.
+# SQL_COPT_SS_BASE (1200) + 44, see msodbcsql.h.
+#
+SQL_COPT_SS_RESET_CONNECTION = 1244
+SQL_RESET_CONNECTION_YES = 1
+
+
+class _PooledConnection:
+
+    def __init__(self, cnxn):
+        self.cnxn = cnxn
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class ConnectionPool:
+    """A thread safe pool of open pyodbc connections for a single connection string.
+
+    """
+
+    def __init__(self,
+                 connection_string: str,
+                 min_size: int = 0,
+                 max_size: int = 10,
+                 idle_timeout: float = 300,
+                 max_lifetime: float = 1800,
+                 health_check_interval: float = 30,
+                 checkout_timeout: float = 30,
+                 login_timeout: int = None,
+                 attrs_before: dict = None):
+        """
+        :param connection_string: ODBC connection string used to open new connections.
+        :param min_size: number of idle connections kept open even when they exceed idle_timeout.
+        :param max_size: maximum number of connections (idle and checked out) the pool will open.
+        :param idle_timeout: seconds an idle connection may stay in the pool before it is closed.
+        :param max_lifetime: seconds after which a connection is closed instead of being reused.
+        :param health_check_interval: connections idle for longer than this many seconds are pinged on checkout.
+        :param checkout_timeout: seconds to wait for a connection when max_size connections are checked out.
+        :param login_timeout: seconds to wait for a new connection to be opened, None for the driver default.
+        :param attrs_before: ODBC connection attributes set before opening new connections.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if min_size < 0 or min_size > max_size:
+            raise ValueError("min_size must be between 0 and max_size")
+
+        self._connection_string = connection_string
+        self._min_size = min_size
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._max_lifetime = max_lifetime
+        self._health_check_interval = health_check_interval
+        self._checkout_timeout = checkout_timeout
+        self._login_timeout = login_timeout
+        self._attrs_before = attrs_before
+
+        self._idle = deque()
+        self._checked_out = {}
+        self._opened = 0
+        self._closed = False
+        self._condition = threading.Condition(threading.Lock())
+
+    @property
+    def max_size(self) -> int:
+        """Maximum number of connections the pool will open."""
+        return self._max_size
+
+    @property
+    def size(self) -> int:
+        """Number of open connections, idle and checked out."""
+        with self._condition:
+            return self._opened
+
+    @property
+    def idle(self) -> int:
+        """Number of open connections waiting in the pool."""
+        with self._condition:
+            return len(self._idle)
+
+    def prefill(self):
+        """Open connections until the pool holds min_size connections."""
+        while True:
+            with self._condition:
+                if self._closed or self._opened >= self._min_size:
+                    return
+                self._opened += 1
+            try:
+                entry = _PooledConnection(self._connect())
+            except Exception:
+                self._forget()
+                raise
+            with self._condition:
+                self._idle.append(entry)
+                self._condition.notify()
+
+    def acquire(self):
+        """Check a connection out of the pool, opening a new one if none is idle and max_size is not reached.
+
+        :return: an open pyodbc connection in autocommit mode
+        """
+        deadline = time.monotonic() + self._checkout_timeout
+        while True:
+            entry = None
+            stale = []
+            try:
+                with self._condition:
+                    while True:
+                        if self._closed:
+                            raise RuntimeError("Connection pool is closed")
+                        stale.extend(self._evict())
+                        if self._idle:
+                            entry = self._idle.pop()
+                            break
+                        if self._opened < self._max_size:
+                            self._opened += 1
+                            break
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise RuntimeError("Timed out waiting for a pooled SQL Server connection")
+                        self._condition.wait(remaining)
+            finally:
+                self._close_all(stale)
+
+            if entry is None:
+                try:
+                    entry = _PooledConnection(self._connect())
+                except Exception:
+                    self._forget()
+                    raise
+            elif not self._is_healthy(entry):
+                self._discard(entry)
+                continue
+
+            with self._condition:
+                self._checked_out[id(entry.cnxn)] = entry
+            return entry.cnxn
+
+    def release(self, cnxn, discard: bool = False):
+        """Return a connection to the pool.
+
+        :param cnxn: connection previously returned by acquire.
+        :param discard: close the connection instead of keeping it, e.g. after a broken or cancelled query.
+        """
+        with self._condition:
+            entry = self._checked_out.pop(id(cnxn), None)
+        if entry is None:
+            _close_quietly(cnxn)
+            return
+
+        now = time.monotonic()
+        if discard or self._closed or now - entry.created > self._max_lifetime or not self._reset(entry):
+            self._discard(entry)
+            return
+
+        entry.last_used = now
+        with self._condition:
+            self._idle.append(entry)
+            self._condition.notify()
+
+    def close(self):
+        """Close every idle connection. Connections that are checked out are closed when released."""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._opened -= len(idle)
+            self._condition.notify_all()
+        self._close_all(idle)
+
+    def _connect(self):
+        return connect(self._connection_string, self._login_timeout, self._attrs_before)
+
+    # Removes expired connections from the idle queue; the caller closes them outside of the lock.
+    # Must be called with the lock held.
+    def _evict(self):
+        now = time.monotonic()
+        stale = []
+        keep = deque()
+        for entry in self._idle:
+            expired = now - entry.created > self._max_lifetime
+            idle_too_long = now - entry.last_used > self._idle_timeout and \
+                len(self._idle) - len(stale) > self._min_size
+            if expired or idle_too_long:
+                stale.append(entry)
+            else:
+                keep.append(entry)
+        self._idle = keep
+        self._opened -= len(stale)
+        return stale
+
+    def _is_healthy(self, entry: _PooledConnection) -> bool:
+        if getattr(entry.cnxn, "closed", False):
+            return False
+        if time.monotonic() - entry.last_used < self._health_check_interval:
+            return True
+        try:
+            entry.cnxn.cursor().execute("SELECT 1").fetchall()
+            return True
+        except pyodbc.Error:
+            return False
+
+    # Puts the session back into the state of a freshly opened connection before it is reused.
+    @staticmethod
+    def _reset(entry: _PooledConnection) -> bool:
+        try:
+            if not entry.cnxn.autocommit:
+                entry.cnxn.rollback()
+                entry.cnxn.autocommit = True
+        except pyodbc.Error:
+            return False
+
+        try:
+            entry.cnxn.set_attr(SQL_COPT_SS_RESET_CONNECTION, SQL_RESET_CONNECTION_YES)
+        except (AttributeError, pyodbc.Error):
+            # Older pyodbc versions or drivers other than msodbcsql cannot reset the session in place.
+            pass
+        return True
+
+    def _discard(self, entry: _PooledConnection):
+        self._forget()
+        _close_quietly(entry.cnxn)
+
+    def _forget(self):
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close_all(entries):
+        for entry in entries:
+            _close_quietly(entry.cnxn)
+
+
+def connect(connection_string: str, login_timeout: int = None, attrs_before: dict = None):
+    """Open a pyodbc connection in autocommit mode.
+
+    :param login_timeout: seconds to wait for the connection, None for the driver default
+    :param attrs_before: ODBC connection attributes set before connecting (e.g. the packet size)
+    """
+    kwargs = {}
+    if login_timeout is not None:
+        kwargs["timeout"] = login_timeout
+    if attrs_before:
+        kwargs["attrs_before"] = attrs_before
+    return pyodbc.connect(connection_string, autocommit=True, **kwargs)
+
+
+def _close_quietly(cnxn):
+    try:
+        cnxn.close()
+    except pyodbc.Error:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Connections opened with different attributes (packet size, access token...) are not interchangeable
+def _pool_key(connection: ConnectionInfo):
+    return connection.connection_string, tuple(sorted(connection.attrs_before.items()))
+
+
+def get_pool(connection: ConnectionInfo) -> ConnectionPool:
+    """Get the pool used for a connection, creating one with default settings if needed.
+
+    :param connection: ConnectionInfo of the server to connect to.
+    :return: ConnectionPool shared by every ConnectionInfo with the same connection string and attributes
+    """
+    key = _pool_key(connection)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(connection.connection_string, login_timeout=connection.login_timeout,
+                                  attrs_before=connection.attrs_before)
+            _pools[key] = pool
+        return pool
+
+
+def configure_pool(connection: ConnectionInfo, **kwargs) -> ConnectionPool:
+    """Replace the pool used for a connection with one using the given settings.
+
+    :param connection: ConnectionInfo of the server to connect to.
+    :param kwargs: ConnectionPool settings (min_size, max_size, idle_timeout, max_lifetime...)
+    :return: the new ConnectionPool
+
+    >>> from sqlmlutils import ConnectionInfo
+    >>> from sqlmlutils.connectionpool import configure_pool
+    >>> connection = ConnectionInfo(server="localhost", database="AirlineTestDB")
+    >>> configure_pool(connection, min_size=2, max_size=8, idle_timeout=60)
+    """
+    key = _pool_key(connection)
+    kwargs.setdefault("login_timeout", connection.login_timeout)
+    kwargs.setdefault("attrs_before", connection.attrs_before)
+    pool = ConnectionPool(connection.connection_string, **kwargs)
+    with _pools_lock:
+        old_pool = _pools.get(key)
+        _pools[key] = pool
+    if old_pool is not None:
+        old_pool.close()
+    pool.prefill()
+    return pool
+
+
+def close_pools():
+    """Close every pool and their idle connections."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_pools)
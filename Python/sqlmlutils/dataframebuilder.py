@@ -0,0 +1,110 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import datetime
+import numpy as np
+import pandas as pd
+
+from pandas import DataFrame
+
+"""This module turns pyodbc result rows into DataFrames column by column.
+
+The type of each column is taken from the type code pyodbc reports in cursor.description, so values are written
+straight into NumPy arrays of the right dtype instead of letting pandas infer dtypes from Python objects row by row.
+Integer and bit columns that contain NULLs use the pandas nullable extension types, float columns use NaN and
+datetime columns use NaT. Every other SQL type (strings, decimals, dates, binary...) stays an object column.
+"""
+
+try:
+    from pandas.arrays import IntegerArray
+except ImportError:
+    IntegerArray = None
+
+try:
+    from pandas.arrays import BooleanArray
+except ImportError:
+    BooleanArray = None
+
+
+def build_dataframe(description, rows) -> DataFrame:
+    """Build a DataFrame from the rows of a result set.
+
+    :param description: cursor.description of the result set
+    :param rows: sequence of pyodbc rows (or tuples) from fetchall/fetchmany
+    :return: DataFrame with one typed column per entry in description
+    """
+    column_names = [element[0] for element in description]
+    n_rows = len(rows)
+    columns = list(zip(*rows)) if n_rows > 0 else [() for _ in description]
+
+    data = {}
+    for index, element in enumerate(description):
+        data[index] = _build_column(element[1], columns[index], n_rows)
+
+    df = DataFrame(data, index=pd.RangeIndex(n_rows))
+    df.columns = column_names
+    return df
+
+
+def _build_column(type_code, values, n_rows):
+    if type_code is bool:
+        return _build_bool_column(values, n_rows)
+    elif type_code is int:
+        return _build_int_column(values, n_rows)
+    elif type_code is float:
+        return _build_float_column(values, n_rows)
+    elif type_code is datetime.datetime:
+        return _build_datetime_column(values, n_rows)
+    return _build_object_column(values, n_rows)
+
+
+# Splits a column containing NULLs into a filled NumPy array and a mask of the NULL positions
+def _fill_nulls(values, n_rows, fill_value, dtype):
+    result = _build_object_column(values, n_rows)
+    mask = np.equal(result, None)
+    result[mask] = fill_value
+    return result.astype(dtype), mask
+
+
+def _build_int_column(values, n_rows):
+    if None not in values:
+        return np.fromiter(values, dtype=np.int64, count=n_rows)
+
+    filled, mask = _fill_nulls(values, n_rows, 0, np.int64)
+    if IntegerArray is None:
+        result = filled.astype(np.float64)
+        result[mask] = np.nan
+        return result
+    return IntegerArray(filled, mask)
+
+
+def _build_float_column(values, n_rows):
+    # NumPy converts None to NaN for float arrays
+    return np.array(values, dtype=np.float64).reshape(n_rows)
+
+
+def _build_bool_column(values, n_rows):
+    if None not in values:
+        return np.fromiter(values, dtype=bool, count=n_rows)
+
+    if BooleanArray is None:
+        return _build_object_column(values, n_rows)
+    filled, mask = _fill_nulls(values, n_rows, False, bool)
+    return BooleanArray(filled, mask)
+
+
+def _build_datetime_column(values, n_rows):
+    # pandas converts Python datetimes (and None to NaT) in one vectorized pass, at the resolution it picks for them.
+    # Versions of pandas that only have nanosecond resolution cannot hold dates outside 1677-2262 (e.g. the 9999-12-31
+    # "open ended" sentinel), so those columns stay Python datetimes.
+    result = _build_object_column(values, n_rows)
+    try:
+        return np.asarray(pd.to_datetime(result))
+    except pd.errors.OutOfBoundsDatetime:
+        return result
+
+
+def _build_object_column(values, n_rows):
+    result = np.empty(n_rows, dtype=object)
+    result[:] = values
+    return result
@@ -0,0 +1,288 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import pyodbc
+
+from pandas import DataFrame
+
+from .connectioninfo import ConnectionInfo
+from .sqlbuilder import SQLBuilder
+from .sqlqueryexecutor import SQLQueryExecutor
+from .sqltypes import column_types, column_declarations, quote_name, quote_table_name
+
+"""Bulk upload of client DataFrames into SQL Server tables.
+
+Rows are sent with pyodbc's fast_executemany, i.e. as arrays of typed parameters, with the parameter types declared
+up front from the DataFrame dtypes. Upserts load a session temp table the same way and MERGE it into the target.
+
+DataFrames passed as input_df to SQLPythonExecutor.execute_function_in_sql are loaded into a session temp table too,
+which the input query of sp_execute_external_script then reads on the same connection.
+"""
+
+APPEND = "append"
+REPLACE = "replace"
+UPSERT = "upsert"
+
+WRITE_MODES = (APPEND, REPLACE, UPSERT)
+
+STAGING_TABLE_NAME = "#sqlmlutils_staging"
+
+INPUT_TABLE_NAME = "#sqlmlutils_input"
+
+# Longest nvarchar / varbinary values that are not sent as (MAX) parameters
+_MAX_NVARCHAR_LENGTH = 4000
+_MAX_VARBINARY_LENGTH = 8000
+
+_INPUT_SIZES = {
+    "bit": (pyodbc.SQL_BIT, 0, 0),
+    "tinyint": (pyodbc.SQL_TINYINT, 0, 0),
+    "smallint": (pyodbc.SQL_SMALLINT, 0, 0),
+    "int": (pyodbc.SQL_INTEGER, 0, 0),
+    "bigint": (pyodbc.SQL_BIGINT, 0, 0),
+    "real": (pyodbc.SQL_REAL, 0, 0),
+    "float": (pyodbc.SQL_DOUBLE, 0, 0),
+    "decimal(38, 10)": (pyodbc.SQL_DECIMAL, 38, 10),
+    "date": (pyodbc.SQL_TYPE_DATE, 10, 0),
+    "time": (pyodbc.SQL_TYPE_TIME, 16, 7),
+    "datetime2": (pyodbc.SQL_TYPE_TIMESTAMP, 27, 7),
+}
+
+
+def write_dataframe(connection: ConnectionInfo, df: DataFrame, table: str, mode: str = APPEND,
+                    chunksize: int = 10000, keys=None) -> int:
+    """Write the rows of a DataFrame to a table, see SQLPythonExecutor.write_dataframe.
+
+    :return: number of rows written
+    """
+    if mode not in WRITE_MODES:
+        raise ValueError("mode {mode} not supported, use one of: {modes}".format(mode=mode,
+                                                                                modes=", ".join(WRITE_MODES)))
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    columns = column_types(df)
+    names = [name for name, _ in columns]
+    if mode == UPSERT:
+        if isinstance(keys, str):
+            keys = [keys]
+        if not keys:
+            raise ValueError("keys are required to upsert")
+        missing = [key for key in keys if key not in names]
+        if missing:
+            raise ValueError("keys not in the DataFrame columns: " + ", ".join(missing))
+    elif keys:
+        raise ValueError("keys can only be used to upsert")
+
+    rows = dataframe_rows(df)
+    sizes = input_sizes(df, columns)
+
+    with SQLQueryExecutor(connection) as executor:
+        with executor.transaction():
+            executor.execute(CreateTableBuilder(table, columns, replace=mode == REPLACE))
+            if mode == UPSERT:
+                executor.execute(CreateStagingTableBuilder(columns))
+                executor.execute_many(InsertBuilder(STAGING_TABLE_NAME, names).base_script, rows, sizes, chunksize)
+                executor.execute(MergeBuilder(table, names, keys))
+                executor.execute(DropStagingTableBuilder())
+            else:
+                executor.execute_many(InsertBuilder(table, names).base_script, rows, sizes, chunksize)
+    return len(rows)
+
+
+def input_table_query(df: DataFrame) -> str:
+    """Query selecting the rows of a DataFrame loaded with upload_input_dataframe, in the order of its columns."""
+    if len(df.columns) == 0:
+        raise ValueError("input_df must have at least one column")
+    return "SELECT {columns} FROM {table}".format(
+        columns=", ".join(quote_name(name) for name, _ in column_types(df)), table=INPUT_TABLE_NAME)
+
+
+def upload_input_dataframe(executor: SQLQueryExecutor, df: DataFrame, chunksize: int = 10000) -> int:
+    """Load the rows of a DataFrame into the session temp table read by input_table_query.
+
+    The temp table only exists in the session of the executor, so the query reading it must run on the same
+    SQLQueryExecutor.
+
+    :return: number of rows loaded
+    """
+    columns = column_types(df)
+    rows = dataframe_rows(df)
+    executor.execute(CreateInputTableBuilder(columns))
+    executor.execute_many(InsertBuilder(INPUT_TABLE_NAME, [name for name, _ in columns]).base_script,
+                          rows, input_sizes(df, columns), chunksize)
+    return len(rows)
+
+
+def dataframe_rows(df: DataFrame) -> list:
+    """Rows of a DataFrame as tuples of Python values, with None for missing values (NaN, NaT, NA)."""
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        values = series.tolist()
+        if series.hasnans:
+            values = [None if missing else value for value, missing in zip(values, series.isna().tolist())]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def input_sizes(df: DataFrame, columns: list) -> list:
+    """pyodbc setinputsizes argument for the (name, SQL type) columns of a DataFrame."""
+    sizes = []
+    for name, sql_type in columns:
+        if sql_type in _INPUT_SIZES:
+            sizes.append(_INPUT_SIZES[sql_type])
+        elif sql_type.startswith("nvarchar"):
+            length = _max_length(df[name])
+            sizes.append((pyodbc.SQL_WVARCHAR, length if length <= _MAX_NVARCHAR_LENGTH else 0, 0))
+        elif sql_type.startswith("varbinary"):
+            length = _max_length(df[name])
+            sizes.append((pyodbc.SQL_VARBINARY, length if length <= _MAX_VARBINARY_LENGTH else 0, 0))
+        else:
+            # Let pyodbc describe the parameter from the values
+            sizes.append(None)
+    return sizes
+
+
+# Column size of the longest value: bytes for binary values, UTF-16 code units for strings (characters outside the
+# BMP take two)
+def _max_length(series) -> int:
+    values = series.dropna()
+    if len(values) == 0:
+        return 1
+    return max(1, int(values.map(_value_length).max()))
+
+
+def _value_length(value) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(str(value).encode("utf-16-le")) // 2
+
+
+class CreateTableBuilder(SQLBuilder):
+
+    def __init__(self, table: str, columns: list, replace: bool = False):
+        """Create a table unless it exists.
+
+        :param table: table name, optionally schema qualified
+        :param columns: (name, SQL type) pairs
+        :param replace: drop the table first if it exists
+        """
+        self._table = table
+        self._columns = columns
+        self._replace = replace
+
+    @property
+    def base_script(self) -> str:
+        drop = "IF OBJECT_ID(?, N'U') IS NOT NULL DROP TABLE {table};\n".format(
+            table=quote_table_name(self._table)) if self._replace else ""
+        return """
+{drop}IF OBJECT_ID(?, N'U') IS NULL
+    CREATE TABLE {table} ({columns});
+""".format(drop=drop, table=quote_table_name(self._table), columns=column_declarations(self._columns))
+
+    @property
+    def params(self):
+        return (self._table, self._table) if self._replace else self._table
+
+
+class CreateStagingTableBuilder(SQLBuilder):
+
+    def __init__(self, columns: list):
+        """(Re)create the session temp table the rows to upsert are loaded into, with (name, SQL type) columns.
+
+        The columns are declared like those of the input table rather than copied from the target table, since
+        SELECT ... INTO would also copy an IDENTITY property and reject the explicit key values. Strings use the
+        collation of the database instead of the one of tempdb, so they can be compared to the target table.
+        """
+        self._columns = [(name, sql_type + " COLLATE DATABASE_DEFAULT" if sql_type.startswith("nvarchar") else sql_type)
+                         for name, sql_type in columns]
+
+    @property
+    def base_script(self) -> str:
+        return """
+IF OBJECT_ID(N'tempdb..{staging}') IS NOT NULL DROP TABLE {staging};
+CREATE TABLE {staging} ({columns});
+""".format(staging=STAGING_TABLE_NAME, columns=column_declarations(self._columns))
+
+
+class CreateInputTableBuilder(SQLBuilder):
+
+    def __init__(self, columns: list):
+        """(Re)create the session temp table holding an input DataFrame, with (name, SQL type) columns."""
+        self._columns = columns
+
+    @property
+    def base_script(self) -> str:
+        return """
+IF OBJECT_ID(N'tempdb..{table}') IS NOT NULL DROP TABLE {table};
+CREATE TABLE {table} ({columns});
+""".format(table=INPUT_TABLE_NAME, columns=column_declarations(self._columns))
+
+
+class DropInputTableBuilder(SQLBuilder):
+
+    @property
+    def base_script(self) -> str:
+        return "IF OBJECT_ID(N'tempdb..{table}') IS NOT NULL DROP TABLE {table};".format(table=INPUT_TABLE_NAME)
+
+
+class DropStagingTableBuilder(SQLBuilder):
+
+    @property
+    def base_script(self) -> str:
+        return "DROP TABLE {staging};".format(staging=STAGING_TABLE_NAME)
+
+
+class InsertBuilder(SQLBuilder):
+
+    def __init__(self, table: str, column_names: list):
+        """Parameterized INSERT of one row; the rows are bound with SQLQueryExecutor.execute_many."""
+        self._table = table
+        self._column_names = column_names
+
+    @property
+    def base_script(self) -> str:
+        return "INSERT INTO {table} ({columns}) VALUES ({markers})".format(
+            table=quote_table_name(self._table),
+            columns=", ".join(quote_name(name) for name in self._column_names),
+            markers=", ".join("?" for _ in self._column_names))
+
+
+class MergeBuilder(SQLBuilder):
+
+    def __init__(self, table: str, column_names: list, keys: list):
+        """MERGE the staging table into table, matching rows on keys."""
+        self._table = table
+        self._column_names = column_names
+        self._keys = keys
+
+    @property
+    def base_script(self) -> str:
+        on = " AND ".join("target.{key} = source.{key}".format(key=quote_name(key)) for key in self._keys)
+        updates = [name for name in self._column_names if name not in self._keys]
+        when_matched = ""
+        if updates:
+            when_matched = "WHEN MATCHED THEN UPDATE SET {assignments}\n".format(
+                assignments=", ".join("target.{name} = source.{name}".format(name=quote_name(name))
+                                      for name in updates))
+        # New rows keep their key values, also when a key is the IDENTITY column of the table
+        return """
+DECLARE @identity_insert BIT = CASE WHEN EXISTS (
+    SELECT 1 FROM sys.identity_columns WHERE object_id = OBJECT_ID(?) AND name IN ({names})) THEN 1 ELSE 0 END;
+IF @identity_insert = 1 SET IDENTITY_INSERT {table} ON;
+MERGE {table} WITH (HOLDLOCK) AS target
+USING {staging} AS source
+ON {on}
+{when_matched}WHEN NOT MATCHED BY TARGET THEN INSERT ({columns}) VALUES ({values});
+IF @identity_insert = 1 SET IDENTITY_INSERT {table} OFF;
+""".format(table=quote_table_name(self._table),
+           names=", ".join("?" for _ in self._column_names),
+           staging=STAGING_TABLE_NAME,
+           on=on,
+           when_matched=when_matched,
+           columns=", ".join(quote_name(name) for name in self._column_names),
+           values=", ".join("source." + quote_name(name) for name in self._column_names))
+
+    @property
+    def params(self):
+        return (self._table,) + tuple(self._column_names)
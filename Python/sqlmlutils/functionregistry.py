@@ -0,0 +1,226 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import dill
+import hashlib
+
+from typing import Callable
+
+from .sqlbuilder import SQLBuilder, SpeesBuilder, SpeesBuilderFromFunction, get_function_text
+from .sqlbuilder import RETURN_COLUMN_NAME, _COMPRESS_RESULT_TEXT
+from .outputcapture import as_output_capture
+from .serialization import AUTO, AUTO_COMPRESSION_THRESHOLD, check_compression
+
+"""Server side registry of Python functions.
+
+register_function stores the source of a function, along with the pickled values of the variables it closes over,
+in a table managed by sqlmlutils, keyed by a hash of that content. Invoking the returned handle only sends the hash
+and the pickled arguments: the SPEES query reads the function from the table in T-SQL and passes it to a small,
+constant loader script.
+"""
+
+FUNCTION_TABLE_NAME = "dbo.sqlmlutils_functions"
+
+
+def function_hash(function_name: str, function_text: str, closure_dill: bytes) -> str:
+    """Content hash identifying a registered function."""
+    sha = hashlib.sha256()
+    sha.update(function_name.encode("utf-8"))
+    sha.update(b"\0")
+    sha.update(function_text.encode("utf-8"))
+    sha.update(b"\0")
+    sha.update(closure_dill)
+    return sha.hexdigest()
+
+
+def closure_values(func: Callable) -> dict:
+    """Values of the free variables of func, which the function source alone does not carry."""
+    cells = func.__closure__ or ()
+    return {name: cell.cell_contents for name, cell in zip(func.__code__.co_freevars, cells)}
+
+
+class RegisteredFunction:
+    """Handle to a function registered on the server with SQLPythonExecutor.register_function.
+
+    Calling the handle executes the function in SQL Server, like execute_function_in_sql.
+    """
+
+    def __init__(self, executor, func_hash: str, name: str):
+        self._executor = executor
+        self._hash = func_hash
+        self._name = name
+
+    @property
+    def hash(self):
+        return self._hash
+
+    @property
+    def name(self):
+        return self._name
+
+    def __call__(self, *args, input_data_query: str = "", compression: str = AUTO, **kwargs):
+        return self._executor.execute_registered_function(self, *args,
+                                                          input_data_query=input_data_query,
+                                                          compression=compression,
+                                                          **kwargs)
+
+    def __repr__(self):
+        return "RegisteredFunction(name={name}, hash={hash})".format(name=self._name, hash=self._hash)
+
+
+class RegisterFunctionBuilder(SQLBuilder):
+
+    def __init__(self, func: Callable):
+        """Build the query storing func in the function table (created if needed).
+
+        :param func: function to register
+        """
+        self._name = func.__name__
+        self._function_text = get_function_text(func)
+        dill.settings['recurse'] = True
+        self._closure_dill = dill.dumps(closure_values(func))
+        self._hash = function_hash(self._name, self._function_text, self._closure_dill)
+
+    @property
+    def hash(self):
+        return self._hash
+
+    @property
+    def base_script(self) -> str:
+        return """
+SET NOCOUNT ON;
+IF OBJECT_ID(N'{table}', N'U') IS NULL
+    CREATE TABLE {table} (
+        func_hash char(64) NOT NULL PRIMARY KEY,
+        function_name nvarchar(256) NOT NULL,
+        function_text nvarchar(MAX) NOT NULL,
+        closure_dill varbinary(MAX) NOT NULL,
+        created_at datetime2 NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+
+IF NOT EXISTS (SELECT 1 FROM {table} WHERE func_hash = ?)
+BEGIN
+    BEGIN TRY
+        INSERT INTO {table} (func_hash, function_name, function_text, closure_dill) VALUES (?, ?, ?, ?);
+    END TRY
+    BEGIN CATCH
+        -- Registered concurrently by another session
+        IF ERROR_NUMBER() <> 2627
+            THROW;
+    END CATCH
+END
+""".format(table=FUNCTION_TABLE_NAME)
+
+    @property
+    def params(self):
+        return self._hash, self._hash, self._name, self._function_text, self._closure_dill
+
+
+class UnregisterFunctionBuilder(SQLBuilder):
+
+    def __init__(self, func_hash: str):
+        self._hash = func_hash
+
+    @property
+    def base_script(self) -> str:
+        return """
+IF OBJECT_ID(N'{table}', N'U') IS NOT NULL
+    DELETE FROM {table} WHERE func_hash = ?
+""".format(table=FUNCTION_TABLE_NAME)
+
+    @property
+    def params(self):
+        return self._hash
+
+
+class SpeesBuilderFromRegisteredFunction(SpeesBuilder):
+
+    """Generate SPEES queries calling a registered function.
+
+    The function is read from the function table into T-SQL variables which are passed to the script as
+    parameters, so the query text and the script are the same for every call of every registered function.
+    """
+
+    _SCRIPT_PARAMETERS = [("function_name", "nvarchar(256)", "@function_name"),
+                          ("function_text", "nvarchar(MAX)", "@function_text"),
+                          ("closure_dill", "varbinary(MAX)", "@closure_dill")] + \
+        SpeesBuilderFromFunction._SCRIPT_PARAMETERS
+
+    def __init__(self, func_hash: str, language_name: str, input_data_query: str = "", *args,
+                 compression: str = AUTO, rows_per_read: int = None, parallel: bool = False,
+                 partition_by=None, order_by=None, output_capture=None, **kwargs):
+        """Instantiate a SpeesBuilderFromRegisteredFunction object.
+
+        :param func_hash: hash of the registered function
+        :param language_name: name of the language to be executed in sp_execute_external_script, if using EXTERNAL LANGUAGE
+        :param input_data_query: query text for @input_data_1 parameter
+        :param args: positional arguments to function call in SPEES
+        :param compression: codec used to compress the returned value, see SpeesBuilderFromFunction
+        :param rows_per_read: stream the input data to the function in batches of this many rows
+        :param parallel: let SQL Server run the function in parallel over partitions of the input data
+        :param partition_by: column(s) of the input data to partition on; the function runs once per partition
+        :param order_by: column(s) ordering the rows of each partition
+        :param output_capture: OutputCapture limiting or disabling the capture of stdout and stderr
+        :param kwargs: keyword arguments to function call in SPEES
+        """
+        check_compression(compression)
+        if as_output_capture(output_capture).stream:
+            raise ValueError("Registered functions cannot stream their output")
+        self._hash = func_hash
+        with_inputdf = input_data_query != ""
+        self._args_dill, self._pos_args_dill = SpeesBuilderFromFunction._serialize_arguments(*args, **kwargs)
+        super().__init__(script=self._build_loader_script(with_inputdf, compression),
+                         with_results_text=SpeesBuilderFromFunction._WITH_RESULTS_TEXT,
+                         input_data_query=input_data_query,
+                         language_name=language_name,
+                         script_parameters=self._SCRIPT_PARAMETERS,
+                         rows_per_read=rows_per_read,
+                         parallel=parallel,
+                         partition_by=partition_by,
+                         order_by=order_by,
+                         output_capture=output_capture)
+
+    @property
+    def base_script(self):
+        return """
+SET NOCOUNT ON;
+DECLARE @function_name nvarchar(256), @function_text nvarchar(MAX), @closure_dill varbinary(MAX);
+IF OBJECT_ID(N'{table}', N'U') IS NOT NULL
+    SELECT @function_name = function_name, @function_text = function_text, @closure_dill = closure_dill
+    FROM {table} WHERE func_hash = ?;
+IF @function_text IS NULL
+    THROW 50000, N'Function is not registered, call register_function again.', 1;
+{spees}""".format(table=FUNCTION_TABLE_NAME, spees=super().base_script)
+
+    @property
+    def params(self):
+        return self._hash, self._script, self._input_data_query, self._args_dill, self._pos_args_dill
+
+    @staticmethod
+    def _build_loader_script(with_inputdf: bool, compression: str):
+        return """
+import dill
+
+# define the registered function next to the variables it closes over
+_namespace = dict(globals())
+_namespace.update(dill.loads(closure_dill))
+exec(function_text, _namespace)
+func = _namespace[function_name]
+
+args = dill.loads(args_dill)
+pos_args = dill.loads(pos_args_dill)
+
+# call user function with serialized arguments
+{returncol} = func{func_arguments}
+
+{compress_text}
+
+# serialize results of user function and put in DataFrame for return through SQL Satellite channel
+OutputDataSet["{returncol}"] = [_compress_result(dill.dumps({returncol}), {compression!r}, {threshold})]
+""".format(
+    returncol=RETURN_COLUMN_NAME,
+    func_arguments=SpeesBuilderFromFunction._func_arguments(with_inputdf),
+    compress_text=_COMPRESS_RESULT_TEXT,
+    compression=compression,
+    threshold=AUTO_COMPRESSION_THRESHOLD
+)
@@ -0,0 +1,235 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import functools
+import logging
+import math
+import threading
+import time
+import warnings
+
+from collections import defaultdict, deque
+
+"""Per-call timing and payload events.
+
+Every public sqlmlutils call (execute_function_in_sql, execute_sql_query, execute_sproc...) is recorded as one
+CallEvent: its total duration, the time spent in each phase (connect, build, execute, fetch, deserialize), the bytes of
+script text and of pickled arguments sent, the bytes of the pickled result and the number of rows fetched.
+Events are passed to the listeners registered with add_listener, on the thread that made the call.
+Nothing is recorded while no listener is registered.
+
+>>> from sqlmlutils import instrumentation
+>>> stats = instrumentation.LatencyAggregator()
+>>> instrumentation.add_listener(stats)
+>>> instrumentation.add_listener(instrumentation.SlowCallLogger(threshold=5.0))
+>>> ...
+>>> stats.summary()
+{'execute_function_in_sql': {'count': 12, 'p50': 0.41, 'p95': 0.93, 'max': 1.2}}
+"""
+
+CONNECT = "connect"
+BUILD = "build"
+EXECUTE = "execute"
+FETCH = "fetch"
+DESERIALIZE = "deserialize"
+
+_listeners = []
+_listeners_lock = threading.Lock()
+_local = threading.local()
+
+
+class CallEvent:
+    """Measurements of one sqlmlutils call."""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.builder = None
+        self.start_time = time.time()
+        self.duration = 0.0
+        self.phases = {}
+        self.script_bytes = 0
+        self.argument_bytes = 0
+        self.result_bytes = 0
+        self.rows = 0
+        self.error = None
+
+    def __repr__(self):
+        return ("CallEvent(operation={operation}, builder={builder}, duration={duration:.6f}, phases={phases}, "
+                "script_bytes={script_bytes}, argument_bytes={argument_bytes}, result_bytes={result_bytes}, "
+                "rows={rows}, error={error!r})").format(**self.__dict__)
+
+
+def add_listener(listener):
+    """Register a callable receiving the CallEvent of every call."""
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Unregister a listener added with add_listener."""
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+class _Call:
+
+    def __init__(self, operation: str):
+        self._event = CallEvent(operation)
+
+    def __enter__(self):
+        _local.event = self._event
+        self._start = time.perf_counter()
+        return self._event
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self._event.duration = time.perf_counter() - self._start
+        self._event.error = exception_value
+        _local.event = None
+        _emit(self._event)
+
+
+class _Phase:
+
+    def __init__(self, event: CallEvent, name: str):
+        self._event = event
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self._event
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        elapsed = time.perf_counter() - self._start
+        self._event.phases[self._name] = self._event.phases.get(self._name, 0.0) + elapsed
+
+
+class _NoCall:
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        pass
+
+
+_NO_CALL = _NoCall()
+
+
+def call(operation: str):
+    """Context manager recording a call. Calls made inside another call are part of the outer call."""
+    if not _listeners or getattr(_local, "event", None) is not None:
+        return _NO_CALL
+    return _Call(operation)
+
+
+def phase(name: str):
+    """Context manager adding the time spent in the block to a phase of the current call."""
+    event = getattr(_local, "event", None)
+    if event is None:
+        return _NO_CALL
+    return _Phase(event, name)
+
+
+def record(builder=None, script_bytes: int = 0, argument_bytes: int = 0, result_bytes: int = 0, rows: int = 0):
+    """Add measurements to the current call, if any."""
+    event = getattr(_local, "event", None)
+    if event is None:
+        return
+    if builder is not None and event.builder is None:
+        event.builder = builder
+    event.script_bytes += script_bytes
+    event.argument_bytes += argument_bytes
+    event.result_bytes += result_bytes
+    event.rows += rows
+
+
+def record_params(params):
+    """Add the size of query parameters to the current call: text counts as script, binary as arguments."""
+    if getattr(_local, "event", None) is None or params is None:
+        return
+    if not isinstance(params, (tuple, list)):
+        params = (params,)
+    script_bytes = sum(len(param.encode("utf-8")) for param in params if isinstance(param, str))
+    argument_bytes = sum(len(param) for param in params if isinstance(param, (bytes, bytearray)))
+    record(script_bytes=script_bytes, argument_bytes=argument_bytes)
+
+
+def instrumented(method):
+    """Record every call of a method as an event named after the method."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with call(method.__name__):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def _emit(event: CallEvent):
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception as e:
+            warnings.warn("sqlmlutils instrumentation listener {listener} failed: {error}".format(
+                listener=listener, error=e))
+
+
+class LatencyAggregator:
+    """Listener keeping the durations of the latest calls per operation, in memory."""
+
+    def __init__(self, window: int = 1000):
+        """
+        :param window: number of most recent calls kept per operation
+        """
+        self._window = window
+        self._durations = defaultdict(lambda: deque(maxlen=self._window))
+        self._lock = threading.Lock()
+
+    def __call__(self, event: CallEvent):
+        with self._lock:
+            self._durations[event.operation].append(event.duration)
+
+    def percentile(self, operation: str, q: float) -> float:
+        """q-th percentile (0 to 100) of the durations of an operation, in seconds, or None without calls."""
+        with self._lock:
+            durations = sorted(self._durations.get(operation, ()))
+        return _percentile(durations, q)
+
+    def summary(self) -> dict:
+        """Count, p50, p95 and max duration in seconds of each operation."""
+        with self._lock:
+            items = [(operation, sorted(durations)) for operation, durations in self._durations.items()]
+        return {operation: {"count": len(durations),
+                            "p50": _percentile(durations, 50),
+                            "p95": _percentile(durations, 95),
+                            "max": durations[-1] if durations else None}
+                for operation, durations in items}
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+
+
+class SlowCallLogger:
+    """Listener logging a warning for every call slower than a threshold."""
+
+    def __init__(self, threshold: float = 1.0, logger: logging.Logger = None):
+        """
+        :param threshold: duration in seconds from which a call is logged
+        :param logger: logger to write to, defaults to the sqlmlutils.instrumentation logger
+        """
+        self._threshold = threshold
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+
+    def __call__(self, event: CallEvent):
+        if event.duration >= self._threshold:
+            self._logger.warning("Slow sqlmlutils call: %r", event)
+
+
+def _percentile(sorted_values: list, q: float):
+    if not sorted_values:
+        return None
+    # Nearest rank
+    rank = max(1, int(math.ceil(q / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
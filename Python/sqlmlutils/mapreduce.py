@@ -0,0 +1,121 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import datetime
+import decimal
+import sys
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Callable
+
+from .sqltypes import quote_name, quote_table_name
+
+"""Splitting a table into key ranges for SQLPythonExecutor.map_reduce_in_sql.
+
+The split points are the largest key of each NTILE of the table ordered by the key column, so each range holds about
+the same number of rows. Every range becomes the input_data_query of its own execute_function_in_sql call, which runs
+on its own pooled connection; a range whose call fails is run again on its own, without redoing the others.
+"""
+
+
+def split_points_query(table: str, key_column: str, splits: int) -> str:
+    """Query returning the upper bound of each of the splits ranges of the key column, in ascending order."""
+    return """
+SELECT MAX({key}) AS upper_bound
+FROM (SELECT {key}, NTILE({splits}) OVER (ORDER BY {key}) AS tile FROM {table}) AS tiles
+GROUP BY tile
+ORDER BY tile
+""".format(key=quote_name(key_column), splits=splits, table=quote_table_name(table))
+
+
+def range_queries(table: str, key_column: str, upper_bounds: list, columns=None) -> list:
+    """One query per key range of the table.
+
+    The first range also holds the rows with a NULL key and the last range has no upper bound, so every row of the
+    table is in exactly one range.
+
+    :param upper_bounds: upper bounds of the ranges, in ascending order (see split_points_query)
+    :param columns: column name or list of column names to select, None for all columns
+    """
+    if columns is None:
+        select_list = "*"
+    else:
+        select_list = ", ".join(quote_name(column) for column in ([columns] if isinstance(columns, str) else columns))
+    key = quote_name(key_column)
+    bounds = []
+    for bound in upper_bounds:
+        if bound is not None and (not bounds or sql_literal(bound) != bounds[-1]):
+            bounds.append(sql_literal(bound))
+
+    if len(bounds) < 2:
+        conditions = [None]
+    else:
+        conditions = ["{key} <= {upper} OR {key} IS NULL".format(key=key, upper=bounds[0])]
+        conditions += ["{key} > {lower} AND {key} <= {upper}".format(key=key, lower=lower, upper=upper)
+                       for lower, upper in zip(bounds[:-2], bounds[1:-1])]
+        conditions.append("{key} > {lower}".format(key=key, lower=bounds[-2]))
+
+    return ["SELECT {select_list} FROM {table}{where}".format(
+        select_list=select_list, table=quote_table_name(table),
+        where="" if condition is None else " WHERE " + condition) for condition in conditions]
+
+
+def sql_literal(value) -> str:
+    """T-SQL literal for a key value read back from the server."""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (datetime.datetime, datetime.time)):
+        return "'" + _time_text(value) + "'"
+    if isinstance(value, datetime.date):
+        return "'" + value.isoformat() + "'"
+    if isinstance(value, uuid.UUID):
+        return "'" + str(value) + "'"
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, str):
+        return "N'" + value.replace("'", "''") + "'"
+    raise ValueError("Key values of type {type} cannot be used as split points".format(type=type(value).__name__))
+
+
+# datetime literals take at most 3 fractional digits, so values read from datetime columns (whole milliseconds) are
+# written with milliseconds; only datetime2 and time values, which accept 7 digits, can have more.
+def _time_text(value) -> str:
+    if value.microsecond % 1000 or value.tzinfo is not None:
+        return value.isoformat()
+    text = value.replace(microsecond=0).isoformat()
+    return text + ".{millisecond:03d}".format(millisecond=value.microsecond // 1000) if value.microsecond else text
+
+
+def run_ranges(call: Callable, queries: list, max_workers: int, retries: int) -> list:
+    """Call call(query) for every query on max_workers threads, retrying each failed query up to retries times.
+
+    :return: the values returned for each query, in the order of queries
+    :raises: the last exception of a query that still fails after its retries; the queries not started yet are
+    cancelled
+    """
+    results = [None] * len(queries)
+    attempts = [0] * len(queries)
+    with ThreadPoolExecutor(max_workers) as workers:
+        pending = {workers.submit(call, query): index for index, query in enumerate(queries)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_EXCEPTION)
+            for future in done:
+                index = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    results[index] = future.result()
+                elif attempts[index] < retries:
+                    attempts[index] += 1
+                    print("Range {index} failed, retrying ({attempt}/{retries}): {error}".format(
+                        index=index, attempt=attempts[index], retries=retries, error=error), file=sys.stderr)
+                    pending[workers.submit(call, queries[index])] = index
+                else:
+                    for other in pending:
+                        other.cancel()
+                    raise error
+    return results
@@ -0,0 +1,241 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Capture of the stdout and stderr of code executed in SQL Server.
+
+By default everything the remote code prints is collected in memory on the server and returned to the client as one
+string per stream. OutputCapture bounds that buffer (keeping the first and the last characters printed), turns
+capture off, or returns the output as a separate result set of log lines that the client prints while it fetches them.
+"""
+
+LOG_STREAM_COLUMN_NAME = "_stream_"
+LOG_LINE_COLUMN_NAME = "_line_"
+
+LOG_WITH_RESULTS_TEXT = "with result sets(({stream} varchar(6), {line} nvarchar(MAX)));".format(
+    stream=LOG_STREAM_COLUMN_NAME, line=LOG_LINE_COLUMN_NAME)
+
+# Writers used on the server instead of an unbounded StringIO. This text is also embedded in stored procedure
+# definitions, so it must not contain single quotes.
+_CAPTURE_CLASSES_TEXT = """
+import collections
+import io
+
+
+class _BoundedText(io.TextIOBase):
+    # Keeps the first and the last characters written, max_chars in total
+
+    def __init__(self, max_chars):
+        self._head_limit = max_chars // 2
+        self._tail_limit = max_chars - self._head_limit
+        self._head = []
+        self._head_size = 0
+        self._tail = collections.deque()
+        self._tail_size = 0
+        self._omitted = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        length = len(text)
+        if self._head_size < self._head_limit:
+            head = text[:self._head_limit - self._head_size]
+            self._head.append(head)
+            self._head_size += len(head)
+            text = text[len(head):]
+        if text:
+            self._tail.append(text)
+            self._tail_size += len(text)
+            while self._tail_size > self._tail_limit:
+                extra = self._tail_size - self._tail_limit
+                first = self._tail[0]
+                if len(first) <= extra:
+                    self._tail.popleft()
+                    self._tail_size -= len(first)
+                    self._omitted += len(first)
+                else:
+                    self._tail[0] = first[extra:]
+                    self._tail_size -= extra
+                    self._omitted += extra
+        return length
+
+    def getvalue(self):
+        omitted = "\\n... {} characters omitted ...\\n".format(self._omitted) if self._omitted else ""
+        return "".join(self._head) + omitted + "".join(self._tail)
+
+
+class _NullText(io.TextIOBase):
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return len(text)
+
+    def getvalue(self):
+        return None
+
+
+class _LogLines:
+    # Lines printed to stdout and stderr, in order; the first and the last lines are kept within max_chars
+
+    def __init__(self, max_chars):
+        self._max_chars = max_chars
+        self._head = []
+        self._head_size = 0
+        self._head_full = False
+        self._tail = collections.deque()
+        self._tail_size = 0
+        self._omitted = 0
+
+    def add(self, stream, line):
+        if self._max_chars is None:
+            self._head.append((stream, line))
+            return
+        if not self._head_full and self._head_size + len(line) <= self._max_chars // 2:
+            self._head.append((stream, line))
+            self._head_size += len(line)
+            return
+        self._head_full = True
+        self._tail.append((stream, line))
+        self._tail_size += len(line)
+        while self._tail and self._tail_size > self._max_chars - self._max_chars // 2:
+            _, dropped = self._tail.popleft()
+            self._tail_size -= len(dropped)
+            self._omitted += 1
+
+    def dataframe(self):
+        from pandas import DataFrame
+        lines = list(self._head)
+        if self._omitted:
+            lines.append(("stdout", "... {} lines omitted ...".format(self._omitted)))
+        lines.extend(self._tail)
+        return DataFrame(lines, columns=["{stream}", "{line}"])
+
+
+class _LineWriter(io.TextIOBase):
+
+    def __init__(self, lines, stream):
+        self._lines = lines
+        self._stream = stream
+        self._partial = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        parts = (self._partial + text).split("\\n")
+        self._partial = parts.pop()
+        for line in parts:
+            self._lines.add(self._stream, line)
+        return len(text)
+
+    def end(self):
+        if self._partial:
+            self._lines.add(self._stream, self._partial)
+            self._partial = ""
+""".replace("{stream}", LOG_STREAM_COLUMN_NAME).replace("{line}", LOG_LINE_COLUMN_NAME)
+
+
+class OutputCapture:
+    """How the stdout and stderr of remote code are returned to the client."""
+
+    def __init__(self, max_chars: int = None, enabled: bool = True, stream: bool = False):
+        """
+        :param max_chars: maximum number of characters kept per stream (or in total, with stream=True). The first
+        and the last characters printed are kept, with a note of how much was omitted in between. None for no limit.
+        :param enabled: False to discard everything the remote code prints
+        :param stream: return the output as a separate result set with one row per line, printed by the client
+        while the rows are fetched, instead of as one string per stream
+
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>> from sqlmlutils.outputcapture import OutputCapture
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> sqlpy.execute_function_in_sql(train, output_capture=OutputCapture(max_chars=100000))
+        """
+        if max_chars is not None and (not isinstance(max_chars, int) or max_chars < 2):
+            raise ValueError("max_chars must be an integer of at least 2")
+        if stream and not enabled:
+            raise ValueError("stream cannot be used when capture is disabled")
+        self._max_chars = max_chars
+        self._enabled = enabled
+        self._stream = stream
+
+    @property
+    def max_chars(self) -> int:
+        return self._max_chars
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @property
+    def stream(self) -> bool:
+        return self._stream
+
+    @property
+    def is_default(self) -> bool:
+        return self._enabled and not self._stream and self._max_chars is None
+
+    def setup_text(self) -> str:
+        """Python code redirecting sys.stdout and sys.stderr to the _temp_out and _temp_err writers."""
+        if self.is_default:
+            return """
+import sys
+from io import StringIO
+
+_temp_out = StringIO()
+_temp_err = StringIO()
+
+sys.stdout = _temp_out
+sys.stderr = _temp_err
+"""
+        if self._stream:
+            writers = """
+_log_lines = _LogLines({max_chars})
+_temp_out = _LineWriter(_log_lines, "stdout")
+_temp_err = _LineWriter(_log_lines, "stderr")
+""".format(max_chars=self._max_chars)
+        elif not self._enabled:
+            writers = """
+_temp_out = _NullText()
+_temp_err = _NullText()
+"""
+        else:
+            writers = """
+_temp_out = _BoundedText({max_chars})
+_temp_err = _BoundedText({max_chars})
+""".format(max_chars=self._max_chars)
+        return """
+import sys
+{classes}
+{writers}
+sys.stdout = _temp_out
+sys.stderr = _temp_err
+""".format(classes=_CAPTURE_CLASSES_TEXT, writers=writers)
+
+    @staticmethod
+    def log_lines_text() -> str:
+        """Python code replacing OutputDataSet with the log lines, with stream=True."""
+        return """
+_temp_out.end()
+_temp_err.end()
+OutputDataSet = _log_lines.dataframe()
+"""
+
+
+def as_output_capture(output_capture) -> OutputCapture:
+    """OutputCapture for an output_capture argument: an OutputCapture, None for the default or False to disable."""
+    if output_capture is None or output_capture is True:
+        return OutputCapture()
+    if output_capture is False:
+        return OutputCapture(enabled=False)
+    if not isinstance(output_capture, OutputCapture):
+        raise ValueError("output_capture must be an OutputCapture, None or False")
+    return output_capture
+
+
+def is_log_result_set(column_names: list) -> bool:
+    """Whether a result set holds the log lines returned with OutputCapture(stream=True)."""
+    return column_names == [LOG_STREAM_COLUMN_NAME, LOG_LINE_COLUMN_NAME]
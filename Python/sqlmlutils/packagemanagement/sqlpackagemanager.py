@@ -6,7 +6,9 @@ import tempfile
 import warnings
 import zipfile
 
-from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+from pandas import notna
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor, instrumentation, querycache
 from sqlmlutils.packagemanagement import messages, servermethods
 from sqlmlutils.packagemanagement.dependencyresolver import DependencyResolver
 from sqlmlutils.packagemanagement.packagesqlbuilder import CreateLibraryBuilder, CheckLibraryBuilder, \
@@ -29,6 +31,7 @@ class SQLPackageManager:
         self._pyexecutor = SQLPythonExecutor(connection_info, language_name=language_name)
         self._language_name = language_name
 
+    @instrumentation.instrumented
     def install(self,
                 package: str,
                 upgrade: bool = False,
@@ -72,11 +75,15 @@ class SQLPackageManager:
         if scope is None:
             scope = self._get_default_scope()
         
-        if os.path.isfile(package):
-            self._install_from_file(package, scope, upgrade, out_file=out_file)
-        else:
-            self._install_from_pypi(package, upgrade, version, install_dependencies, scope, out_file=out_file)
-
+        try:
+            if os.path.isfile(package):
+                self._install_from_file(package, scope, upgrade, out_file=out_file)
+            else:
+                self._install_from_pypi(package, upgrade, version, install_dependencies, scope, out_file=out_file)
+        finally:
+            querycache.invalidate(self._connection_info, querycache.PACKAGE_TAG)
+
+    @instrumentation.instrumented
     def uninstall(self, 
                 package_name: str, 
                 scope: Scope = None,
@@ -95,8 +102,12 @@ class SQLPackageManager:
             scope = self._get_default_scope()
             
         print("Uninstalling {package_name} only, not dependencies".format(package_name=package_name))
-        self._drop_sql_package(package_name, scope, out_file)
+        try:
+            self._drop_sql_package(package_name, scope, out_file)
+        finally:
+            querycache.invalidate(self._connection_info, querycache.PACKAGE_TAG)
 
+    @instrumentation.instrumented
     def list(self):
         """List packages installed on server, similar to output of pip freeze.
 
@@ -106,8 +117,9 @@ class SQLPackageManager:
 
     def _get_default_scope(self):
         query = "SELECT IS_SRVROLEMEMBER ('sysadmin') as is_sysadmin"
-        is_sysadmin = self._pyexecutor.execute_sql_query(query)["is_sysadmin"].iloc[0]
-        return Scope.public_scope() if is_sysadmin == 1 else Scope.private_scope()
+        df = self._pyexecutor._execute_sql_query(query, cache=querycache.cache_metadata())
+        is_sysadmin = df["is_sysadmin"].iloc[0]
+        return Scope.public_scope() if notna(is_sysadmin) and is_sysadmin == 1 else Scope.private_scope()
         
     def _get_packages_by_user(self, owner='', scope: Scope=Scope.private_scope()):
         scope_num = 1 if scope == Scope.private_scope() else 0
@@ -132,7 +144,8 @@ class SQLPackageManager:
                        ORDER BY elib.name ASC; \
                        GO".format(language_name=self._language_name,
                                   scope_num=scope_num)
-        return self._pyexecutor.execute_sql_query(query, owner)
+        return self._pyexecutor._execute_sql_query(query, owner, cache=querycache.cache_metadata(),
+                                                   tag=querycache.PACKAGE_TAG)
 
     def _drop_sql_package(self, sql_package_name: str, scope: Scope, out_file: str = None):
         builder = DropLibraryBuilder(sql_package_name=sql_package_name, scope=scope, language_name=self._language_name)
@@ -0,0 +1,220 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import re
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable
+
+from pandas import DataFrame
+
+from .connectioninfo import ConnectionInfo
+
+"""Client side cache of query results.
+
+Results are kept per (connection string, normalized query, parameters) for at most ttl seconds, and the least recently
+used entries are evicted once the cache holds more than max_entries results or max_bytes of DataFrame memory.
+
+Nothing is cached unless asked for: SQLPythonExecutor.execute_sql_query(..., cache=True) caches that query, and
+configure_cache(metadata=True) also caches the lookups sqlmlutils makes itself (check_sproc, the package scope and the
+installed packages). Creating or dropping stored procedures, installing or uninstalling packages and write_dataframe
+invalidate the entries they make stale; invalidate() drops entries after changes made outside sqlmlutils.
+
+>>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+>>> from sqlmlutils import querycache
+>>> connection = ConnectionInfo(server="localhost", database="AirlineTestDB")
+>>> querycache.configure_cache(ttl=300, max_entries=100)
+>>> sqlpy = SQLPythonExecutor(connection)
+>>> carriers = sqlpy.execute_sql_query("SELECT * FROM carriers", cache=True)
+>>> querycache.invalidate(connection)
+"""
+
+# Tags of the entries invalidated by sqlmlutils operations
+SPROC_TAG = "sproc"
+PACKAGE_TAG = "package"
+
+# String literals, quoted identifiers and bracketed identifiers, whose whitespace is significant
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[(?:[^\]]|\]\])*\])")
+
+
+class _Entry:
+
+    def __init__(self, df: DataFrame, size: int, expires: float, tag: str):
+        self.df = df
+        self.size = size
+        self.expires = expires
+        self.tag = tag
+
+
+class QueryCache:
+    """A thread safe TTL and LRU cache of query results."""
+
+    def __init__(self, ttl: float = 60, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 metadata: bool = False):
+        """
+        :param ttl: seconds a result is served from the cache
+        :param max_entries: maximum number of results kept
+        :param max_bytes: maximum memory used by the cached DataFrames, None for no limit
+        :param metadata: also cache the lookups made by sqlmlutils itself (check_sproc, drop_sproc and the package
+        manager)
+        """
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._metadata = metadata
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def metadata(self) -> bool:
+        return self._metadata
+
+    @property
+    def size(self) -> int:
+        """Number of cached results."""
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def stats(self) -> dict:
+        """Number of hits, misses, cached results and bytes cached."""
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "entries": len(self._entries), "bytes": self._bytes}
+
+    def get_or_load(self, connection: ConnectionInfo, query: str, params, load: Callable[[], DataFrame],
+                    tag: str = None) -> DataFrame:
+        """Return the cached result of a query, or load, cache and return it.
+
+        :param load: function running the query
+        :param tag: name used to invalidate the entry together with related entries
+        """
+        key = make_key(connection, query, params)
+        if key is None:
+            return load()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                # Callers may modify the returned DataFrame
+                return entry.df.copy()
+            self._misses += 1
+
+        df = load()
+        self._put(key, df, tag)
+        return df.copy()
+
+    def invalidate(self, connection: ConnectionInfo = None, tag: str = None):
+        """Drop cached results.
+
+        :param connection: only drop the results of queries run with this connection
+        :param tag: only drop the results cached with this tag
+        """
+        connection_string = connection.connection_string if connection is not None else None
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if (connection_string is None or key[0] == connection_string)
+                        and (tag is None or entry.tag == tag)]:
+                self._remove(key)
+
+    def clear(self):
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put(self, key, df: DataFrame, tag: str):
+        size = int(df.memory_usage(deep=True).sum())
+        if self._max_bytes is not None and size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(df.copy(), size, time.monotonic() + self._ttl, tag)
+            self._bytes += size
+            while len(self._entries) > self._max_entries or \
+                    (self._max_bytes is not None and self._bytes > self._max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    # Must be called with the lock held.
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+def normalize_query(query: str) -> str:
+    """Query text with runs of whitespace outside of quotes collapsed to one space."""
+    parts = _QUOTED.split(query)
+    # split keeps the quoted parts at odd indices
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts)).strip()
+
+
+def make_key(connection: ConnectionInfo, query: str, params):
+    """Cache key of a query, or None if its parameters cannot be used as a key."""
+    if params is None:
+        params = ()
+    elif not isinstance(params, (tuple, list)):
+        params = (params,)
+    params = tuple(bytes(param) if isinstance(param, bytearray) else param for param in params)
+    key = (connection.connection_string, normalize_query(query), params)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> QueryCache:
+    """Get the cache used by execute_sql_query(..., cache=True), creating one with default settings if needed."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+        return _cache
+
+
+def configure_cache(metadata: bool = False, **kwargs) -> QueryCache:
+    """Replace the cache with one using the given settings.
+
+    :param metadata: also cache the lookups made by sqlmlutils itself
+    :param kwargs: QueryCache settings (ttl, max_entries, max_bytes)
+    :return: the new QueryCache
+    """
+    global _cache
+    cache = QueryCache(metadata=metadata, **kwargs)
+    with _cache_lock:
+        _cache = cache
+    return cache
+
+
+def cache_metadata() -> bool:
+    """Whether the lookups made by sqlmlutils itself are cached."""
+    with _cache_lock:
+        return _cache is not None and _cache.metadata
+
+
+def invalidate(connection: ConnectionInfo = None, tag: str = None):
+    """Drop cached results, see QueryCache.invalidate."""
+    with _cache_lock:
+        cache = _cache
+    if cache is not None:
+        cache.invalidate(connection, tag)
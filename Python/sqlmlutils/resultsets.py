@@ -0,0 +1,229 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import pyodbc
+
+from pandas import DataFrame
+
+from .connectioninfo import ConnectionInfo
+from .dataframebuilder import build_dataframe
+from .sqlbuilder import STDOUT_COLUMN_NAME
+from .sqlqueryexecutor import SQLQueryExecutor
+
+"""Every result set of a batch or stored procedure, read on demand.
+
+The batch runs once, when ResultSets is created; its result sets are then read from the same cursor in order. A
+result set is only fetched when it is touched: fetch() turns it into a DataFrame, iter_chunks() streams it. Result
+sets that are skipped over to reach a later one are fetched and kept, so they can still be read afterwards.
+"""
+
+
+class ResultSet:
+    """One result set of a ResultSets sequence."""
+
+    _PENDING = "pending"
+    _STREAMING = "streaming"
+    _FETCHED = "fetched"
+    _SKIPPED = "skipped"
+
+    def __init__(self, result_sets: "ResultSets", index: int, description):
+        self._result_sets = result_sets
+        self._index = index
+        self._description = description
+        self._state = self._PENDING
+        self._df = None
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def columns(self) -> list:
+        return [element[0] for element in self._description]
+
+    def fetch(self) -> DataFrame:
+        """All the rows of the result set, as a DataFrame."""
+        if self._state == self._PENDING:
+            self._result_sets._seek(self)
+            self._df = build_dataframe(self._description, self._result_sets._fetch(None))
+            self._state = self._FETCHED
+        elif self._state != self._FETCHED:
+            raise RuntimeError("Result set {index} was streamed with iter_chunks and cannot be fetched".format(
+                index=self._index))
+        return self._df
+
+    def iter_chunks(self, chunksize: int = 10000):
+        """Stream the rows of the result set as DataFrames of at most chunksize rows.
+
+        Only one chunk is held in memory at a time. Moving on to a later result set discards the rows not streamed.
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be at least 1")
+        if self._state == self._FETCHED:
+            for start in range(0, len(self._df), chunksize):
+                yield self._df.iloc[start:start + chunksize]
+            return
+        if self._state != self._PENDING:
+            raise RuntimeError("Result set {index} was already streamed".format(index=self._index))
+
+        self._result_sets._seek(self)
+        self._state = self._STREAMING
+        while self._state == self._STREAMING:
+            rows = self._result_sets._fetch(chunksize)
+            if not rows:
+                break
+            yield build_dataframe(self._description, rows)
+
+    # Called when the cursor moves on to the next result set
+    def _leave(self):
+        if self._state == self._PENDING:
+            self.fetch()
+        elif self._state == self._STREAMING:
+            self._state = self._SKIPPED
+
+    def __repr__(self):
+        return "ResultSet(index={index}, columns={columns}, state={state})".format(
+            index=self._index, columns=self.columns, state=self._state)
+
+
+class ResultSets:
+    """Lazy sequence of the result sets of a batch.
+
+    The connection stays checked out until the last result set has been reached or close() is called.
+
+    >>> with sqlpy.execute_sql_query_multi("SELECT * FROM features; SELECT * FROM labels") as results:
+    >>>     features = results[0].fetch()
+    >>>     for chunk in results[1].iter_chunks(chunksize=1000):
+    >>>         print(chunk.shape)
+    """
+
+    def __init__(self, connection: ConnectionInfo, query: str, params=(), output: bool = False,
+                 timeout: int = None):
+        """Run a batch and position on its first result set.
+
+        :param connection: ConnectionInfo of the server to run the batch on
+        :param query: batch to run
+        :param params: parameters of the query
+        :param output: the batch ends with the stdout/stderr and output parameters of a stored procedure call
+        (see ExecuteStoredProcedureBuilder); that last row is printed and kept in output_params instead of being
+        returned as a result set
+        :param timeout: seconds each statement may run before it is cancelled and QueryTimeoutError is raised;
+        defaults to connection.query_timeout
+        """
+        self._output = output
+        self._output_params = None
+        self._sets = []
+        self._current = None
+        self._executor = SQLQueryExecutor(connection, timeout=timeout).__enter__()
+        self._cursor = self._executor._cursor
+
+        try:
+            if params is not None:
+                self._cursor.execute(query, params)
+            else:
+                self._cursor.execute(query)
+        except Exception as e:
+            error = self._executor._execution_error(e)
+            self._close(type(error), error, None)
+            raise error
+        self._next_set(move=False)
+
+    @property
+    def output_params(self) -> dict:
+        """Output parameters of the stored procedure, once every result set has been reached; None before."""
+        return self._output_params
+
+    @property
+    def done(self) -> bool:
+        """Whether every result set has been reached and the connection released."""
+        return self._executor is None
+
+    def __getitem__(self, index: int) -> ResultSet:
+        if index < 0:
+            raise IndexError("ResultSets does not support negative indices")
+        while len(self._sets) <= index and not self.done:
+            self._next_set()
+        if index >= len(self._sets):
+            raise IndexError("result set index out of range")
+        return self._sets[index]
+
+    def __iter__(self):
+        index = 0
+        while True:
+            try:
+                yield self[index]
+            except IndexError:
+                return
+            index += 1
+
+    def __len__(self) -> int:
+        """Number of result sets; reaches the last result set, fetching the ones before it."""
+        while not self.done:
+            self._next_set()
+        return len(self._sets)
+
+    def fetch_all(self) -> list:
+        """Every result set as a DataFrame."""
+        return [result_set.fetch() for result_set in self]
+
+    def close(self):
+        """Discard the result sets not reached yet and release the connection."""
+        self._close(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, "_executor", None) is not None:
+            self.close()
+
+    # Result sets are only read while the cursor is on them
+    def _seek(self, result_set: ResultSet):
+        if self._current is not result_set:
+            raise RuntimeError("Result set {index} is no longer available".format(index=result_set.index))
+
+    def _fetch(self, chunksize):
+        try:
+            if chunksize is None:
+                return self._cursor.fetchall()
+            return self._cursor.fetchmany(chunksize)
+        except Exception as e:
+            error = self._executor._execution_error(e)
+            self._close(type(error), error, None)
+            raise error
+
+    def _next_set(self, move: bool = True):
+        if self._current is not None:
+            self._current._leave()
+            self._current = None
+        try:
+            while True:
+                if move and not self._cursor.nextset():
+                    self.close()
+                    return
+                move = True
+                # Skip over row counts and other results without columns
+                description = self._cursor.description
+                if description is None:
+                    continue
+                column_names = [element[0] for element in description]
+                if self._output and STDOUT_COLUMN_NAME in column_names:
+                    self._output_params = dict(zip(column_names, self._cursor.fetchone()))
+                    self._executor.extract_output(self._output_params)
+                    continue
+                self._current = ResultSet(self, len(self._sets), description)
+                self._sets.append(self._current)
+                return
+        except pyodbc.Error as e:
+            error = self._executor._execution_error(e)
+            self._close(type(error), error, None)
+            raise error
+
+    def _close(self, exception_type, exception_value, traceback):
+        executor, self._executor = self._executor, None
+        self._current = None
+        if executor is not None:
+            executor.__exit__(exception_type, exception_value, traceback)
@@ -0,0 +1,112 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import hashlib
+import linecache
+import threading
+
+from collections import OrderedDict, namedtuple
+
+"""Bounded LRU caches for text generated from Python functions (function source, SPEES wrapper scripts...).
+
+Getting the source of a function with inspect.getsource and templating the wrapper script around it costs far more
+than running a small function on the server, so the builders in sqlbuilder memoize that text per function.
+Entries are keyed on the function's code object: redefining a function (e.g. re-running a notebook cell) creates a
+new code object which compares unequal as soon as its bytecode, constants, line table or first line differ, so the
+stale entry is simply never hit again and ages out of the cache. Edits that leave the code object equal (annotations,
+comments, or the file changed on disk) are caught by a hash of the source file, which is part of the key too.
+"""
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class ScriptCache:
+
+    def __init__(self, maxsize: int = 256):
+        """
+        :param maxsize: maximum number of entries kept; the least recently used entry is dropped first.
+        """
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """Return the cached value for key, calling build() to create it on a miss.
+
+        :param key: hashable cache key, or None to bypass the cache.
+        :param build: function with no arguments that creates the value.
+        """
+        if key is None:
+            return build()
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+            self._misses += 1
+
+        value = build()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def info(self) -> CacheInfo:
+        """Hit and miss counters and the current size of the cache."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._maxsize, len(self._entries))
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+def function_key(func, *extra):
+    """Cache key for text generated from func (and any extra hashable options), or None if it cannot be cached.
+
+    Default argument values are part of the source text but not of the code object, so they are part of the key.
+    """
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return None
+    key = (code, _source_digest(code), func.__defaults__, _kwdefaults_key(func), func.__name__) + extra
+    try:
+        hash(key)
+    except TypeError:
+        # e.g. a list as default argument value
+        return None
+    return key
+
+
+_source_digests = {}
+_source_digests_lock = threading.Lock()
+
+
+# Hash of the current text of the file (or notebook cell) defining code. linecache reloads the lines of a file whose
+# size or modification time changed, and the hash is only computed again when it hands out new lines.
+def _source_digest(code):
+    filename = code.co_filename
+    linecache.checkcache(filename)
+    lines = linecache.getlines(filename)
+    with _source_digests_lock:
+        cached = _source_digests.get(filename)
+    if cached is not None and cached[0] is lines:
+        return cached[1]
+    digest = hashlib.sha1("".join(lines).encode("utf-8")).hexdigest()
+    with _source_digests_lock:
+        _source_digests[filename] = (lines, digest)
+    return digest
+
+
+def _kwdefaults_key(func):
+    kwdefaults = getattr(func, "__kwdefaults__", None)
+    return tuple(sorted(kwdefaults.items())) if kwdefaults else None
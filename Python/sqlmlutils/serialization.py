@@ -0,0 +1,62 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import dill
+import zlib
+
+"""Client side decoding of the values returned by functions executed with execute_function_in_sql.
+
+The server returns the dill pickle of the result in a varbinary(MAX) column, optionally compressed.
+The codec is recognized from the magic bytes at the start of the payload, so no header has to be added
+(and copied) on the server.
+"""
+
+ZLIB = "zlib"
+LZ4 = "lz4"
+ZSTD = "zstd"
+AUTO = "auto"
+
+COMPRESSION_CODECS = (ZLIB, LZ4, ZSTD)
+
+# With compression="auto", results whose pickle is at least this many bytes are compressed with zlib.
+AUTO_COMPRESSION_THRESHOLD = 1024 * 1024
+
+_LZ4_FRAME_MAGIC = b"\x04\x22\x4d\x18"
+_ZSTD_FRAME_MAGIC = b"\x28\xb5\x2f\xfd"
+_PICKLE_PROTO = 0x80
+
+
+def check_compression(compression: str):
+    """Raise ValueError if compression is not a supported codec name, "auto" or None."""
+    if compression is not None and compression != AUTO and compression not in COMPRESSION_CODECS:
+        raise ValueError("Compression {compression} not supported, use one of: None, {auto}, {codecs}".format(
+            compression=compression, auto=AUTO, codecs=", ".join(COMPRESSION_CODECS)))
+
+
+def loads_result(payload):
+    """Unpickle a (possibly compressed) result returned from the server.
+
+    :param payload: bytes read from the varbinary(MAX) return column
+    :return: the object returned by the remote function
+    """
+    view = memoryview(payload)
+    if len(view) > 0 and view[0] != _PICKLE_PROTO:
+        payload = _decompress(view)
+    # Uncompressed payloads are passed on as the bytes object pyodbc returned, which dill reads without copying
+    return dill.loads(payload)
+
+
+def _decompress(view: memoryview):
+    if view[:4] == _LZ4_FRAME_MAGIC:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("The result was compressed with lz4; install the lz4 package to decode it.")
+        return lz4.frame.decompress(view)
+    elif view[:4] == _ZSTD_FRAME_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("The result was compressed with zstd; install the zstandard package to decode it.")
+        return zstandard.ZstdDecompressor().decompress(view)
+    return zlib.decompress(view)
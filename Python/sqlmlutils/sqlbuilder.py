@@ -9,6 +9,11 @@ import warnings
 from pandas import DataFrame
 from typing import Callable, List
 
+from .outputcapture import LOG_WITH_RESULTS_TEXT, as_output_capture
+from .scriptcache import ScriptCache, function_key
+from .serialization import AUTO, AUTO_COMPRESSION_THRESHOLD, check_compression
+from .sqltypes import column_declarations, schema_columns
+
 """
 _SQLBuilder implementations are used to generate SQL scripts to execute_function_in_sql Python functions and 
 create/drop/execute_function_in_sql stored procedures. 
@@ -26,6 +31,82 @@ RETURN_COLUMN_NAME = "return_val"
 STDOUT_COLUMN_NAME = "_stdout_"
 STDERR_COLUMN_NAME = "_stderr_"
 
+# Dedented source text of functions, shared by all builders based on functions
+function_source_cache = ScriptCache(maxsize=256)
+# Python scripts generated by SpeesBuilderFromFunction, without the arguments
+wrapper_script_cache = ScriptCache(maxsize=256)
+
+
+def get_function_text(func: Callable) -> str:
+    """Dedented source of func, memoized per code object."""
+    return function_source_cache.get_or_build(function_key(func),
+                                              lambda: textwrap.dedent(inspect.getsource(func)))
+
+
+# SPEES options for streaming, parallel and partitioned execution
+PARALLEL_TEXT = ",\n@parallel = 1"
+
+
+def partition_text(partition_by, order_by=None) -> str:
+    """@input_data_1_partition_by_columns and @input_data_1_order_by_columns arguments for a SPEES query.
+
+    :param partition_by: column name or list of column names of @input_data_1; the script runs once per partition
+    :param order_by: column name or list of column names ordering the rows within each partition
+    """
+    partition_columns = _column_list(partition_by)
+    if len(partition_columns) == 0:
+        if order_by:
+            raise ValueError("order_by can only be used together with partition_by")
+        return ""
+
+    text = ",\n@input_data_1_partition_by_columns = N'{columns}'".format(columns=partition_columns)
+    order_columns = _column_list(order_by)
+    if len(order_columns) > 0:
+        text += ",\n@input_data_1_order_by_columns = N'{columns}'".format(columns=order_columns)
+    return text
+
+
+def _column_list(columns) -> str:
+    if not columns:
+        return ""
+    if isinstance(columns, str):
+        columns = [columns]
+    return ", ".join(column.replace("'", "''") for column in columns)
+
+
+def streaming_parameter(rows_per_read: int):
+    """(name, type, value) of the @r_rowsPerRead script parameter that makes SQL Server stream the input data."""
+    if not isinstance(rows_per_read, int) or isinstance(rows_per_read, bool) or rows_per_read < 1:
+        raise ValueError("rows_per_read must be a positive integer")
+    return "r_rowsPerRead", "int", str(rows_per_read)
+
+
+def spees_parameters_text(script_parameters: list) -> str:
+    """@params declaration and values for a list of (name, type, value) tuples.
+
+    e.g. [("arg", "int", "?")] becomes:
+    ,
+    @params = N'@arg int',
+    @arg = ?
+    """
+    declarations = ", ".join("@{name} {sqltype}".format(name=name, sqltype=sql_type)
+                             for name, sql_type, _ in script_parameters)
+    values = ",\n".join("@{name} = {value}".format(name=name, value=value)
+                        for name, _, value in script_parameters)
+    return ",\n@params = N'{declarations}',\n{values}".format(declarations=declarations, values=values)
+
+
+def call_arguments(item):
+    """(positional, keyword) arguments of one call in an argument list: a tuple of positional arguments, a dictionary
+    of keyword arguments, or any other value as the only positional argument.
+    """
+    if isinstance(item, dict):
+        return (), item
+    if isinstance(item, tuple):
+        return item, {}
+    return (item,), {}
+
+
 class SQLBuilder:
 
     @abc.abstractmethod
@@ -51,7 +132,13 @@ class SpeesBuilder(SQLBuilder):
                  with_results_text: str = _WITH_RESULTS_TEXT,
                  input_data_query: str = "",
                  script_parameters_text: str = "",
-                 language_name: str = "Python"):
+                 language_name: str = "Python",
+                 script_parameters: list = None,
+                 rows_per_read: int = None,
+                 parallel: bool = False,
+                 partition_by=None,
+                 order_by=None,
+                 output_capture=None):
         """Instantiate a _SpeesBuilder object.
 
         :param script: maps to @script parameter in the SQL query parameter
@@ -59,7 +146,36 @@ class SpeesBuilder(SQLBuilder):
         :param input_data_query: maps to @input_data_1 SQL query parameter
         :param script_parameters_text: maps to @params SQL query parameter
         :param language_name: name of the language to be executed in sp_execute_external_script, if using EXTERNAL LANGUAGE
+        :param script_parameters: list of (name, type, value) tuples declared in @params and passed to the script,
+        alternative to script_parameters_text
+        :param rows_per_read: if given, SQL Server streams @input_data_1 to the script in batches of this many rows
+        (@r_rowsPerRead) and the script runs once per batch
+        :param parallel: if True, SQL Server may run the script in parallel over partitions of @input_data_1
+        (@parallel = 1)
+        :param partition_by: column(s) of @input_data_1 to partition on; the script runs once per partition
+        (@input_data_1_partition_by_columns)
+        :param order_by: column(s) ordering the rows of each partition (@input_data_1_order_by_columns)
+        :param output_capture: OutputCapture limiting, disabling or streaming the capture of stdout and stderr;
+        None to return them in full, False to discard them
         """
+        if partition_by and input_data_query == "":
+            raise ValueError("partition_by requires an input_data_query")
+        script_parameters = list(script_parameters) if script_parameters is not None else []
+        if rows_per_read is not None:
+            script_parameters.append(streaming_parameter(rows_per_read))
+        if script_parameters:
+            if script_parameters_text != "":
+                raise ValueError("script_parameters cannot be combined with script_parameters_text")
+            script_parameters_text = spees_parameters_text(script_parameters)
+        script_parameters_text += partition_text(partition_by, order_by)
+        if parallel:
+            script_parameters_text += PARALLEL_TEXT
+
+        self._output_capture = as_output_capture(output_capture)
+        if self._output_capture.stream:
+            # The script returns its log lines as the OutputDataSet
+            with_results_text = LOG_WITH_RESULTS_TEXT
+
         self._script = self.modify_script(script)
         self._input_data_query = input_data_query
         self._script_parameters_text = script_parameters_text
@@ -84,25 +200,99 @@ EXEC sp_execute_external_script
         return self._script, self._input_data_query
         
     def modify_script(self, script):
-        return """
-import sys
-from io import StringIO
-from pandas import DataFrame
-
-_temp_out = StringIO()
-_temp_err = StringIO()
+        if self._output_capture.stream:
+            ending = self._output_capture.log_lines_text()
+        else:
+            ending = """
+OutputDataSet["{stdout}"] = [_temp_out.getvalue()]
+OutputDataSet["{stderr}"] = [_temp_err.getvalue()]
+""".format(stdout=STDOUT_COLUMN_NAME, stderr=STDERR_COLUMN_NAME)
+        return """{capture_setup}from pandas import DataFrame
 
-sys.stdout = _temp_out
-sys.stderr = _temp_err
 OutputDataSet = DataFrame()
 
 {script}
+{ending}""".format(capture_setup=self._output_capture.setup_text(),
+                   script=script,
+                   ending=ending)
+
+# Server side compression of the pickled return value.
+# The client recognizes the codec from the magic bytes of the payload (see serialization.loads_result).
+_COMPRESS_RESULT_TEXT = """
+def _compress_result(payload, codec, threshold):
+    if codec == "auto":
+        codec = "zlib" if len(payload) >= threshold else None
+    if codec == "zlib":
+        import zlib
+        return zlib.compress(payload, 1)
+    elif codec == "lz4":
+        import lz4.frame
+        return lz4.frame.compress(payload)
+    elif codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor().compress(payload)
+    return payload
+"""
+
+# Server side process pool used with server_workers.
+# The function and its arguments are pickled by value with dill: unpickling the payload in a worker process runs
+# the call and returns the dill pickle of its result, so the pool itself only moves bytes. The workers are started
+# with "spawn" from the Python executable of the external runtime, without inheriting the state of the runtime.
+_SERVER_POOL_TEXT = """
+import functools
+import multiprocessing
+import os
+import sys
+
+import dill
+
+dill.settings['recurse'] = True
+
+
+class _PoolCall:
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = kwargs
+
+    def __reduce__(self):
+        return functools.partial(self.func, **self.kwargs), self.args
+
+
+class _PoolResult:
+
+    def __init__(self, call):
+        self.call = call
+
+    def __reduce__(self):
+        return dill.dumps, (self.call,)
+
+
+def _pool_payload(func, args, kwargs):
+    # functions of the main module are pickled by value, the worker processes cannot import this script
+    func.__module__ = "__main__"
+    return dill.dumps(_PoolResult(_PoolCall(func, args, kwargs)))
+
+
+def _server_pool(workers):
+    context = multiprocessing.get_context("spawn")
+    executable = os.path.join(sys.exec_prefix, "python.exe" if os.name == "nt" else os.path.join("bin", "python"))
+    if os.path.exists(executable):
+        context.set_executable(executable)
+    return context.Pool(workers)
+"""
+
+# Default server side reduce step: the DataFrames returned for each chunk are concatenated, other results are
+# returned as a list.
+_CONCAT_PARTIALS_TEXT = """
+def _concat_partials(partials):
+    import pandas
+    if all(isinstance(partial, pandas.DataFrame) for partial in partials):
+        return pandas.concat(partials)
+    return partials
+"""
 
-OutputDataSet["{stdout}"] = [_temp_out.getvalue()]
-OutputDataSet["{stderr}"] = [_temp_err.getvalue()]
-""".format(script=script,
-        stdout=STDOUT_COLUMN_NAME,
-        stderr=STDERR_COLUMN_NAME)
 
 class SpeesBuilderFromFunction(SpeesBuilder):
 
@@ -110,13 +300,27 @@ class SpeesBuilderFromFunction(SpeesBuilder):
     _SpeesBuilderFromFunction objects are used to generate SPEES queries based on a function and given arguments.
     """
 
-    _WITH_RESULTS_TEXT = "with result sets(({returncol} varchar(MAX), {stdout} varchar(MAX), {stderr} varchar(MAX)))".format(
+    _WITH_RESULTS_TEXT = "with result sets(({returncol} varbinary(MAX), {stdout} varchar(MAX), {stderr} varchar(MAX)))".format(
         returncol=RETURN_COLUMN_NAME,
         stdout=STDOUT_COLUMN_NAME,
         stderr=STDERR_COLUMN_NAME
     )
 
-    def __init__(self, func: Callable, language_name: str, input_data_query: str = "", *args, **kwargs):
+    # The pickled arguments are bound to these SPEES parameters and arrive in the script as bytes variables.
+    _SCRIPT_PARAMETERS = [("args_dill", "varbinary(MAX)", "?"),
+                          ("pos_args_dill", "varbinary(MAX)", "?")]
+
+    # With OutputCapture(stream=True) the OutputDataSet holds the log lines, and the result is returned through
+    # this output parameter instead
+    _STREAM_SCRIPT_PARAMETERS = [(RETURN_COLUMN_NAME, "varbinary(MAX) OUTPUT", "@" + RETURN_COLUMN_NAME + " OUTPUT")]
+
+    # With server_workers, the input data is split into one chunk per worker process
+    _SPLIT_INPUT = True
+
+    def __init__(self, func: Callable, language_name: str, input_data_query: str = "", *args,
+                 compression: str = AUTO, rows_per_read: int = None, parallel: bool = False,
+                 partition_by=None, order_by=None, output_capture=None, server_workers: int = None,
+                 server_reduce: Callable = None, **kwargs):
         """Instantiate a _SpeesBuilderFromFunction object.
 
         :param func: function to execute_function_in_sql on the SQL Server.
@@ -124,39 +328,117 @@ class SpeesBuilderFromFunction(SpeesBuilder):
         :param input_data_query: query text for @input_data_1 parameter
         :param language_name: name of the language to be executed in sp_execute_external_script, if using EXTERNAL LANGUAGE
         :param args: positional arguments to function call in SPEES
+        :param compression: codec used to compress the returned value ("zlib", "lz4", "zstd"), None for no
+        compression or "auto" to use zlib for large results only
+        :param rows_per_read: stream the input data to the function in batches of this many rows
+        :param parallel: let SQL Server run the function in parallel over partitions of the input data
+        :param partition_by: column(s) of the input data to partition on; the function runs once per partition
+        :param order_by: column(s) ordering the rows of each partition
+        :param output_capture: OutputCapture for stdout and stderr, see SpeesBuilder
+        :param server_workers: split the input data into this many chunks and call the function on each chunk in a
+        pool of worker processes on the server
+        :param server_reduce: function combining the list of the values returned for each chunk into the returned
+        value; by default DataFrames are concatenated and other values returned as a list
         :param kwargs: keyword arguments to function call in SPEES
         """
+        check_compression(compression)
+        self._stream_output = as_output_capture(output_capture).stream
+        if self._stream_output and (rows_per_read is not None or parallel or partition_by):
+            raise ValueError("Streamed output cannot be combined with rows_per_read, parallel or partition_by")
+        server_pool = self._server_pool(server_workers, server_reduce, input_data_query,
+                                        rows_per_read is not None or parallel or bool(partition_by))
         with_inputdf = input_data_query != ""
-        self._function_text = self._build_wrapper_python_script(func, with_inputdf, *args, **kwargs)
+        return_text = self._return_text(compression)
+        self._function_text = wrapper_script_cache.get_or_build(
+            self._wrapper_key(func, with_inputdf, return_text, server_pool),
+            lambda: self._build_wrapper_python_script(func, with_inputdf, return_text, server_pool))
+        self._args_dill, self._pos_args_dill = self._serialize_arguments(*args, **kwargs)
+        script_parameters = self._SCRIPT_PARAMETERS
+        if self._stream_output:
+            script_parameters = script_parameters + self._STREAM_SCRIPT_PARAMETERS
         super().__init__(script=self._function_text,
                          with_results_text=self._WITH_RESULTS_TEXT,
                          input_data_query=input_data_query,
-                         language_name=language_name)
+                         language_name=language_name,
+                         script_parameters=script_parameters,
+                         rows_per_read=rows_per_read,
+                         parallel=parallel,
+                         partition_by=partition_by,
+                         order_by=order_by,
+                         output_capture=output_capture)
+
+    @property
+    def base_script(self):
+        if not self._stream_output:
+            return super().base_script
+        return """
+DECLARE @{returncol} varbinary(MAX);
+{spees}
+SELECT @{returncol} AS {returncol}, CAST(NULL AS varchar(MAX)) AS {stdout}, CAST(NULL AS varchar(MAX)) AS {stderr};
+""".format(spees=super().base_script, returncol=RETURN_COLUMN_NAME, stdout=STDOUT_COLUMN_NAME,
+           stderr=STDERR_COLUMN_NAME)
+
+    @property
+    def params(self):
+        return self._script, self._input_data_query, self._args_dill, self._pos_args_dill
+
+    @staticmethod
+    def _serialize_arguments(*args, **kwargs):
+        dill.settings['recurse'] = True
+        return dill.dumps(kwargs), dill.dumps(args)
+
+    # Validated (server_workers, server_reduce) pair, or None to call the function in the external runtime itself
+    def _server_pool(self, server_workers, server_reduce, input_data_query, chunked):
+        if server_workers is None:
+            if server_reduce is not None:
+                raise ValueError("server_reduce requires server_workers")
+            return None
+        if server_workers < 1:
+            raise ValueError("server_workers must be at least 1")
+        if self._SPLIT_INPUT and input_data_query == "":
+            raise ValueError("server_workers splits the input data and requires an input_data_query")
+        if chunked:
+            raise ValueError("server_workers cannot be combined with rows_per_read, parallel or partition_by")
+        return server_workers, server_reduce
+
+    def _wrapper_key(self, func, with_inputdf, return_text, server_pool):
+        if server_pool is None:
+            return function_key(func, with_inputdf, return_text, type(self))
+        server_workers, server_reduce = server_pool
+        if server_reduce is None or inspect.isbuiltin(server_reduce):
+            reduce_key = getattr(server_reduce, "__name__", None)
+        else:
+            reduce_key = function_key(server_reduce)
+        if server_reduce is not None and reduce_key is None:
+            return None
+        return function_key(func, with_inputdf, return_text, type(self), server_workers, reduce_key)
 
-    # Generates a Python script that encapsulates a user defined function and the arguments to that function.
+    # Generates a Python script that encapsulates a user defined function.
     # This script is "shipped" over the SQL Server machine.
     # The function is sent as text.
-    # The arguments to pass to the function are serialized into their dill hex strings.
+    # The arguments to pass to the function are not part of the script: their dill pickles are bound to the
+    # @args_dill and @pos_args_dill varbinary parameters, so the script text is the same for every call.
     # When with_inputdf is True, it specifies that func will take the magic "InputDataSet" as its first arguments.
+    # return_text is the code returning the result to the client (see _return_text).
+    # server_pool is the (server_workers, server_reduce) pair calling func on chunks of InputDataSet in a process pool.
     @staticmethod
-    def _build_wrapper_python_script(func: Callable, with_inputdf, *args, **kwargs):
+    def _build_wrapper_python_script(func: Callable, with_inputdf, return_text, server_pool=None):
         dill.settings['recurse'] = True
-        function_text = SpeesBuilderFromFunction._clean_function_text(inspect.getsource(func))
-        args_dill = dill.dumps(kwargs).hex()
-        pos_args_dill = dill.dumps(args).hex()
+        function_text = get_function_text(func)
         function_name = func.__name__
-        func_arguments=SpeesBuilderFromFunction._func_arguments(with_inputdf)
+        if server_pool is None:
+            call_text = "{returncol} = func{func_arguments}".format(
+                returncol=RETURN_COLUMN_NAME,
+                func_arguments=SpeesBuilderFromFunction._func_arguments(with_inputdf))
+        else:
+            call_text = SpeesBuilderFromFunction._server_pool_call_text(*server_pool)
 
         return """
 {function_text} 
         
 import dill
 
-# serialized keyword arguments
-args_dill = bytes.fromhex("{args_dill}")
-# serialized positional arguments
-pos_args_dill = bytes.fromhex("{pos_args_dill}")
-
+# deserialize keyword and positional arguments bound to the @args_dill and @pos_args_dill parameters
 args = dill.loads(args_dill)
 pos_args = dill.loads(pos_args_dill)
 
@@ -164,17 +446,61 @@ pos_args = dill.loads(pos_args_dill)
 func = {function_name}
     
 # call user function with serialized arguments
-{returncol} = func{func_arguments}
+{call_text}
 
-# serialize results of user function and put in DataFrame for return through SQL Satellite channel
-OutputDataSet["{returncol}"] = [dill.dumps({returncol}).hex()]
+{return_text}
 """.format(
     function_text=function_text,
-    args_dill=args_dill,
-    pos_args_dill=pos_args_dill,
     function_name=function_name,
+    call_text=call_text,
+    return_text=return_text
+)
+
+    # Splits InputDataSet into one chunk per worker process, calls func on every chunk in the pool and reduces the
+    # list of results on the server.
+    @staticmethod
+    def _server_pool_call_text(server_workers: int, server_reduce: Callable = None):
+        if server_reduce is None:
+            reduce_text, reduce_name = _CONCAT_PARTIALS_TEXT, "_concat_partials"
+        elif inspect.isbuiltin(server_reduce):
+            # e.g. sum or max, available on the server as they are
+            reduce_text, reduce_name = "", server_reduce.__name__
+        else:
+            reduce_text, reduce_name = get_function_text(server_reduce), server_reduce.__name__
+        return """{pool_text}
+{reduce_text}
+
+_bounds = [len(InputDataSet) * _i // {workers} for _i in range({workers} + 1)]
+_chunks = [InputDataSet.iloc[_bounds[_i]:_bounds[_i + 1]] for _i in range({workers})
+           if _bounds[_i] < _bounds[_i + 1]] or [InputDataSet]
+with _server_pool(len(_chunks)) as _pool:
+    _payloads = [_pool_payload(func, (_chunk,) + tuple(pos_args), args) for _chunk in _chunks]
+    _partials = [dill.loads(_result) for _result in _pool.map(dill.loads, _payloads)]
+{returncol} = {reduce_name}(_partials)""".format(
+    pool_text=_SERVER_POOL_TEXT,
+    reduce_text=reduce_text,
+    workers=server_workers,
     returncol=RETURN_COLUMN_NAME,
-    func_arguments=func_arguments
+    reduce_name=reduce_name
+)
+
+    # The result is returned as a (possibly compressed) dill pickle in a varbinary column,
+    # or in the @return_val output parameter when the output is streamed.
+    def _return_text(self, compression):
+        if self._stream_output:
+            return_text = "{returncol} = _compress_result(dill.dumps({returncol}), {compression!r}, {threshold})"
+        else:
+            return_text = "OutputDataSet[\"{returncol}\"] = " \
+                          "[_compress_result(dill.dumps({returncol}), {compression!r}, {threshold})]"
+        return """{compress_text}
+
+# serialize results of user function and put in DataFrame for return through SQL Satellite channel
+{return_text}
+""".format(
+    compress_text=_COMPRESS_RESULT_TEXT,
+    return_text=return_text.format(returncol=RETURN_COLUMN_NAME,
+                                   compression=compression,
+                                   threshold=AUTO_COMPRESSION_THRESHOLD)
 )
 
     # Call syntax of the user function
@@ -184,9 +510,195 @@ OutputDataSet["{returncol}"] = [dill.dumps({returncol}).hex()]
     def _func_arguments(with_inputdf: bool):
         return "(InputDataSet, *pos_args, **args)" if with_inputdf else "(*pos_args, **args)"
 
+
+class SpeesBuilderFromFunctionBatch(SpeesBuilderFromFunction):
+
+    """
+    Generate SPEES queries calling a function once per argument set, all in one launch of the external runtime.
+
+    The argument sets are bound as one pickled list to @calls_dill. The returned value is the list of the results
+    of each call, with the exception raised by a call in place of its result.
+    """
+
+    _SCRIPT_PARAMETERS = [("args_dill", "varbinary(MAX)", "?"),
+                          ("calls_dill", "varbinary(MAX)", "?")]
+
+    # With server_workers, every call is a task of the process pool
+    _SPLIT_INPUT = False
+
+    def __init__(self, func: Callable, language_name: str, input_data_query: str = "", arg_list=(),
+                 compression: str = AUTO, output_capture=None, server_workers: int = None, **kwargs):
+        """Instantiate a SpeesBuilderFromFunctionBatch object.
+
+        :param func: function to execute on the SQL Server
+        :param language_name: name of the language to be executed in sp_execute_external_script, if using EXTERNAL LANGUAGE
+        :param input_data_query: query text for @input_data_1 parameter, passed as first argument of every call
+        :param arg_list: argument sets, one per call: a tuple of positional arguments, a dictionary of keyword
+        arguments, or any other value as the only positional argument
+        :param compression: codec used to compress the returned list, see SpeesBuilderFromFunction
+        :param output_capture: OutputCapture for stdout and stderr, see SpeesBuilder
+        :param server_workers: run the calls in a pool of this many worker processes on the server
+        :param kwargs: keyword arguments passed to every call
+        """
+        self._calls = [call_arguments(item) for item in arg_list]
+        super().__init__(func, language_name, input_data_query, compression=compression,
+                         output_capture=output_capture, server_workers=server_workers, **kwargs)
+
+    def _serialize_arguments(self, *args, **kwargs):
+        dill.settings['recurse'] = True
+        return dill.dumps(kwargs), dill.dumps(self._calls)
+
     @staticmethod
-    def _clean_function_text(function_text):
-        return textwrap.dedent(function_text)
+    def _build_wrapper_python_script(func: Callable, with_inputdf, return_text, server_pool=None):
+        dill.settings['recurse'] = True
+        input_argument = "InputDataSet, " if with_inputdf else ""
+        if server_pool is None:
+            pool_text = ""
+            call_loop = """for _index, (_pos_args, _args) in enumerate(calls):
+    try:
+        {returncol}.append(func({input_argument}*_pos_args, **dict(args, **_args)))
+    except Exception as e:
+        _append_exception(_index, e)"""
+        else:
+            pool_text = _SERVER_POOL_TEXT
+            call_loop = """with _server_pool(min({workers}, max(len(calls), 1))) as _pool:
+    _pending = [_pool.apply_async(dill.loads,
+                                  (_pool_payload(func, ({input_argument}*_pos_args,), dict(args, **_args)),))
+                for _pos_args, _args in calls]
+    for _index, _call in enumerate(_pending):
+        try:
+            {returncol}.append(dill.loads(_call.get()))
+        except Exception as e:
+            _append_exception(_index, e)"""
+        call_loop = call_loop.format(returncol=RETURN_COLUMN_NAME, input_argument=input_argument,
+                                     workers=server_pool[0] if server_pool else None)
+
+        return """
+{function_text}
+
+import dill
+import sys
+import traceback
+
+# keyword arguments shared by every call, and the (positional, keyword) arguments of each call
+args = dill.loads(args_dill)
+calls = dill.loads(calls_dill)
+
+func = {function_name}
+
+# Exceptions that cannot be unpickled on the client are replaced by a RuntimeError with their message
+def _portable_exception(e):
+    try:
+        dill.loads(dill.dumps(e))
+        return e
+    except Exception:
+        return RuntimeError("{{name}}: {{message}}".format(name=type(e).__name__, message=e))
+
+def _append_exception(index, e):
+    print("Call {{index}} of the batch failed:".format(index=index), file=sys.stderr)
+    traceback.print_exc()
+    {returncol}.append(_portable_exception(e))
+{pool_text}
+{returncol} = []
+{call_loop}
+
+{return_text}
+""".format(
+    function_text=get_function_text(func),
+    function_name=func.__name__,
+    returncol=RETURN_COLUMN_NAME,
+    pool_text=pool_text,
+    call_loop=call_loop,
+    return_text=return_text
+)
+
+
+class SpeesBuilderFromFunctionWithResultSet(SpeesBuilderFromFunction):
+
+    """
+    Generate SPEES queries for functions returning a DataFrame, which is returned as the typed OutputDataSet.
+
+    The columns of the result set are declared in the WITH RESULT SETS clause, so rows come back over TDS as typed
+    columns instead of a single pickled cell. stdout and stderr are returned through output parameters, selected
+    in a second result set.
+    """
+
+    _SCRIPT_PARAMETERS = SpeesBuilderFromFunction._SCRIPT_PARAMETERS + [
+        (STDOUT_COLUMN_NAME, "nvarchar(MAX) OUTPUT", "@" + STDOUT_COLUMN_NAME + " OUTPUT"),
+        (STDERR_COLUMN_NAME, "nvarchar(MAX) OUTPUT", "@" + STDERR_COLUMN_NAME + " OUTPUT")]
+
+    def __init__(self, func: Callable, language_name: str, input_data_query: str = "", *args,
+                 result_schema=None, rows_per_read: int = None, parallel: bool = False,
+                 partition_by=None, order_by=None, output_capture=None, server_workers: int = None,
+                 server_reduce: Callable = None, **kwargs):
+        """Instantiate a SpeesBuilderFromFunctionWithResultSet object.
+
+        :param func: function to execute on the SQL Server. It must return a DataFrame.
+        :param language_name: name of the language to be executed in sp_execute_external_script, if using EXTERNAL LANGUAGE
+        :param input_data_query: query text for @input_data_1 parameter
+        :param args: positional arguments to function call in SPEES
+        :param result_schema: columns of the returned DataFrame: a dictionary of column name to Python type,
+        dtype or SQL type name, or a sample DataFrame whose dtypes are used
+        :param rows_per_read: stream the input data to the function in batches of this many rows
+        :param parallel: let SQL Server run the function in parallel over partitions of the input data
+        :param partition_by: column(s) of the input data to partition on; the function runs once per partition
+        :param order_by: column(s) ordering the rows of each partition
+        :param output_capture: OutputCapture limiting or disabling the capture of stdout and stderr
+        :param server_workers: call the function on chunks of the input data in a pool of this many worker
+        processes on the server, see SpeesBuilderFromFunction
+        :param server_reduce: function combining the DataFrames returned for each chunk into one DataFrame
+        :param kwargs: keyword arguments to function call in SPEES
+        """
+        self._columns = schema_columns(result_schema)
+        if len(self._columns) == 0:
+            raise ValueError("result_schema must declare at least one column")
+        if as_output_capture(output_capture).stream:
+            raise ValueError("Streamed output cannot be combined with result_schema")
+        super().__init__(func, language_name, input_data_query, *args, compression=None,
+                         rows_per_read=rows_per_read, parallel=parallel,
+                         partition_by=partition_by, order_by=order_by, output_capture=output_capture,
+                         server_workers=server_workers, server_reduce=server_reduce, **kwargs)
+        self._with_results_text = "with result sets(({columns}));".format(
+            columns=column_declarations(self._columns))
+
+    @property
+    def base_script(self):
+        return """
+DECLARE @{stdout} nvarchar(MAX), @{stderr} nvarchar(MAX);
+{spees}
+SELECT @{stdout} AS {stdout}, @{stderr} AS {stderr};
+""".format(spees=super().base_script, stdout=STDOUT_COLUMN_NAME, stderr=STDERR_COLUMN_NAME)
+
+    def _return_text(self, compression):
+        return """
+if not isinstance({returncol}, DataFrame):
+    raise TypeError("Function must return a DataFrame when result_schema is given, not " + str(type({returncol})))
+
+# return the DataFrame itself as the OutputDataSet, in the column order of the result set declaration
+OutputDataSet = {returncol}[{column_names!r}]
+""".format(returncol=RETURN_COLUMN_NAME, column_names=[name for name, _ in self._columns])
+
+    def modify_script(self, script):
+        return """{capture_setup}from pandas import DataFrame
+
+OutputDataSet = DataFrame()
+
+{script}
+
+{stdout} = _temp_out.getvalue()
+{stderr} = _temp_err.getvalue()
+""".format(capture_setup=self._output_capture.setup_text(),
+           script=script,
+           stdout=STDOUT_COLUMN_NAME,
+           stderr=STDERR_COLUMN_NAME)
+
+
+def _sproc_output_capture(output_capture):
+    output_capture = as_output_capture(output_capture)
+    if output_capture.stream:
+        # The OutputDataSet of a stored procedure is the DataFrame returned by the script
+        raise ValueError("Stored procedures cannot stream their output")
+    return output_capture
 
 
 class StoredProcedureBuilder(SQLBuilder):
@@ -196,7 +708,12 @@ class StoredProcedureBuilder(SQLBuilder):
                 script: str,
                 input_params: dict = None,
                 output_params: dict = None,
-                language_name: str = "Python"):
+                language_name: str = "Python",
+                rows_per_read: int = None,
+                parallel: bool = False,
+                partition_by=None,
+                order_by=None,
+                output_capture=None):
 
         """StoredProcedureBuilder SQL stored procedures based on Python functions.
 
@@ -205,11 +722,19 @@ class StoredProcedureBuilder(SQLBuilder):
         :param input_params: input parameters type annotation dictionary for the stored procedure
         :param output_params: output parameters type annotation dictionary from the stored procedure
         :param language_name: name of the language to be executed in sp_execute_external_script, if using EXTERNAL LANGUAGE
+        :param rows_per_read: stream the input DataFrame to the script in batches of this many rows
+        :param parallel: let SQL Server run the script in parallel over partitions of the input DataFrame
+        :param partition_by: column(s) of the input DataFrame to partition on; the script runs once per partition
+        :param order_by: column(s) ordering the rows of each partition
+        :param output_capture: OutputCapture limiting or disabling the capture of stdout and stderr
         """
+        if rows_per_read is not None:
+            streaming_parameter(rows_per_read)
         if input_params is None:
             input_params = {}
         if output_params is None:
             output_params = {}
+        self._output_capture = _sproc_output_capture(output_capture)
         
         output_params[STDOUT_COLUMN_NAME] = str
         output_params[STDERR_COLUMN_NAME] = str
@@ -219,6 +744,9 @@ class StoredProcedureBuilder(SQLBuilder):
         self._input_params = input_params
         self._output_params = output_params
         self._language_name = language_name
+        self._rows_per_read = rows_per_read
+        self._parallel = parallel
+        self._partition_text = partition_text(partition_by, order_by)
         self._param_declarations = ""
 
         names_of_input_args = list(self._input_params)
@@ -242,21 +770,16 @@ AS
 SET NOCOUNT ON;
 EXEC sp_execute_external_script
 @language = N'{language_name}',
-@script = N'
-from io import StringIO
-import sys
-_stdout = StringIO()
-_stderr = StringIO()
-sys.stdout = _stdout
-sys.stderr = _stderr
+@script = N'{capture_setup}
 {script}
-{stdout} = _stdout.getvalue()
-{stderr} = _stderr.getvalue()'
+{stdout} = _temp_out.getvalue()
+{stderr} = _temp_err.getvalue()'
 {script_parameter_text}
 """.format(
     name=self._name,
     param_declarations=self._param_declarations,
     language_name=self._language_name,
+    capture_setup=self._output_capture.setup_text().replace("'", "''"),
     script=self._script,
     stdout=STDOUT_COLUMN_NAME,
     stderr=STDERR_COLUMN_NAME,
@@ -291,20 +814,28 @@ sys.stderr = _stderr
                 break
 
         if in_data_name != "":
-            script_params += ",\n" + self.get_input_data_set(in_data_name)
+            script_params += ",\n" + self.get_input_data_set(in_data_name) + self._partition_text
+        elif self._partition_text != "":
+            raise ValueError("partition_by requires a DataFrame input parameter")
 
         if out_data_name != "":
             script_params += ",\n" + self.get_output_data_set(out_data_name)
 
-        if len(in_names) > 0 or len(out_names) > 0:
+        if len(in_names) > 0 or len(out_names) > 0 or self._rows_per_read is not None:
             script_params += ","
 
         in_params_declaration = out_params_declaration = ""
         in_params_passing = out_params_passing = ""
 
+        if self._rows_per_read is not None:
+            rows_name, rows_type, rows_value = streaming_parameter(self._rows_per_read)
+            in_params_declaration = "@{name} {sqltype}".format(name=rows_name, sqltype=rows_type)
+            in_params_passing = "@{name} = {value}".format(name=rows_name, value=rows_value)
+
         if len(in_names) > 0:
-            in_params_declaration = self.get_declarations(in_names, in_types)
-            in_params_passing = self.get_params_passing(in_names)
+            in_params_declaration = self.combine_in_out(self.get_declarations(in_names, in_types),
+                                                        in_params_declaration)
+            in_params_passing = self.combine_in_out(self.get_params_passing(in_names), in_params_passing)
 
         if len(out_names) > 0:
             out_params_declaration = self.get_declarations(out_names, out_types, True)
@@ -319,6 +850,9 @@ sys.stderr = _stderr
                 params_passing=params_passing
             )
 
+        if self._parallel:
+            script_params += PARALLEL_TEXT
+
         return script_params
 
     @staticmethod
@@ -398,7 +932,12 @@ class StoredProcedureBuilderFromFunction(StoredProcedureBuilder):
                 name: str, func: Callable,
                 input_params: dict = None, 
                 output_params: dict = None,
-                language_name: str = "Python"):
+                language_name: str = "Python",
+                rows_per_read: int = None,
+                parallel: bool = False,
+                partition_by=None,
+                order_by=None,
+                output_capture=None):
         """StoredProcedureBuilderFromFunction SQL stored procedures based on Python functions.
 
         :param name: name of the stored procedure
@@ -407,11 +946,19 @@ class StoredProcedureBuilderFromFunction(StoredProcedureBuilder):
         Can use function type annotations instead; if both, they must match
         :param output_params: output parameters type annotation dictionary from the stored procedure
         :param language_name: name of the language to be executed in sp_execute_external_script, if using EXTERNAL LANGUAGE
+        :param rows_per_read: stream the input DataFrame to the function in batches of this many rows
+        :param parallel: let SQL Server run the function in parallel over partitions of the input DataFrame
+        :param partition_by: column(s) of the input DataFrame to partition on; the function runs once per partition
+        :param order_by: column(s) ordering the rows of each partition
+        :param output_capture: OutputCapture limiting or disabling the capture of stdout and stderr
         """
+        if rows_per_read is not None:
+            streaming_parameter(rows_per_read)
         if input_params is None:
             input_params = {}
         if output_params is None:
             output_params = {}
+        self._output_capture = _sproc_output_capture(output_capture)
             
         output_params[STDOUT_COLUMN_NAME] = str
         output_params[STDERR_COLUMN_NAME] = str
@@ -420,9 +967,12 @@ class StoredProcedureBuilderFromFunction(StoredProcedureBuilder):
         self._name = name
         self._output_params = output_params
         self._language_name = language_name
+        self._rows_per_read = rows_per_read
+        self._parallel = parallel
+        self._partition_text = partition_text(partition_by, order_by)
 
         # Get function text and escape single quotes
-        function_text = textwrap.dedent(inspect.getsource(self._func)).replace("'","''")
+        function_text = get_function_text(self._func).replace("'","''")
 
         # Get function arguments and type annotations
         argspec = inspect.getfullargspec(self._func)
@@ -1,18 +1,31 @@
 # Copyright(c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-import dill
+import inspect
 import sys
+import warnings
 
 from typing import Callable
-from pandas import DataFrame
+from pandas import DataFrame, concat, notna
 
+from . import instrumentation, querycache
 from .connectioninfo import ConnectionInfo
-from .sqlqueryexecutor import execute_query, execute_raw_query
+from .sqlqueryexecutor import SQLQueryExecutor, execute_query, execute_raw_query, iter_raw_query
 from .sqlbuilder import SpeesBuilder, SpeesBuilderFromFunction, StoredProcedureBuilder, \
     ExecuteStoredProcedureBuilder, DropStoredProcedureBuilder
-from .sqlbuilder import StoredProcedureBuilderFromFunction
+from .sqlbuilder import StoredProcedureBuilderFromFunction, SpeesBuilderFromFunctionWithResultSet, \
+    SpeesBuilderFromFunctionBatch
 from .sqlbuilder import RETURN_COLUMN_NAME, STDOUT_COLUMN_NAME, STDERR_COLUMN_NAME
+from .serialization import AUTO, loads_result
+from .dataframewriter import APPEND, write_dataframe, input_table_query, upload_input_dataframe, \
+    DropInputTableBuilder
+from .arrowbuilder import PANDAS, ARROW, ARROW_STREAM, check_result_format, record_batch_reader
+from .resultsets import ResultSets
+from .functionregistry import RegisteredFunction, RegisterFunctionBuilder, UnregisterFunctionBuilder, \
+    SpeesBuilderFromRegisteredFunction
+from .taskqueue import TaskQueue
+from .connectionpool import get_pool
+from .mapreduce import split_points_query, range_queries, run_ranges
 
 
 class SQLPythonExecutor:
@@ -26,19 +39,68 @@ class SQLPythonExecutor:
         self._connection_info = connection_info
         self._language_name = language_name
 
+    @instrumentation.instrumented
     def execute_function_in_sql(self,
                                 func: Callable, *args,
                                 input_data_query: str = "",
+                                input_df: DataFrame = None,
+                                compression: str = AUTO,
+                                result_schema = None,
+                                rows_per_read: int = None,
+                                parallel: bool = False,
+                                partition_by = None,
+                                order_by = None,
+                                output_capture = None,
+                                server_workers: int = None,
+                                server_reduce: Callable = None,
+                                timeout: int = None,
+                                func_kwargs: dict = None,
                                 **kwargs):
         """Execute a function in SQL Server.
 
+        The keyword arguments named after the parameters below (timeout, compression, output_capture...) are options
+        of this call and are not passed to func. Keyword arguments of func with one of these names go in
+        func_kwargs.
+
         :param func: function to execute_function_in_sql. NOTE: This function is shipped to SQL as text.
         Functions should be self contained and import statements should be inline.
         :param args: positional args to pass to function to execute_function_in_sql.
         :param input_data_query: sql query to fill the first argument of the function. The argument gets the result of
         the query as a pandas DataFrame (uses the @input_data_1 parameter in sp_execute_external_script)
+        :param input_df: DataFrame from the client to fill the first argument of the function, instead of
+        input_data_query. It is bulk loaded into a session temp table with fast_executemany, on the connection
+        that then runs the function. The index of the DataFrame is not sent.
+        :param compression: codec used to compress the returned value on the server: "zlib", "lz4" or "zstd"
+        (lz4 and zstandard must be installed on the server and the client), None for no compression,
+        or "auto" (default) to compress with zlib only when the pickled result is 1 MB or larger.
+        :param result_schema: for functions returning a DataFrame, the columns of that DataFrame: a dictionary of
+        column name to Python type, dtype or SQL type name (e.g. {"id": int, "score": "float"}), or a sample
+        DataFrame whose dtypes are used. The DataFrame is then returned as a typed result set instead of a pickle.
+        :param rows_per_read: stream the result of input_data_query to the function in batches of this many rows
+        (@r_rowsPerRead). The function is called once per batch, so the input DataFrame never has to fit in memory.
+        :param parallel: let SQL Server call the function in parallel on partitions of the result of input_data_query
+        (@parallel = 1); only useful when the query itself gets a parallel plan.
+        :param partition_by: column name or list of column names of the result of input_data_query. The function is
+        called once per partition with the rows of that partition (@input_data_1_partition_by_columns); combine with
+        parallel=True to process the partitions in parallel.
+        :param order_by: column name or list of column names ordering the rows within each partition
+        (@input_data_1_order_by_columns)
+        :param output_capture: how the stdout and stderr of func are returned: None to return and print them in
+        full, False to discard them, or an OutputCapture (see sqlmlutils.outputcapture) keeping at most max_chars
+        characters or streaming the output as log lines printed while they are fetched
+        :param server_workers: split the result of input_data_query into this many chunks of rows and call the
+        function on every chunk in a pool of as many worker processes on the server, so CPU bound functions use
+        several cores in one call. The function and its arguments must be picklable with dill, and what the worker
+        processes print is not returned.
+        :param server_reduce: with server_workers, function combining the list of the values returned for each
+        chunk, run on the server. By default DataFrames are concatenated and other values returned as a list.
+        :param timeout: seconds the call may run before it is cancelled on the server and QueryTimeoutError is
+        raised; defaults to the query_timeout of the ConnectionInfo
+        :param func_kwargs: keyword arguments to pass to func, for names that are taken by the options above
         :param kwargs: keyword arguments to pass to function to execute_function_in_sql.
-        :return: value returned by func
+        :return: value returned by func. With rows_per_read, parallel or partition_by, a list of the values returned
+        by each call; if every call returned a DataFrame with partition_by, the DataFrames concatenated.
+        (With result_schema, the DataFrames returned by each call are always concatenated by SQL Server).
 
         >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
         >>>
@@ -53,29 +115,358 @@ class SQLPythonExecutor:
         >>> print(ret)
         [0.28366218546322625, 0.28366218546322625]
         """
-        df, _ = execute_query(SpeesBuilderFromFunction(func, 
-                                                    self._language_name, 
-                                                    input_data_query, 
-                                                    *args, 
-                                                    **kwargs), 
-                            self._connection_info)
-                            
-        results, output, error = self._get_results(df)
+        kwargs = self._function_kwargs(self.execute_function_in_sql, func, func_kwargs, kwargs, dict(
+            input_data_query=input_data_query, input_df=input_df, compression=compression, result_schema=result_schema,
+            rows_per_read=rows_per_read, parallel=parallel, partition_by=partition_by, order_by=order_by,
+            output_capture=output_capture, server_workers=server_workers, server_reduce=server_reduce,
+            timeout=timeout))
+
+        if input_df is not None:
+            if input_data_query:
+                raise ValueError("input_data_query and input_df cannot be combined")
+            input_data_query = input_table_query(input_df)
+
+        if result_schema is not None:
+            with instrumentation.phase(instrumentation.BUILD):
+                builder = SpeesBuilderFromFunctionWithResultSet(func,
+                                                                self._language_name,
+                                                                input_data_query,
+                                                                *args,
+                                                                result_schema=result_schema,
+                                                                rows_per_read=rows_per_read,
+                                                                parallel=parallel,
+                                                                partition_by=partition_by,
+                                                                order_by=order_by,
+                                                                output_capture=output_capture,
+                                                                server_workers=server_workers,
+                                                                server_reduce=server_reduce,
+                                                                **kwargs)
+            # stdout and stderr come back in the second result set and are printed by execute_query
+            df, _ = self._execute_function_query(builder, input_df, timeout)
+            return df
+
+        with instrumentation.phase(instrumentation.BUILD):
+            builder = SpeesBuilderFromFunction(func, 
+                                               self._language_name, 
+                                               input_data_query, 
+                                               *args, 
+                                               compression=compression,
+                                               rows_per_read=rows_per_read,
+                                               parallel=parallel,
+                                               partition_by=partition_by,
+                                               order_by=order_by,
+                                               output_capture=output_capture,
+                                               server_workers=server_workers,
+                                               server_reduce=server_reduce,
+                                               **kwargs)
+        df, _ = self._execute_function_query(builder, input_df, timeout)
+
+        results = self._print_and_get_results(df, chunked=rows_per_read is not None or parallel or bool(partition_by))
+        return self._concat_partitions(results) if partition_by else results
+
+    # Runs the SPEES of a function, after loading input_df into the temp table read by its input query on the same
+    # connection
+    def _execute_function_query(self, builder: SpeesBuilderFromFunction, input_df: DataFrame, timeout: int):
+        if input_df is None:
+            return execute_query(builder, self._connection_info, timeout=timeout)
+        with SQLQueryExecutor(self._connection_info, timeout=timeout) as executor:
+            try:
+                upload_input_dataframe(executor, input_df)
+                result = executor.execute(builder)
+            except Exception:
+                # Do not leave the uploaded rows in the session; a failing drop must not hide the original error
+                try:
+                    executor.execute(DropInputTableBuilder())
+                except Exception:
+                    pass
+                raise
+            executor.execute(DropInputTableBuilder())
+        return result
+
+    # Keyword arguments of func: kwargs and func_kwargs. Warns when func takes a parameter with the name of one of the
+    # options of method that was set, since that value goes to the option and not to func.
+    @staticmethod
+    def _function_kwargs(method: Callable, func: Callable, func_kwargs: dict, kwargs: dict, options: dict) -> dict:
+        try:
+            func_parameters = inspect.signature(func).parameters
+        except (TypeError, ValueError):
+            func_parameters = {}
+        method_parameters = inspect.signature(method).parameters
+        shadowed = [name for name, value in options.items()
+                    if name in func_parameters and name not in (func_kwargs or {})
+                    and value is not method_parameters[name].default]
+        if shadowed:
+            warnings.warn("{names} of {method} {verb} not passed to {func}; pass {func} arguments with these names "
+                          "in func_kwargs".format(names=", ".join(shadowed), method=method.__name__,
+                                                  verb="is" if len(shadowed) == 1 else "are", func=func.__name__),
+                          stacklevel=4)
+        return dict(kwargs, **func_kwargs) if func_kwargs else kwargs
+
+    @instrumentation.instrumented
+    def execute_function_batch(self,
+                               func: Callable,
+                               arg_list,
+                               input_data_query: str = "",
+                               compression: str = AUTO,
+                               output_capture = None,
+                               return_exceptions: bool = True,
+                               server_workers: int = None,
+                               timeout: int = None,
+                               func_kwargs: dict = None,
+                               **kwargs) -> list:
+        """Call a function in SQL Server once per argument set, in a single launch of the external runtime.
+
+        Every execute_function_in_sql call starts the external runtime and imports pandas and dill again. For many
+        short calls, such as a parameter sweep, that start-up dominates; here it is paid once for the whole list.
+
+        :param func: function to execute. NOTE: This function is shipped to SQL as text.
+        :param arg_list: argument sets, one per call: a tuple of positional arguments, a dictionary of keyword
+        arguments, or any other value as the only positional argument
+        :param input_data_query: sql query whose result is passed as a DataFrame to every call, as first argument.
+        The query runs once for the whole batch.
+        :param compression: codec used to compress the returned list, see execute_function_in_sql
+        :param output_capture: how the stdout and stderr of the calls are returned, see execute_function_in_sql
+        :param return_exceptions: if True, the exception raised by a call is returned in place of its result;
+        if False, the first exception is raised once the batch is done. The traceback of each failed call is
+        printed to stderr.
+        :param server_workers: run the calls in a pool of this many worker processes on the server instead of one
+        after the other. The input data is pickled for every call, and what the calls print is not returned.
+        :param timeout: seconds the whole batch may run before it is cancelled on the server and QueryTimeoutError
+        is raised; defaults to the query_timeout of the ConnectionInfo
+        :param func_kwargs: keyword arguments passed to every call, for names that are taken by the options above
+        :param kwargs: keyword arguments passed to every call
+        :return: list of the values returned by each call, in the order of arg_list
 
-        if output is not None: 
-            print(output)
-        if error is not None:
-            print(error, file=sys.stderr)
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>>
+        >>> def fit(data, alpha, l1_ratio=0.5):
+        >>>     from sklearn.linear_model import ElasticNet
+        >>>     return ElasticNet(alpha=alpha, l1_ratio=l1_ratio).fit(data[["DayOfWeek"]], data["ArrDelay"]).score(
+        >>>         data[["DayOfWeek"]], data["ArrDelay"])
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> scores = sqlpy.execute_function_batch(fit, [0.01, 0.1, (1.0, 0.2), {"alpha": 10.0}],
+        >>>                                       input_data_query="SELECT * FROM airline5000")
+        """
+        kwargs = self._function_kwargs(self.execute_function_batch, func, func_kwargs, kwargs, dict(
+            input_data_query=input_data_query, compression=compression, output_capture=output_capture,
+            return_exceptions=return_exceptions, server_workers=server_workers, timeout=timeout))
+
+        with instrumentation.phase(instrumentation.BUILD):
+            builder = SpeesBuilderFromFunctionBatch(func,
+                                                    self._language_name,
+                                                    input_data_query,
+                                                    arg_list,
+                                                    compression=compression,
+                                                    output_capture=output_capture,
+                                                    server_workers=server_workers,
+                                                    **kwargs)
+        df, _ = execute_query(builder, self._connection_info, timeout=timeout)
+        results = self._print_and_get_results(df)
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
         return results
 
+    @instrumentation.instrumented
+    def map_reduce_in_sql(self,
+                          map_func: Callable,
+                          reduce_func: Callable,
+                          table: str,
+                          key_column: str,
+                          *args,
+                          splits: int = 4,
+                          columns = None,
+                          max_workers: int = None,
+                          retries: int = 2,
+                          reduce_in_sql: bool = False,
+                          timeout: int = None,
+                          func_kwargs: dict = None,
+                          **kwargs):
+        """Run a function over a large table in key ranges processed concurrently, then combine the results.
+
+        The table is split into splits ranges of about the same number of rows on key_column (with NTILE). map_func
+        is called in SQL Server once per range, with the rows of the range as first argument like with
+        input_data_query; the calls run at the same time, each on its own pooled connection, so no single call has
+        to hold the whole table in memory. A range whose call fails is retried on its own.
+
+        :param map_func: function called with the DataFrame of a range. NOTE: This function is shipped to SQL as
+        text, see execute_function_in_sql.
+        :param reduce_func: function called with the list of the values returned by map_func, in key order
+        :param table: name of the table, optionally schema qualified
+        :param key_column: column the ranges are taken on, ideally the leading column of an index
+        :param args: positional arguments passed to map_func after the DataFrame
+        :param splits: number of ranges; there are fewer if key_column has fewer distinct values
+        :param columns: column name or list of column names passed to map_func, None for all columns
+        :param max_workers: maximum number of ranges processed at the same time, defaults to splits. With
+        connection pooling it is capped at the max_size of the pool (see connectionpool.configure_pool).
+        :param retries: number of times the call of a failed range is retried before its error is raised
+        :param reduce_in_sql: run reduce_func in SQL Server instead of on the client
+        :param timeout: seconds each call may run before it is cancelled, see execute_function_in_sql
+        :param func_kwargs: keyword arguments passed to map_func, for names that are taken by the options above
+        :param kwargs: keyword arguments passed to map_func
+        :return: value returned by reduce_func
+
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>>
+        >>> def delay_stats(df):
+        >>>     return df["ArrDelay"].agg(["sum", "count"])
+        >>>
+        >>> def mean_delay(stats):
+        >>>     return sum(s["sum"] for s in stats) / sum(s["count"] for s in stats)
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> mean = sqlpy.map_reduce_in_sql(delay_stats, mean_delay, "airline5000", "id", splits=8)
+        """
+        kwargs = self._function_kwargs(self.map_reduce_in_sql, map_func, func_kwargs, kwargs, dict(
+            splits=splits, columns=columns, max_workers=max_workers, retries=retries, reduce_in_sql=reduce_in_sql,
+            timeout=timeout))
+        if splits < 1:
+            raise ValueError("splits must be at least 1")
+        if retries < 0:
+            raise ValueError("retries cannot be negative")
+
+        bounds = self.execute_sql_query(split_points_query(table, key_column, splits), timeout=timeout)
+        upper_bounds = bounds.iloc[:, 0].dropna().tolist() if len(bounds.columns) else []
+        queries = range_queries(table, key_column, upper_bounds, columns)
+
+        if max_workers is None:
+            max_workers = len(queries)
+        elif max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if self._connection_info.pooling:
+            max_workers = min(max_workers, get_pool(self._connection_info).max_size)
+
+        def map_range(query):
+            return self.execute_function_in_sql(map_func, *args, input_data_query=query, timeout=timeout,
+                                                func_kwargs=kwargs)
+
+        partials = run_ranges(map_range, queries, max_workers, retries)
+        if reduce_in_sql:
+            return self.execute_function_in_sql(reduce_func, partials, timeout=timeout)
+        return reduce_func(partials)
+
+    @instrumentation.instrumented
+    def register_function(self, func: Callable) -> RegisteredFunction:
+        """Store a function on the server so that it can be called without sending its source every time.
+
+        The function source and the values of the variables it closes over are saved in the sqlmlutils_functions
+        table (created if needed), keyed by a hash of their content. Calling the returned handle only sends that
+        hash and the arguments.
+
+        :param func: function to register. As with execute_function_in_sql, it should be self contained
+        and import statements should be inline.
+        :return: RegisteredFunction handle; call it with the same arguments as execute_function_in_sql
+
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>>
+        >>> def foo(val1, val2):
+        >>>     import math
+        >>>     return math.cos(val1) + val2
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> remote_foo = sqlpy.register_function(foo)
+        >>> results = [remote_foo(i, val2=1) for i in range(100)]
+        >>> sqlpy.unregister_function(remote_foo)
+        """
+        builder = RegisterFunctionBuilder(func)
+        execute_query(builder, self._connection_info)
+        return RegisteredFunction(self, builder.hash, func.__name__)
+
+    @instrumentation.instrumented
+    def unregister_function(self, handle: RegisteredFunction):
+        """Remove a function stored with register_function from the server.
+
+        :param handle: handle returned by register_function
+        :return: None
+        """
+        execute_query(UnregisterFunctionBuilder(handle.hash), self._connection_info)
+
+    @instrumentation.instrumented
+    def execute_registered_function(self,
+                                    handle: RegisteredFunction, *args,
+                                    input_data_query: str = "",
+                                    compression: str = AUTO,
+                                    rows_per_read: int = None,
+                                    parallel: bool = False,
+                                    partition_by = None,
+                                    order_by = None,
+                                    output_capture = None,
+                                    timeout: int = None,
+                                    func_kwargs: dict = None,
+                                    **kwargs):
+        """Execute a function stored with register_function in SQL Server.
+
+        :param handle: handle returned by register_function
+        See execute_function_in_sql for the other parameters.
+        :return: value returned by the function
+        """
+        if func_kwargs:
+            kwargs = dict(kwargs, **func_kwargs)
+        with instrumentation.phase(instrumentation.BUILD):
+            builder = SpeesBuilderFromRegisteredFunction(handle.hash,
+                                                         self._language_name,
+                                                         input_data_query,
+                                                         *args,
+                                                         compression=compression,
+                                                         rows_per_read=rows_per_read,
+                                                         parallel=parallel,
+                                                         partition_by=partition_by,
+                                                         order_by=order_by,
+                                                         output_capture=output_capture,
+                                                         **kwargs)
+        df, _ = execute_query(builder, self._connection_info, timeout=timeout)
+        results = self._print_and_get_results(df, chunked=rows_per_read is not None or parallel or bool(partition_by))
+        return self._concat_partitions(results) if partition_by else results
+
+    def task_queue(self, name: str = "default", worker_connection: ConnectionInfo = None) -> TaskQueue:
+        """Get a queue of function calls executed by long-lived workers inside SQL Server.
+
+        Workers started with start_workers run in one sp_execute_external_script call each and take tasks from the
+        queue until it stays empty for idle_timeout seconds, so a steady stream of small calls pays the launch of the
+        runtime and the imports once per worker. Functions are registered on the server (see register_function)
+        and tasks only carry their hash and arguments. The workers connect back to the database with pyodbc, which
+        must be installed on the server.
+
+        :param name: name of the queue; workers only take the tasks of their queue
+        :param worker_connection: ConnectionInfo the workers use to reach the database from the server, defaults
+        to the ConnectionInfo of this executor
+        :return: TaskQueue to submit tasks to, start workers and collect results
+
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>>
+        >>> def score(x):
+        >>>     return x * 2
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> queue = sqlpy.task_queue("scoring")
+        >>> queue.start_workers(count=2, idle_timeout=300)
+        >>> task_ids = queue.map(score, range(1000))
+        >>> scores = queue.results(task_ids)
+        """
+        return TaskQueue(self, self._connection_info, name, worker_connection=worker_connection,
+                         language_name=self._language_name)
+
+    @instrumentation.instrumented
     def execute_script_in_sql(self,
                               path_to_script: str,
-                              input_data_query: str = ""):
+                              input_data_query: str = "",
+                              rows_per_read: int = None,
+                              parallel: bool = False,
+                              output_capture = None,
+                              timeout: int = None):
         """Execute a script in SQL Server.
 
         :param path_to_script: file path to Python script to execute.
         :param input_data_query: sql query to fill InputDataSet global variable with.
         (@input_data_1 parameter in sp_execute_external_script)
+        :param rows_per_read: stream the result of input_data_query to the script in batches of this many rows;
+        the script runs once per batch
+        :param parallel: let SQL Server run the script in parallel on partitions of the result of input_data_query
+        :param output_capture: how the stdout and stderr of the script are returned, see execute_function_in_sql
+        :param timeout: seconds the call may run before it is cancelled on the server and QueryTimeoutError is
+        raised; defaults to the query_timeout of the ConnectionInfo
         :return: None
 
         """
@@ -84,21 +475,144 @@ class SQLPythonExecutor:
                 content = script_file.read()
         except FileNotFoundError:
             raise FileNotFoundError("File does not exist!")
-        execute_query(SpeesBuilder(content, input_data_query=input_data_query, language_name=self._language_name), connection=self._connection_info)
+        execute_query(SpeesBuilder(content, input_data_query=input_data_query, language_name=self._language_name,
+                                   rows_per_read=rows_per_read, parallel=parallel, output_capture=output_capture),
+                      connection=self._connection_info, timeout=timeout)
 
+    @instrumentation.instrumented
     def execute_sql_query(self,
                           sql_query: str,
-                          params = ()):
+                          params = (),
+                          cache: bool = False,
+                          result_format: str = PANDAS,
+                          timeout: int = None):
         """Execute a sql query in SQL Server.
 
         :param sql_query: the sql query to execute in the server
+        :param cache: serve the result from the client side cache when the same query was run with the same params
+        less than the cache ttl ago (see sqlmlutils.querycache); only for queries that do not modify data
+        :param result_format: "pandas" (default) for a DataFrame, "arrow" for a pyarrow.Table, "arrow_stream" for a
+        pyarrow.RecordBatchReader streaming the table in batches, or "pandas_arrow" for a DataFrame whose columns are
+        backed by Arrow memory (pandas.ArrowDtype). The Arrow formats need pyarrow; Arrow strings and nullable
+        columns take far less memory than object columns, and Arrow tables can be written to Parquet or passed to
+        Polars as they are.
+        :param timeout: seconds the call may run before it is cancelled on the server and QueryTimeoutError is
+        raised; defaults to the query_timeout of the ConnectionInfo
         :return: table returned by the sql_query
+
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>> import pyarrow.parquet as pq
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> table = sqlpy.execute_sql_query("SELECT * FROM airline5000", result_format="arrow")
+        >>> pq.write_table(table, "airline5000.parquet")
+        """
+        check_result_format(result_format)
+        if result_format == ARROW_STREAM:
+            if cache:
+                raise ValueError("Streamed results cannot be cached")
+            return record_batch_reader(iter_raw_query(conn=self._connection_info, query=sql_query, params=params,
+                                                      result_format=ARROW, timeout=timeout))
+        if cache and result_format != PANDAS:
+            raise ValueError("Only pandas results can be cached")
+        return self._execute_sql_query(sql_query, params, cache, result_format=result_format, timeout=timeout)
+
+    def _execute_sql_query(self, sql_query: str, params = (), cache: bool = False, tag: str = None,
+                           result_format: str = PANDAS, timeout: int = None):
+        def load():
+            df, _ = execute_raw_query(conn=self._connection_info, query=sql_query, params=params,
+                                      result_format=result_format, timeout=timeout)
+            return df
+
+        if cache:
+            return querycache.get_cache().get_or_load(self._connection_info, sql_query, params, load, tag=tag)
+        return load()
+
+    @instrumentation.instrumented
+    def execute_sql_query_multi(self,
+                                sql_query: str,
+                                params = (),
+                                timeout: int = None) -> ResultSets:
+        """Execute a batch returning several tables in SQL Server, in one round trip.
+
+        :param sql_query: the sql batch to execute in the server
+        :param timeout: seconds the call may run before it is cancelled on the server and QueryTimeoutError is
+        raised; defaults to the query_timeout of the ConnectionInfo
+        :return: lazy sequence of every table returned by the batch. Each table is only fetched when it is used,
+        with fetch() as a DataFrame or with iter_chunks() in chunks. The connection is held until the last table
+        has been reached or the sequence is closed.
+
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> with sqlpy.execute_sql_query_multi("SELECT * FROM features; SELECT * FROM labels") as results:
+        >>>     features, labels = results.fetch_all()
+        """
+        return ResultSets(self._connection_info, sql_query, params, timeout=timeout)
+
+    def iter_sql_query(self,
+                       sql_query: str,
+                       params = (),
+                       chunksize: int = 10000,
+                       arraysize: int = None,
+                       timeout: int = None):
+        """Execute a sql query in SQL Server and stream the resulting table in chunks.
+
+        :param sql_query: the sql query to execute in the server
+        :param chunksize: maximum number of rows in each returned DataFrame
+        :param arraysize: number of rows pyodbc fetches per round trip (cursor.arraysize), defaults to chunksize
+        :param timeout: seconds the call may run before it is cancelled on the server and QueryTimeoutError is
+        raised; defaults to the query_timeout of the ConnectionInfo
+        :return: generator of DataFrames holding consecutive rows of the table returned by the sql_query.
+        The connection is held until the generator is exhausted or closed.
+
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> for chunk in sqlpy.iter_sql_query("SELECT * FROM airline5000", chunksize=1000):
+        >>>     print(chunk.shape)
         """
-        df, _ = execute_raw_query(conn=self._connection_info, query=sql_query, params=params)
-        return df
+        return iter_raw_query(conn=self._connection_info, query=sql_query, params=params,
+                              chunksize=chunksize, arraysize=arraysize, timeout=timeout)
+
+    @instrumentation.instrumented
+    def write_dataframe(self,
+                        df: DataFrame,
+                        table: str,
+                        mode: str = APPEND,
+                        chunksize: int = 10000,
+                        keys = None) -> int:
+        """Write the rows of a DataFrame to a table in SQL Server.
+
+        The table is created from the DataFrame dtypes if it does not exist. Rows are sent with fast_executemany
+        as arrays of typed parameters, in one transaction.
+
+        :param df: DataFrame to write; its column names are the column names of the table
+        :param table: name of the table, optionally schema qualified (e.g. "dbo.scores")
+        :param mode: "append" to insert the rows, "replace" to drop and recreate the table first, or "upsert" to
+        update the rows whose keys exist in the table and insert the others (through a staging table and MERGE)
+        :param chunksize: number of rows sent per round trip
+        :param keys: column name or list of column names identifying a row, required for "upsert"
+        :return: number of rows written
 
+        >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+        >>> from pandas import DataFrame
+        >>>
+        >>> sqlpy = SQLPythonExecutor(ConnectionInfo("localhost", database="AirlineTestDB"))
+        >>> scores = DataFrame({"id": [1, 2, 3], "score": [0.1, 0.5, 0.9]})
+        >>> sqlpy.write_dataframe(scores, "dbo.scores", mode="upsert", keys="id")
+        3
+        """
+        try:
+            return write_dataframe(self._connection_info, df, table, mode=mode, chunksize=chunksize, keys=keys)
+        finally:
+            querycache.invalidate(self._connection_info)
+
+    @instrumentation.instrumented
     def create_sproc_from_function(self, name: str, func: Callable,
-                                   input_params: dict = None, output_params: dict = None):
+                                   input_params: dict = None, output_params: dict = None,
+                                   rows_per_read: int = None, parallel: bool = False,
+                                   partition_by = None, order_by = None, output_capture = None):
         """Create a SQL Server stored procedure based on a Python function.
         NOTE: Type annotations are needed either in the function definition or in the input_params dictionary
         WARNING: Output parameters can be used when creating the stored procedure, but Stored Procedures with
@@ -111,6 +625,14 @@ class SQLPythonExecutor:
         :param input_params: optional dictionary of type annotations for each argument to func;
         if func has type annotations this is not necessary. If both are provided, they must match
         :param output_params optional dictionary of type annotations for each output parameter
+        :param rows_per_read: the procedure streams its input DataFrame to func in batches of this many rows,
+        calling func once per batch
+        :param parallel: the procedure lets SQL Server call func in parallel on partitions of its input DataFrame
+        :param partition_by: column name(s) of the input DataFrame; the procedure calls func once per partition and
+        returns the concatenated output DataFrames
+        :param order_by: column name(s) ordering the rows within each partition
+        :param output_capture: None to return stdout and stderr in full, False to discard them, or an OutputCapture
+        limiting them to max_chars characters (stored procedures cannot stream their output)
         :return: True if creation succeeded
 
         >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
@@ -147,18 +669,33 @@ class SQLPythonExecutor:
                                                         func=func,
                                                         input_params=in_copy,
                                                         output_params=out_copy, 
-                                                        language_name=self._language_name), 
+                                                        language_name=self._language_name,
+                                                        rows_per_read=rows_per_read,
+                                                        parallel=parallel,
+                                                        partition_by=partition_by,
+                                                        order_by=order_by,
+                                                        output_capture=output_capture),
                         self._connection_info)
+        querycache.invalidate(self._connection_info, querycache.SPROC_TAG)
         return True
 
+    @instrumentation.instrumented
     def create_sproc_from_script(self, name: str, path_to_script: str,
-                                 input_params: dict = None, output_params: dict = None):
+                                 input_params: dict = None, output_params: dict = None,
+                                 rows_per_read: int = None, parallel: bool = False,
+                                 partition_by = None, order_by = None, output_capture = None):
         """Create a SQL Server stored procedure based on a Python script
 
         :param name: name of stored procedure.
         :param path_to_script: file path to Python script to create a sproc from.
         :param input_params: optional dictionary of type annotations for inputs in the script
         :param output_params optional dictionary of type annotations for each output variable
+        :param rows_per_read: the procedure streams its input DataFrame to the script in batches of this many rows
+        :param parallel: the procedure lets SQL Server run the script in parallel on partitions of its input DataFrame
+        :param partition_by: column name(s) of the input DataFrame; the procedure runs the script once per partition
+        :param order_by: column name(s) ordering the rows within each partition
+        :param output_capture: None to return stdout and stderr in full, False to discard them, or an OutputCapture
+        limiting them to max_chars characters (stored procedures cannot stream their output)
         :return: True if creation succeeded
 
         >>> from sqlmlutils import ConnectionInfo, SQLPythonExecutor
@@ -194,10 +731,17 @@ class SQLPythonExecutor:
                                             script=content, 
                                             input_params=in_copy,
                                             output_params=out_copy, 
-                                            language_name=self._language_name),
+                                            language_name=self._language_name,
+                                            rows_per_read=rows_per_read,
+                                            parallel=parallel,
+                                            partition_by=partition_by,
+                                            order_by=order_by,
+                                            output_capture=output_capture),
                         self._connection_info)
+        querycache.invalidate(self._connection_info, querycache.SPROC_TAG)
         return True
 
+    @instrumentation.instrumented
     def check_sproc(self, name: str) -> bool:
         """Check to see if a SQL Server stored procedure exists in the database.
 
@@ -213,28 +757,47 @@ class SQLPythonExecutor:
         :return: boolean whether the Stored Procedure exists in the database
         """
         check_query = "SELECT OBJECT_ID (?, N'P')"
-        rows = execute_raw_query(conn=self._connection_info, query=check_query, params=name)[0]
-        return rows.loc[0].iloc[0] is not None
-
-    def execute_sproc(self, name: str, output_params: dict = None, **kwargs) -> DataFrame:
+        rows = self._execute_sql_query(check_query, name, cache=querycache.cache_metadata(),
+                                       tag=querycache.SPROC_TAG)
+        # OBJECT_ID is NULL for a missing procedure, which comes back as a missing value (None or pd.NA)
+        return bool(notna(rows.loc[0].iloc[0]))
+
+    @instrumentation.instrumented
+    def execute_sproc(self, name: str, output_params: dict = None, all_result_sets: bool = False,
+                      result_format: str = PANDAS, timeout: int = None, **kwargs) -> DataFrame:
         """Call a stored procedure on a SQL Server database.
         WARNING: Output parameters can be used when creating the stored procedure, but Stored Procedures with
         output parameters other than a single DataFrame cannot be executed with sqlmlutils
 
         :param name: name of stored procedure
         :param output_params: output parameters (if any) for the stored procedure
+        :param all_result_sets: return every result set of the stored procedure instead of the first one
+        :param result_format: "pandas" (default), "arrow" or "pandas_arrow", see execute_sql_query
+        :param timeout: seconds the call may run before it is cancelled on the server and QueryTimeoutError is
+        raised; defaults to the query_timeout of the ConnectionInfo
         :param kwargs: keyword arguments to pass to stored procedure
         :return: tuple with a DataFrame representing the output data set of the stored procedure 
-                 and a dictionary of output parameters
+                 and a dictionary of output parameters.
+                 With all_result_sets, a lazy sequence of the result sets (see execute_sql_query_multi) whose
+                 output_params holds the output parameters once every result set has been reached.
         """
         
         # We modify output_params because we add stdout and stderr as output params. 
         # We copy here to avoid modifying the underlying contents.
         #
         out_copy = output_params.copy() if output_params is not None else None
-        return execute_query(ExecuteStoredProcedureBuilder(name, out_copy, **kwargs), 
-                            self._connection_info)
-
+        check_result_format(result_format)
+        if result_format == ARROW_STREAM:
+            raise ValueError("execute_sproc cannot stream its result, use result_format=\"arrow\"")
+        builder = ExecuteStoredProcedureBuilder(name, out_copy, **kwargs)
+        if all_result_sets:
+            if result_format != PANDAS:
+                raise ValueError("all_result_sets only returns pandas result sets")
+            return ResultSets(self._connection_info, builder.base_script, builder.params, output=True,
+                              timeout=timeout)
+        return execute_query(builder, self._connection_info, result_format=result_format, timeout=timeout)
+
+    @instrumentation.instrumented
     def drop_sproc(self, name: str):
         """Drop a SQL Server stored procedure if it exists.
 
@@ -243,10 +806,37 @@ class SQLPythonExecutor:
         """
         if self.check_sproc(name):
             execute_query(DropStoredProcedureBuilder(name), self._connection_info)
+            querycache.invalidate(self._connection_info, querycache.SPROC_TAG)
+
+    def _print_and_get_results(self, df: DataFrame, chunked: bool = False):
+        results, output, error = self._get_results(df, chunked)
+
+        if output is not None: 
+            print(output)
+        if error is not None:
+            print(error, file=sys.stderr)
+        return results
+
+    @staticmethod
+    def _concat_partitions(results: list):
+        if len(results) > 0 and all(isinstance(result, DataFrame) for result in results):
+            return concat(results, ignore_index=True)
+        return results
 
     @staticmethod
-    def _get_results(df : DataFrame):
-        hexstring = df[RETURN_COLUMN_NAME][0]
-        stdout_string = df[STDOUT_COLUMN_NAME][0]
-        stderr_string = df[STDERR_COLUMN_NAME][0]
-        return dill.loads(bytes.fromhex(hexstring)), stdout_string, stderr_string
+    def _get_results(df : DataFrame, chunked: bool = False):
+        with instrumentation.phase(instrumentation.DESERIALIZE):
+            if chunked:
+                # One row per call of the function: per batch of rows, per partition or per parallel process
+                payloads = list(df[RETURN_COLUMN_NAME])
+                instrumentation.record(result_bytes=sum(len(payload) for payload in payloads))
+                results = [loads_result(payload) for payload in payloads]
+                stdout_string = "".join(out for out in df[STDOUT_COLUMN_NAME] if isinstance(out, str))
+                stderr_string = "".join(err for err in df[STDERR_COLUMN_NAME] if isinstance(err, str))
+                return results, stdout_string, stderr_string
+
+            payload = df[RETURN_COLUMN_NAME][0]
+            instrumentation.record(result_bytes=len(payload))
+            stdout_string = df[STDOUT_COLUMN_NAME][0]
+            stderr_string = df[STDERR_COLUMN_NAME][0]
+            return loads_result(payload), stdout_string, stderr_string
@@ -1,12 +1,21 @@
 # Copyright(c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+import math
 import pyodbc
 import sys
+import threading
 
+from contextlib import contextmanager
 from pandas import DataFrame
 
+from . import instrumentation
+from .arrowbuilder import PANDAS, PANDAS_ARROW, ARROW, build_record_batch, build_table, empty_table, arrow_schema, \
+    to_pandas
 from .connectioninfo import ConnectionInfo
+from .connectionpool import ConnectionPool, connect, get_pool
+from .dataframebuilder import build_dataframe
+from .outputcapture import is_log_result_set
 from .sqlbuilder import SQLBuilder
 from .sqlbuilder import STDOUT_COLUMN_NAME, STDERR_COLUMN_NAME
 
@@ -16,17 +25,113 @@ It is mostly setup to work with SQLBuilder objects as defined in sqlbuilder.
 """
 
 
+_local = threading.local()
+
+# SQLSTATEs of a statement stopped by the query timeout and by cursor.cancel()
+_TIMEOUT_SQLSTATE = "HYT00"
+_CANCELLED_SQLSTATE = "HY008"
+
+
+class QueryCancelledError(RuntimeError):
+    """Raised when a query is cancelled with a CancellationToken. The connection it ran on is discarded."""
+
+
+class QueryTimeoutError(QueryCancelledError, TimeoutError):
+    """Raised when a connection is not opened within its login timeout, or a statement runs for longer than its
+    timeout and is cancelled on the server. The connection it ran on is discarded.
+    """
+
+
+class CancellationToken:
+    """Cancels the queries executed while the token is active on the current thread.
+
+    Queries started in a `with token:` block register their cursor with the token; token.cancel() (from any thread)
+    sends a cancel request to SQL Server for the running statement, so the call fails instead of running to the end.
+
+    >>> token = CancellationToken()
+    >>> # in a worker thread
+    >>> with token:
+    >>>     sqlpy.execute_function_in_sql(long_running_function)
+    >>> # in another thread
+    >>> token.cancel()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cursors = []
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self):
+        """Cancel the running queries of this token, and any query started with it from now on."""
+        with self._lock:
+            self._cancelled = True
+            cursors = list(self._cursors)
+        for cursor in cursors:
+            _cancel_quietly(cursor)
+
+    def _attach(self, cursor):
+        with self._lock:
+            self._cursors.append(cursor)
+            cancelled = self._cancelled
+        if cancelled:
+            _cancel_quietly(cursor)
+
+    def _detach(self, cursor):
+        with self._lock:
+            if cursor in self._cursors:
+                self._cursors.remove(cursor)
+
+    def __enter__(self):
+        self._previous = getattr(_local, "token", None)
+        _local.token = self
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        _local.token = self._previous
+
+
+def current_cancellation_token():
+    """CancellationToken active on the current thread, if any."""
+    return getattr(_local, "token", None)
+
+
+def _cancel_quietly(cursor):
+    try:
+        cursor.cancel()
+    except pyodbc.Error:
+        pass
+
+
+def _sqlstate(error: Exception) -> str:
+    if isinstance(error, pyodbc.Error) and len(error.args) > 0:
+        return error.args[0]
+    return None
+
+
 # This function is best used to execute_function_in_sql a one off query
-# (the SQL connection is closed after the query completes).
-# If you need to keep the SQL connection open in between queries, you can use the _SQLQueryExecutor class below.
-def execute_query(builder, connection: ConnectionInfo, out_file:str=None):
-    with SQLQueryExecutor(connection=connection) as executor:
-        return executor.execute(builder, out_file=out_file)
+# (the SQL connection is returned to the connection pool after the query completes).
+# If you need to keep the same SQL connection in between queries, you can use the _SQLQueryExecutor class below.
+def execute_query(builder, connection: ConnectionInfo, out_file:str=None, result_format: str = PANDAS,
+                  timeout: int = None):
+    with SQLQueryExecutor(connection=connection, timeout=timeout) as executor:
+        return executor.execute(builder, out_file=out_file, result_format=result_format)
+
 
+def execute_raw_query(conn: ConnectionInfo, query, params=(), result_format: str = PANDAS, timeout: int = None):
+    with SQLQueryExecutor(connection=conn, timeout=timeout) as executor:
+        return executor.execute_query(query, params, result_format=result_format)
 
-def execute_raw_query(conn: ConnectionInfo, query, params=()):
-    with SQLQueryExecutor(connection=conn) as executor:
-        return executor.execute_query(query, params)
+
+# Generator version of execute_raw_query. The connection stays checked out only while the generator is alive.
+def iter_raw_query(conn: ConnectionInfo, query, params=(), chunksize: int = 10000, arraysize: int = None,
+                   result_format: str = PANDAS, timeout: int = None):
+    with SQLQueryExecutor(connection=conn, timeout=timeout) as executor:
+        yield from executor.iter_query(query, params, chunksize=chunksize, arraysize=arraysize,
+                                       result_format=result_format)
 
 class SQLQueryExecutor:
     """_SQLQueryExecutor objects keep a SQL connection open in order to execute_function_in_sql one or more queries.
@@ -34,15 +139,35 @@ class SQLQueryExecutor:
     This class implements the basic context manager paradigm.
     """
 
-    def __init__(self, connection: ConnectionInfo):
+    def __init__(self, connection: ConnectionInfo, timeout: int = None, pool: ConnectionPool = None):
+        """
+        :param connection: ConnectionInfo of the server to connect to
+        :param timeout: seconds each statement may run before it is cancelled on the server and QueryTimeoutError
+        is raised; defaults to connection.query_timeout
+        :param pool: ConnectionPool to take the connection from instead of the shared pool of the connection
+        """
         self._connection = connection
+        self._dedicated_pool = pool
+        self._timeout = timeout if timeout is not None else connection.query_timeout
+        self._token = None
+        self._interrupted = False
+
+    def execute(self, builder: SQLBuilder, out_file=None, result_format: str = PANDAS):
+        instrumentation.record(builder=type(builder).__name__)
+        return self.execute_query(builder.base_script, builder.params, out_file=out_file, result_format=result_format)
 
-    def execute(self, builder: SQLBuilder, out_file=None):
-        return self.execute_query(builder.base_script, builder.params, out_file=out_file)
+    @instrumentation.instrumented
+    def execute_query(self, query, params, out_file=None, result_format: str = PANDAS):
+        """Execute a query and return its first result set and output parameters.
 
-    def execute_query(self, query, params, out_file=None):
-        df = DataFrame()
+        :param result_format: type of the returned result set: "pandas" for a DataFrame, "arrow" for a
+        pyarrow.Table or "pandas_arrow" for a DataFrame backed by Arrow memory (see arrowbuilder)
+        """
+        df = DataFrame() if result_format == PANDAS else None
         output_params = None
+        instrumentation.record(script_bytes=len(query.encode("utf-8")))
+        instrumentation.record_params(params)
+        self._check_cancelled()
 
         try:
             if out_file is not None:
@@ -63,49 +188,255 @@ class SQLQueryExecutor:
                     f.write("GO\n")
                     f.write("-----------------------------")
             else:
-                if params is not None:
-                    self._cursor.execute(query, params)
-                else:
-                    self._cursor.execute(query)
-
-                # Get the first resultset (OutputDataSet)
-                #
-                if self._cursor.description is not None:
-                    column_names = [element[0] for element in self._cursor.description]
-                    rows = [tuple(t) for t in self._cursor.fetchall()]
-                    df = DataFrame(rows, columns=column_names)
-                    if STDOUT_COLUMN_NAME in column_names:
-                        self.extract_output(dict(zip(column_names, rows[0])))
-                
-                # Get output parameters
-                #
-                while self._cursor.nextset(): 
-                    try:
-                        if self._cursor.description is not None:
-                            column_names = [element[0] for element in self._cursor.description]
-                            rows = [tuple(t) for t in self._cursor.fetchall()]
-                            output_params = dict(zip(column_names, rows[0])) 
-                            
-                            if STDOUT_COLUMN_NAME in column_names:
-                                self.extract_output(output_params)
-                            
-                    except pyodbc.ProgrammingError:
-                        continue
+                with instrumentation.phase(instrumentation.EXECUTE):
+                    if params is not None:
+                        self._cursor.execute(query, params)
+                    else:
+                        self._cursor.execute(query)
+
+                with instrumentation.phase(instrumentation.FETCH):
+                    # Print the log lines streamed before the result (see outputcapture)
+                    #
+                    while self.extract_log_lines() and self._cursor.nextset():
+                        pass
+
+                    # Get the first resultset (OutputDataSet)
+                    #
+                    if self._cursor.description is not None:
+                        column_names = [element[0] for element in self._cursor.description]
+                        rows = self._cursor.fetchall()
+                        instrumentation.record(rows=len(rows))
+                        df = self._build_result(self._cursor.description, rows, result_format)
+                        if STDOUT_COLUMN_NAME in column_names:
+                            self.extract_output(dict(zip(column_names, rows[0])))
+
+                    # Get output parameters
+                    #
+                    while self._cursor.nextset(): 
+                        try:
+                            if self.extract_log_lines():
+                                continue
+                            if self._cursor.description is not None:
+                                column_names = [element[0] for element in self._cursor.description]
+                                row = self._cursor.fetchone()
+                                output_params = dict(zip(column_names, row))
+
+                                if STDOUT_COLUMN_NAME in column_names:
+                                    self.extract_output(output_params)
+
+                        except pyodbc.ProgrammingError:
+                            continue
                 
         except Exception as e:
-            raise RuntimeError("Error in SQL Execution: " + str(e))
-        
+            raise self._execution_error(e)
+
+        if df is None:
+            df = empty_table() if result_format == ARROW else to_pandas(empty_table())
         return df, output_params
 
-    def __enter__(self):
-        self._cnxn = pyodbc.connect(self._connection.connection_string,
-                                    autocommit=True)
+    @staticmethod
+    def _build_result(description, rows, result_format: str):
+        if result_format == ARROW:
+            return build_table(description, rows)
+        elif result_format == PANDAS_ARROW:
+            return to_pandas(build_table(description, rows))
+        return build_dataframe(description, rows)
+
+    def iter_query(self, query, params, chunksize: int = 10000, arraysize: int = None, result_format: str = PANDAS):
+        """Yield the first result set of a query as DataFrames of at most chunksize rows.
+
+        Rows are fetched with fetchmany, so only one chunk is held in memory at a time.
+        With result_format="arrow", pyarrow.RecordBatches are yielded instead, starting with an empty batch when the
+        result set has no rows so that the schema is always known.
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be at least 1")
+        self._check_cancelled()
+
+        try:
+            if params is not None:
+                self._cursor.execute(query, params)
+            else:
+                self._cursor.execute(query)
+
+            # Skip over row counts and other results without columns
+            #
+            while self._cursor.description is None and self._cursor.nextset():
+                pass
+        except Exception as e:
+            raise self._execution_error(e)
+
+        if self._cursor.description is None:
+            return
+
+        self._cursor.arraysize = arraysize if arraysize is not None else chunksize
+        description = self._cursor.description
+        schema = arrow_schema(description) if result_format == ARROW else None
+
+        try:
+            batches = 0
+            while True:
+                try:
+                    rows = self._cursor.fetchmany(chunksize)
+                except pyodbc.Error as e:
+                    raise self._execution_error(e)
+                if not rows:
+                    break
+                batches += 1
+                if schema is not None:
+                    yield build_record_batch(description, rows, schema)
+                else:
+                    yield build_dataframe(description, rows)
+            if schema is not None and batches == 0:
+                yield build_record_batch(description, [], schema)
+        finally:
+            # Closing the cursor discards any rows left when the caller stops iterating early
+            #
+            self._reset_cursor()
+
+    def execute_many(self, query, rows, input_sizes=None, chunksize: int = 10000):
+        """Execute a parameterized statement once per row with fast_executemany.
+
+        The parameters are sent to the server as arrays of at most chunksize rows instead of one round trip per row.
+
+        :param query: statement with one ? marker per value of a row
+        :param rows: sequence of parameter tuples
+        :param input_sizes: pyodbc.Cursor.setinputsizes argument describing the parameters, so that pyodbc does not
+        have to guess the type and size of each parameter from the values
+        :param chunksize: number of rows per parameter array
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be at least 1")
+
+        instrumentation.record(script_bytes=len(query.encode("utf-8")), rows=len(rows))
+        self._check_cancelled()
+        try:
+            self._cursor.fast_executemany = True
+            if input_sizes is not None:
+                self._cursor.setinputsizes(input_sizes)
+            with instrumentation.phase(instrumentation.EXECUTE):
+                for start in range(0, len(rows), chunksize):
+                    self._cursor.executemany(query, rows[start:start + chunksize])
+        except Exception as e:
+            raise self._execution_error(e)
+        finally:
+            # Do not carry fast_executemany and the input sizes over to the next statement
+            #
+            self._reset_cursor()
+
+    @contextmanager
+    def transaction(self):
+        """Run the statements executed in the block in one transaction, committed if the block succeeds."""
+        self._cnxn.autocommit = False
+        try:
+            yield self
+            self._cnxn.commit()
+        except BaseException:
+            self._cnxn.rollback()
+            raise
+        finally:
+            self._cnxn.autocommit = True
+
+    def _reset_cursor(self):
+        if self._token is not None:
+            self._token._detach(self._cursor)
+        self._cursor.close()
         self._cursor = self._cnxn.cursor()
+        if self._token is not None:
+            self._token._attach(self._cursor)
+
+    def __enter__(self):
+        with instrumentation.phase(instrumentation.CONNECT):
+            try:
+                if self._dedicated_pool is not None:
+                    self._pool = self._dedicated_pool
+                    self._cnxn = self._pool.acquire()
+                elif self._connection.pooling:
+                    self._pool = get_pool(self._connection)
+                    self._cnxn = self._pool.acquire()
+                else:
+                    self._pool = None
+                    self._cnxn = connect(self._connection.connection_string, self._connection.login_timeout,
+                                         self._connection.attrs_before)
+            except pyodbc.Error as e:
+                if _sqlstate(e) == _TIMEOUT_SQLSTATE:
+                    raise QueryTimeoutError("Timed out connecting to SQL Server: " + str(e))
+                raise
+        self._interrupted = False
+        try:
+            # Cursors created on the connection get its query timeout; pooled connections may carry the timeout of
+            # a previous call, so it is always set.
+            #
+            self._cnxn.timeout = int(math.ceil(self._timeout)) if self._timeout else 0
+            self._cursor = self._cnxn.cursor()
+        except pyodbc.Error:
+            self._close(discard=True)
+            raise
+        self._token = current_cancellation_token()
+        if self._token is not None:
+            self._token._attach(self._cursor)
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
-        self._cnxn.close()
+        if self._token is not None:
+            self._token._detach(self._cursor)
+        # A cancelled or timed out statement may have been stopped anywhere, with a transaction left open: the
+        # connection is not reused. A failed query may have left the connection broken; only keep it if it still
+        # answers.
+        failed = exception_type is not None and exception_type is not GeneratorExit
+        discard = self._pool is not None and (self._interrupted or (failed and not self._is_alive()))
+        self._close(discard=discard)
+
+    # A cancel that arrives before a statement is sent (e.g. while waiting for a pooled connection) only reaches an
+    # idle cursor, so the statement is not started at all
+    def _check_cancelled(self):
+        if self._token is not None and self._token.cancelled:
+            raise QueryCancelledError("Query cancelled before it started")
+
+    def _execution_error(self, error: Exception) -> Exception:
+        """Exception to raise for an error of a statement: QueryTimeoutError or QueryCancelledError when the
+        statement was stopped, RuntimeError otherwise.
+        """
+        state = _sqlstate(error)
+        if state == _TIMEOUT_SQLSTATE:
+            self._interrupted = True
+            return QueryTimeoutError("Query timed out after {timeout} seconds: {error}".format(
+                timeout=self._timeout, error=error))
+        if state == _CANCELLED_SQLSTATE or (self._token is not None and self._token.cancelled):
+            self._interrupted = True
+            return QueryCancelledError("Query cancelled: " + str(error))
+        return RuntimeError("Error in SQL Execution: " + str(error))
+
+    def _is_alive(self) -> bool:
+        try:
+            self._cnxn.cursor().execute("SELECT 1").fetchall()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _close(self, discard: bool):
+        if self._pool is None:
+            self._cnxn.close()
+        else:
+            self._pool.release(self._cnxn, discard=discard)
     
+    def extract_log_lines(self, chunksize: int = 1000) -> bool:
+        """Print the log lines of the current result set, if it holds the lines of OutputCapture(stream=True).
+
+        Lines are printed as they are fetched, chunksize rows at a time.
+
+        :return: whether the current result set held log lines
+        """
+        description = self._cursor.description
+        if description is None or not is_log_result_set([element[0] for element in description]):
+            return False
+        while True:
+            rows = self._cursor.fetchmany(chunksize)
+            if not rows:
+                return True
+            for stream, line in rows:
+                print(line, file=sys.stderr if stream == "stderr" else sys.stdout)
+
     def extract_output(self, output_params : dict):
         out = output_params.pop(STDOUT_COLUMN_NAME, None)
         err = output_params.pop(STDERR_COLUMN_NAME, None)
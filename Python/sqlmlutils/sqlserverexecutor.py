@@ -0,0 +1,236 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import threading
+
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable
+
+from . import instrumentation
+from .connectioninfo import ConnectionInfo
+from .connectionpool import ConnectionPool
+from .sqlqueryexecutor import SQLQueryExecutor
+from .sqlbuilder import SpeesBuilderFromFunction
+from .sqlpythonexecutor import SQLPythonExecutor
+from .serialization import AUTO
+
+"""concurrent.futures interface to execute_function_in_sql.
+
+Each task is a SPEES query running on its own connection, so up to max_workers functions execute on the server at
+the same time while the caller keeps going. The executor has its own pool of max_workers connections, so its tasks
+never wait for connections held by other callers of the shared pool. The same executor backs a joblib parallel
+backend.
+"""
+
+DEFAULT_JOBLIB_BACKEND = "sqlserver"
+
+DEFAULT_MAX_WORKERS = 10
+
+
+class SQLFuture(Future):
+    """Future of a function executed in SQL Server.
+
+    Once the function has run, stdout and stderr hold what it printed on the server.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stdout = None
+        self.stderr = None
+
+
+class SQLServerExecutor(Executor):
+
+    def __init__(self, connection_info: ConnectionInfo, max_workers: int = None, language_name: str = "Python",
+                 compression: str = AUTO):
+        """Executor running functions in SQL Server, like SQLPythonExecutor.execute_function_in_sql.
+
+        :param connection_info: The ConnectionInfo object that holds the connection string and other information.
+        :param max_workers: maximum number of functions executing at the same time, each on its own connection
+        of the executor. Defaults to 10.
+        :param language_name: The name of the language to be executed in sp_execute_external_script, if using
+        EXTERNAL LANGUAGE.
+        :param compression: codec used to compress the returned values, see execute_function_in_sql
+
+        >>> from concurrent.futures import as_completed
+        >>> from sqlmlutils import ConnectionInfo
+        >>> from sqlmlutils.sqlserverexecutor import SQLServerExecutor
+        >>>
+        >>> def score(alpha):
+        >>>     print("alpha", alpha)
+        >>>     return alpha * 2
+        >>>
+        >>> with SQLServerExecutor(ConnectionInfo("localhost", database="AirlineTestDB"), max_workers=4) as executor:
+        >>>     futures = [executor.submit(score, alpha) for alpha in (0.1, 0.5, 1.0)]
+        >>>     for future in as_completed(futures):
+        >>>         print(future.result(), future.stdout)
+        """
+        if max_workers is None:
+            max_workers = DEFAULT_MAX_WORKERS
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self._connection_info = connection_info
+        self._language_name = language_name
+        self._compression = compression
+        self._max_workers = max_workers
+        # One connection slot per worker thread; without pooling every task opens its own connection
+        self._pool = None
+        if connection_info.pooling:
+            self._pool = ConnectionPool(connection_info.connection_string, max_size=max_workers,
+                                        login_timeout=connection_info.login_timeout,
+                                        attrs_before=connection_info.attrs_before)
+        self._workers = ThreadPoolExecutor(max_workers)
+        self._pending = set()
+        self._shutdown = False
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    def submit(self, fn: Callable, *args, **kwargs) -> SQLFuture:
+        """Schedule fn(*args, **kwargs) to execute in SQL Server.
+
+        :param fn: function to execute. NOTE: This function is shipped to SQL as text, see execute_function_in_sql.
+        :return: SQLFuture of the value returned by fn
+        """
+        future = SQLFuture()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._pending.add(future)
+        future.add_done_callback(self._forget)
+        self._workers.submit(self._run, future, fn, args, kwargs)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """Stop accepting tasks and release the worker threads and connections.
+
+        :param wait: block until every running and pending task is done
+        :param cancel_futures: cancel the tasks that have not started yet
+        """
+        with self._lock:
+            self._shutdown = True
+            pending = list(self._pending)
+        if cancel_futures:
+            for future in pending:
+                future.cancel()
+        self._workers.shutdown(wait)
+        with self._lock:
+            idle = not self._pending
+        if idle:
+            self._close_pool()
+
+    def _run(self, future: SQLFuture, fn: Callable, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with instrumentation.call("submit"):
+                with instrumentation.phase(instrumentation.BUILD):
+                    builder = SpeesBuilderFromFunction(fn,
+                                                       self._language_name,
+                                                       "",
+                                                       *args,
+                                                       compression=self._compression,
+                                                       **kwargs)
+                with SQLQueryExecutor(self._connection_info, pool=self._pool) as executor:
+                    df, _ = executor.execute(builder)
+                result, future.stdout, future.stderr = SQLPythonExecutor._get_results(df)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def _forget(self, future: SQLFuture):
+        with self._lock:
+            self._pending.discard(future)
+            idle = self._shutdown and not self._pending
+        if idle:
+            self._close_pool()
+
+    # The connections are closed once the executor is shut down and its last task is done
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+
+
+def _call_batch(items):
+    # joblib batch of delayed calls, unpickled on the server
+    return [func(*args, **kwargs) for func, args, kwargs in items]
+
+
+def register_joblib_backend(connection_info: ConnectionInfo, name: str = DEFAULT_JOBLIB_BACKEND,
+                            language_name: str = "Python"):
+    """Register a joblib parallel backend executing joblib tasks in SQL Server.
+
+    Requires joblib 1.3 or later on the client. The delayed functions and their arguments are pickled with dill, so
+    functions imported from modules need those modules on the server as well.
+
+    :param connection_info: The ConnectionInfo object that holds the connection string and other information.
+    :param name: name of the backend for joblib.parallel_config / parallel_backend
+    :param language_name: The name of the language to be executed in sp_execute_external_script, if using
+    EXTERNAL LANGUAGE.
+
+    >>> from joblib import Parallel, delayed, parallel_config
+    >>> from sqlmlutils import ConnectionInfo
+    >>> from sqlmlutils.sqlserverexecutor import register_joblib_backend
+    >>>
+    >>> def fit(alpha):
+    >>>     return alpha * 2
+    >>>
+    >>> register_joblib_backend(ConnectionInfo("localhost", database="AirlineTestDB"))
+    >>> with parallel_config(backend="sqlserver", n_jobs=4):
+    >>>     results = Parallel()(delayed(fit)(alpha) for alpha in (0.1, 0.5, 1.0))
+    """
+    try:
+        from joblib import register_parallel_backend
+        from joblib.parallel import ParallelBackendBase
+    except ImportError:
+        raise ImportError("The joblib package is required to register sqlmlutils as a joblib backend.")
+
+    class SQLServerBackend(ParallelBackendBase):
+
+        supports_retrieve_callback = True
+
+        def __init__(self, nesting_level=None, inner_max_num_threads=None, **kwargs):
+            super().__init__(nesting_level=nesting_level, inner_max_num_threads=inner_max_num_threads, **kwargs)
+            self._executor = None
+
+        def effective_n_jobs(self, n_jobs):
+            if n_jobs == 0:
+                raise ValueError("n_jobs == 0 in Parallel has no meaning")
+            if n_jobs is None or n_jobs < 0:
+                return DEFAULT_MAX_WORKERS
+            return n_jobs
+
+        def configure(self, n_jobs=1, parallel=None, **backend_kwargs):
+            n_jobs = self.effective_n_jobs(n_jobs)
+            self.parallel = parallel
+            self._executor = SQLServerExecutor(connection_info, max_workers=n_jobs, language_name=language_name)
+            return n_jobs
+
+        def submit(self, func, callback=None):
+            items = getattr(func, "items", None)
+            if items is None:
+                items = [(func, (), {})]
+            future = self._executor.submit(_call_batch, items)
+            if callback is not None:
+                future.add_done_callback(callback)
+            return future
+
+        def retrieve_result_callback(self, out):
+            return out.result()
+
+        def terminate(self):
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+        def abort_everything(self, ensure_ready=True):
+            self.terminate()
+            if ensure_ready:
+                self.configure(n_jobs=self.parallel.n_jobs, parallel=self.parallel,
+                               **self.parallel._backend_kwargs)
+
+    register_parallel_backend(name, SQLServerBackend)
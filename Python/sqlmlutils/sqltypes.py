@@ -0,0 +1,151 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import datetime
+import decimal
+import re
+import numpy as np
+import pandas as pd
+
+from pandas import DataFrame
+
+"""Mapping of Python types and pandas dtypes to SQL Server column types.
+
+Used wherever sqlmlutils has to declare the columns of a DataFrame to SQL Server, e.g. in a WITH RESULT SETS clause.
+"""
+
+_PYTHON_TYPES = [
+    (bool, "bit"),
+    (int, "bigint"),
+    (float, "float"),
+    (str, "nvarchar(MAX)"),
+    (bytes, "varbinary(MAX)"),
+    (bytearray, "varbinary(MAX)"),
+    (datetime.datetime, "datetime2"),
+    (datetime.date, "date"),
+    (datetime.time, "time"),
+    (decimal.Decimal, "decimal(38, 10)"),
+]
+
+_DTYPE_KINDS = {
+    "b": "bit",
+    "f": "float",
+    "M": "datetime2",
+    "S": "varbinary(MAX)",
+    "U": "nvarchar(MAX)",
+}
+
+# One part of a multipart name: a bracketed identifier ("]" escaped as "]]") or a name without brackets and dots
+_NAME_PART = re.compile(r"\[(?:[^\]]|\]\])*\]|[^.\[\]]*")
+
+_INT_SIZES = {
+    1: "smallint",
+    2: "smallint",
+    4: "int",
+    8: "bigint",
+}
+
+
+def to_sql_type(type_or_dtype) -> str:
+    """SQL Server type for a Python type, a NumPy/pandas dtype, or a SQL type name given as a string.
+
+    :param type_or_dtype: e.g. int, str, numpy.float32, "Int64", "nvarchar(50)"
+    :return: SQL type name usable in a column declaration
+    """
+    if isinstance(type_or_dtype, type):
+        for python_type, sql_type in _PYTHON_TYPES:
+            if issubclass(type_or_dtype, python_type) and not (python_type is int and type_or_dtype is bool):
+                return sql_type
+        if not issubclass(type_or_dtype, np.generic):
+            raise ValueError("Python type: " + str(type_or_dtype) + " not supported.")
+
+    if isinstance(type_or_dtype, str):
+        try:
+            dtype = pd.api.types.pandas_dtype(type_or_dtype)
+        except TypeError:
+            # Not a dtype name, so it is a SQL type name
+            return type_or_dtype
+    else:
+        dtype = pd.api.types.pandas_dtype(type_or_dtype)
+
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bit"
+    if pd.api.types.is_integer_dtype(dtype):
+        if pd.api.types.is_unsigned_integer_dtype(dtype):
+            return "tinyint" if dtype.itemsize == 1 else _INT_SIZES[min(dtype.itemsize * 2, 8)]
+        return _INT_SIZES[dtype.itemsize]
+    if pd.api.types.is_float_dtype(dtype):
+        return "real" if dtype.itemsize == 4 else "float"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime2"
+    if pd.api.types.is_string_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return "nvarchar(MAX)"
+    if dtype.kind in _DTYPE_KINDS:
+        return _DTYPE_KINDS[dtype.kind]
+    raise ValueError("dtype: " + str(dtype) + " not supported.")
+
+
+def column_types(df: DataFrame) -> list:
+    """(name, SQL type) for each column of a DataFrame.
+
+    Object columns are typed from their first non null value, so a small sample of the data is enough.
+    """
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        if series.dtype == object:
+            values = series.dropna()
+            sql_type = to_sql_type(type(values.iloc[0])) if len(values) > 0 else "nvarchar(MAX)"
+        else:
+            sql_type = to_sql_type(series.dtype)
+        columns.append((str(name), sql_type))
+    return columns
+
+
+def schema_columns(schema) -> list:
+    """(name, SQL type) for each column of a schema.
+
+    :param schema: DataFrame (sample of the data), or dictionary of column name to Python type, dtype
+    or SQL type name
+    """
+    if isinstance(schema, DataFrame):
+        return column_types(schema)
+    return [(str(name), to_sql_type(value)) for name, value in schema.items()]
+
+
+def quote_name(name: str) -> str:
+    """Quote an identifier with square brackets."""
+    return "[" + name.replace("]", "]]") + "]"
+
+
+def quote_table_name(table: str) -> str:
+    """Quote each part of a (schema qualified) table name.
+
+    Parts may already be quoted with square brackets, e.g. "dbo.[my table]" or "[my.schema].[a]]b]"; they are
+    unescaped and quoted again, so the result never holds anything but quoted identifiers.
+
+    :raises ValueError: for a name that is not made of at most 4 parts, each a bracketed identifier or a name without
+    brackets and dots
+    """
+    parts = []
+    position = 0
+    while True:
+        match = _NAME_PART.match(table, position)
+        part = match.group(0)
+        parts.append(part[1:-1].replace("]]", "]") if part.startswith("[") else part)
+        position = match.end()
+        if position == len(table):
+            break
+        if table[position] != ".":
+            raise ValueError("Invalid table name: " + table)
+        position += 1
+
+    # Only the database or schema part may be left out, as in "db..table"
+    if len(parts) > 4 or not parts[0] or not parts[-1] or (len(parts) == 2 and not all(parts)):
+        raise ValueError("Invalid table name: " + table)
+    return ".".join(quote_name(part) if part else "" for part in parts)
+
+
+def column_declarations(columns: list) -> str:
+    """Comma separated column declarations for (name, SQL type) pairs."""
+    return ", ".join("{name} {sqltype}".format(name=quote_name(name), sqltype=sql_type) for name, sql_type in columns)
@@ -0,0 +1,456 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import sys
+import threading
+import time
+import uuid
+import dill
+import pyodbc
+
+from typing import Callable
+
+from .connectioninfo import ConnectionInfo
+from .functionregistry import FUNCTION_TABLE_NAME, RegisteredFunction
+from .scriptcache import function_key
+from .sqlbuilder import SQLBuilder, SpeesBuilder, call_arguments, STDOUT_COLUMN_NAME, STDERR_COLUMN_NAME
+from .sqlqueryexecutor import QueryTimeoutError, SQLQueryExecutor, execute_query, execute_raw_query
+
+"""Queue of function calls drained by long-lived workers running inside SQL Server.
+
+A worker is one sp_execute_external_script call running a loop: it takes the next task (the hash of a registered
+function and its pickled arguments) from the sqlmlutils_tasks table, calls the function, writes the pickled result to
+the sqlmlutils_task_results table and moves on, until no task has arrived for idle_timeout seconds. The runtime launch
+and the imports are paid once per worker instead of once per call.
+
+Each task is taken, run and its result written in one transaction, with READPAST so that workers never wait for each
+other: if a worker dies, its current task goes back to the queue.
+
+Workers read and write the queue over a loopback connection to the database, so pyodbc must be installed on the
+server (see SQLPackageManager) and the worker connection must be able to log in from the server; with trusted
+connections this needs implied authentication to be set up for the external runtime.
+"""
+
+TASK_TABLE_NAME = "dbo.sqlmlutils_tasks"
+RESULT_TABLE_NAME = "dbo.sqlmlutils_task_results"
+
+_ENQUEUE_QUERY = """
+INSERT INTO {tasks} (queue_name, task_id, owner, func_hash, args_dill, pos_args_dill) VALUES (?, ?, ?, ?, ?, ?)
+""".format(tasks=TASK_TABLE_NAME)
+
+_ENQUEUE_INPUT_SIZES = [(pyodbc.SQL_WVARCHAR, 128, 0),
+                        (pyodbc.SQL_CHAR, 32, 0),
+                        (pyodbc.SQL_CHAR, 32, 0),
+                        (pyodbc.SQL_CHAR, 64, 0),
+                        (pyodbc.SQL_VARBINARY, 0, 0),
+                        (pyodbc.SQL_VARBINARY, 0, 0)]
+
+# Results are removed from the table when they are collected
+_COLLECT_QUERY = """
+SET NOCOUNT ON;
+DELETE FROM {results}
+OUTPUT deleted.task_id, deleted.succeeded, deleted.result_dill, deleted.stdout, deleted.stderr
+WHERE owner = ?
+""".format(results=RESULT_TABLE_NAME)
+
+_PENDING_QUERY = "SELECT COUNT(*) AS pending FROM {tasks} WHERE queue_name = ?".format(tasks=TASK_TABLE_NAME)
+
+_CLEAR_QUERY = """
+SET NOCOUNT ON;
+DELETE FROM {tasks} WHERE queue_name = ?;
+SELECT @@ROWCOUNT AS cleared;
+""".format(tasks=TASK_TABLE_NAME)
+
+_WORKER_SCRIPT = """
+import dill
+import io
+import pyodbc
+import sys
+import time
+import traceback
+from pandas import DataFrame
+
+_DEQUEUE = \"\"\"
+WITH next_task AS (
+    SELECT TOP (1) task_id, owner, func_hash, args_dill, pos_args_dill
+    FROM {tasks} WITH (ROWLOCK, READPAST, UPDLOCK)
+    WHERE queue_name = ?
+    ORDER BY seq)
+DELETE FROM next_task
+OUTPUT deleted.task_id, deleted.owner, deleted.func_hash, deleted.args_dill, deleted.pos_args_dill;
+\"\"\"
+
+_INSERT_RESULT = \"\"\"
+INSERT INTO {results} (task_id, queue_name, owner, succeeded, result_dill, stdout, stderr) VALUES (?, ?, ?, ?, ?, ?, ?)
+\"\"\"
+
+_LOAD_FUNCTION = "SELECT function_name, function_text, closure_dill FROM {functions} WHERE func_hash = ?"
+
+_cnxn = pyodbc.connect(connection_string, autocommit=False)
+_cursor = _cnxn.cursor()
+_functions = dict()
+
+
+# Registered functions are defined once per worker, next to the variables they close over
+def _load_function(func_hash):
+    if func_hash not in _functions:
+        row = _cursor.execute(_LOAD_FUNCTION, func_hash).fetchone()
+        if row is None:
+            raise RuntimeError("Function " + func_hash + " is not registered, call register_function again.")
+        namespace = dict(globals())
+        namespace.update(dill.loads(row[2]))
+        exec(row[1], namespace)
+        _functions[func_hash] = namespace[row[0]]
+    return _functions[func_hash]
+
+
+# Exceptions that cannot be unpickled on the client are replaced by a RuntimeError with their message
+def _portable_exception(e):
+    try:
+        dill.loads(dill.dumps(e))
+        return e
+    except Exception:
+        return RuntimeError(type(e).__name__ + ": " + str(e))
+
+
+_processed = 0
+_last_task = time.monotonic()
+while max_tasks == 0 or _processed < max_tasks:
+    _task = _cursor.execute(_DEQUEUE, queue_name).fetchone()
+    if _task is None:
+        _cnxn.commit()
+        if time.monotonic() - _last_task >= idle_timeout:
+            break
+        time.sleep(poll_interval)
+        continue
+
+    _task_id, _owner, _func_hash, _args_dill, _pos_args_dill = _task
+    _out = io.StringIO()
+    _err = io.StringIO()
+    sys.stdout = _out
+    sys.stderr = _err
+    try:
+        _result = _load_function(_func_hash)(*dill.loads(_pos_args_dill), **dill.loads(_args_dill))
+        _succeeded = True
+    except Exception as e:
+        traceback.print_exc()
+        _result = _portable_exception(e)
+        _succeeded = False
+    finally:
+        sys.stdout = _temp_out
+        sys.stderr = _temp_err
+
+    try:
+        _payload = dill.dumps(_result)
+    except Exception as e:
+        _payload = dill.dumps(RuntimeError("Result cannot be pickled: " + str(e)))
+        _succeeded = False
+
+    _cursor.execute(_INSERT_RESULT, _task_id, queue_name, _owner, _succeeded, _payload,
+                    _out.getvalue() or None, _err.getvalue() or None)
+    _cnxn.commit()
+    _processed += 1
+    _last_task = time.monotonic()
+
+_cnxn.close()
+OutputDataSet = DataFrame(dict(processed=[_processed]))
+""".replace("{tasks}", TASK_TABLE_NAME) \
+    .replace("{results}", RESULT_TABLE_NAME) \
+    .replace("{functions}", FUNCTION_TABLE_NAME)
+
+
+class CreateTaskTablesBuilder(SQLBuilder):
+
+    @property
+    def base_script(self) -> str:
+        return """
+IF OBJECT_ID(N'{tasks}', N'U') IS NULL
+    CREATE TABLE {tasks} (
+        seq bigint IDENTITY NOT NULL,
+        queue_name nvarchar(128) NOT NULL,
+        task_id char(32) NOT NULL,
+        owner char(32) NOT NULL,
+        func_hash char(64) NOT NULL,
+        args_dill varbinary(MAX) NOT NULL,
+        pos_args_dill varbinary(MAX) NOT NULL,
+        enqueued_at datetime2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        PRIMARY KEY CLUSTERED (queue_name, seq)
+    );
+
+IF OBJECT_ID(N'{results}', N'U') IS NULL
+    CREATE TABLE {results} (
+        task_id char(32) NOT NULL PRIMARY KEY,
+        queue_name nvarchar(128) NOT NULL,
+        owner char(32) NOT NULL,
+        succeeded bit NOT NULL,
+        result_dill varbinary(MAX) NOT NULL,
+        stdout nvarchar(MAX) NULL,
+        stderr nvarchar(MAX) NULL,
+        finished_at datetime2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        INDEX IX_sqlmlutils_task_results_owner (owner)
+    );
+""".format(tasks=TASK_TABLE_NAME, results=RESULT_TABLE_NAME)
+
+
+class TaskWorkerBuilder(SpeesBuilder):
+
+    """Generate the SPEES query of a worker draining a task queue. It returns the number of tasks processed."""
+
+    _WITH_RESULTS_TEXT = "with result sets((processed int, {stdout} varchar(MAX), {stderr} varchar(MAX)))".format(
+        stdout=STDOUT_COLUMN_NAME, stderr=STDERR_COLUMN_NAME)
+
+    _SCRIPT_PARAMETERS = [("connection_string", "nvarchar(MAX)", "?"),
+                          ("queue_name", "nvarchar(128)", "?"),
+                          ("idle_timeout", "float", "?"),
+                          ("poll_interval", "float", "?"),
+                          ("max_tasks", "int", "?")]
+
+    def __init__(self, connection_string: str, queue_name: str, language_name: str = "Python",
+                 idle_timeout: float = 60, poll_interval: float = 0.5, max_tasks: int = None):
+        """
+        :param connection_string: connection string the worker uses to reach the queue from the server
+        :param queue_name: name of the queue to drain
+        :param language_name: name of the language to be executed in sp_execute_external_script
+        :param idle_timeout: seconds without a task after which the worker exits
+        :param poll_interval: seconds between two looks at an empty queue
+        :param max_tasks: exit after this many tasks, None for no limit
+        """
+        if idle_timeout < 0 or poll_interval <= 0:
+            raise ValueError("idle_timeout must not be negative and poll_interval must be positive")
+        if max_tasks is not None and max_tasks < 1:
+            raise ValueError("max_tasks must be at least 1")
+        self._worker_params = (connection_string, queue_name, float(idle_timeout), float(poll_interval),
+                               max_tasks or 0)
+        super().__init__(script=_WORKER_SCRIPT,
+                         with_results_text=self._WITH_RESULTS_TEXT,
+                         language_name=language_name,
+                         script_parameters=self._SCRIPT_PARAMETERS)
+
+    @property
+    def params(self):
+        return (self._script, self._input_data_query) + self._worker_params
+
+
+class TaskQueue:
+    """Client side of a queue of function calls executed by workers inside SQL Server.
+
+    Returned by SQLPythonExecutor.task_queue. Tasks are collected per TaskQueue object: results are only returned to
+    the TaskQueue that submitted them.
+    """
+
+    def __init__(self, executor, connection: ConnectionInfo, name: str = "default",
+                 worker_connection: ConnectionInfo = None, language_name: str = "Python"):
+        """
+        :param executor: SQLPythonExecutor used to register the functions of the tasks
+        :param connection: ConnectionInfo of the database holding the queue
+        :param name: name of the queue; workers only take the tasks of their queue
+        :param worker_connection: ConnectionInfo the workers use to connect to the database from the server,
+        defaults to connection
+        :param language_name: name of the language to be executed in sp_execute_external_script
+        """
+        self._executor = executor
+        self._connection = connection
+        self._name = name
+        self._worker_connection = worker_connection if worker_connection is not None else connection
+        self._language_name = language_name
+
+        # Identifies the results of the tasks submitted through this object
+        self._owner = uuid.uuid4().hex
+        self._registered = {}
+        self._done = {}
+        self._workers = []
+        self._worker_errors = []
+        self._processed = 0
+        self._tables_created = False
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def pending(self) -> int:
+        """Number of tasks of the queue not taken by a worker yet, from every client."""
+        self._create_tables()
+        df, _ = execute_raw_query(self._connection, _PENDING_QUERY, (self._name,))
+        return int(df["pending"].iloc[0])
+
+    @property
+    def processed(self) -> int:
+        """Number of tasks processed by the workers started with start_workers that have exited."""
+        with self._lock:
+            return self._processed
+
+    def clear(self) -> int:
+        """Remove the tasks of the queue not taken by a worker yet, from every client.
+
+        :return: number of tasks removed
+        """
+        self._create_tables()
+        df, _ = execute_raw_query(self._connection, _CLEAR_QUERY, (self._name,))
+        return int(df["cleared"].iloc[0])
+
+    def start_workers(self, count: int = 1, idle_timeout: float = 60, poll_interval: float = 0.5,
+                      max_tasks: int = None):
+        """Start workers draining the queue inside SQL Server.
+
+        Each worker is a sp_execute_external_script call held by a background thread, on its own pooled connection,
+        until the worker exits.
+
+        :param count: number of workers; they take tasks in parallel
+        :param idle_timeout: seconds without a task after which a worker exits
+        :param poll_interval: seconds between two looks at an empty queue
+        :param max_tasks: number of tasks after which a worker exits, None for no limit
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        self._create_tables()
+        builder = TaskWorkerBuilder(self._worker_connection.connection_string, self._name,
+                                    language_name=self._language_name, idle_timeout=idle_timeout,
+                                    poll_interval=poll_interval, max_tasks=max_tasks)
+        for _ in range(count):
+            thread = threading.Thread(target=self._run_worker, args=(builder,), daemon=True)
+            with self._lock:
+                self._workers.append(thread)
+            thread.start()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait for the workers started with start_workers to exit.
+
+        :return: whether every worker has exited
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            workers = list(self._workers)
+        for thread in workers:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in workers)
+
+    def submit(self, func: Callable, *args, **kwargs) -> str:
+        """Add a call of func to the queue.
+
+        :param func: function, or RegisteredFunction; functions are registered on the server the first time
+        :return: id of the task, to pass to result
+        """
+        return self._enqueue(func, [(args, kwargs)])[0]
+
+    def map(self, func: Callable, arg_list, **kwargs) -> list:
+        """Add one call of func per argument set to the queue, in one round trip.
+
+        :param arg_list: argument sets, see SQLPythonExecutor.execute_function_batch
+        :param kwargs: keyword arguments passed to every call
+        :return: ids of the tasks, in the order of arg_list
+        """
+        calls = []
+        for item in arg_list:
+            pos_args, call_kwargs = call_arguments(item)
+            calls.append((pos_args, dict(kwargs, **call_kwargs)))
+        return self._enqueue(func, calls)
+
+    def result(self, task_id: str, timeout: float = None, poll_interval: float = 0.2):
+        """Wait for a task and return the value returned by its function.
+
+        What the function printed is printed, and the exception it raised, if any, is raised.
+
+        :param task_id: id returned by submit or map
+        :param timeout: seconds to wait before QueryTimeoutError is raised. None to wait as long as a worker started
+        with start_workers is running: RuntimeError is raised once none is left. Pass a timeout to wait for workers
+        started by another TaskQueue or client.
+        :param poll_interval: seconds between two looks at the results table
+        """
+        return self.results([task_id], timeout=timeout, poll_interval=poll_interval)[0]
+
+    def results(self, task_ids: list, timeout: float = None, poll_interval: float = 0.2) -> list:
+        """Wait for tasks and return their values, in the order of task_ids; see result."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        task_ids = list(task_ids)
+        while True:
+            with self._lock:
+                missing = [task_id for task_id in task_ids if task_id not in self._done]
+            if not missing:
+                break
+            if self._collect() > 0:
+                continue
+            if not self._check_workers(deadline is None):
+                # The last worker may have written results before it exited
+                if self._collect() > 0:
+                    continue
+                raise RuntimeError("No worker of queue {name} is running, {count} tasks are not done: call "
+                                   "start_workers, or pass a timeout to wait for other workers".format(
+                                       name=self._name, count=len(missing)))
+            if deadline is not None and time.monotonic() >= deadline:
+                raise QueryTimeoutError("{count} tasks of queue {name} are not done".format(count=len(missing),
+                                                                                            name=self._name))
+            time.sleep(poll_interval)
+
+        with self._lock:
+            done = [self._done.pop(task_id) for task_id in task_ids]
+        return [self._unpack(*row) for row in done]
+
+    def _enqueue(self, func: Callable, calls: list) -> list:
+        self._create_tables()
+        handle = self._register(func)
+        dill.settings['recurse'] = True
+        rows = [(self._name, uuid.uuid4().hex, self._owner, handle.hash, dill.dumps(call_kwargs), dill.dumps(pos_args))
+                for pos_args, call_kwargs in calls]
+        with SQLQueryExecutor(self._connection) as executor:
+            executor.execute_many(_ENQUEUE_QUERY, rows, _ENQUEUE_INPUT_SIZES)
+        return [row[1] for row in rows]
+
+    def _register(self, func: Callable) -> RegisteredFunction:
+        if isinstance(func, RegisteredFunction):
+            return func
+        key = function_key(func)
+        with self._lock:
+            handle = self._registered.get(key) if key is not None else None
+        if handle is None:
+            handle = self._executor.register_function(func)
+            if key is not None:
+                with self._lock:
+                    self._registered[key] = handle
+        return handle
+
+    def _create_tables(self):
+        if not self._tables_created:
+            execute_query(CreateTaskTablesBuilder(), self._connection)
+            self._tables_created = True
+
+    # Moves the finished tasks of this object from the results table to _done; returns how many were found
+    def _collect(self) -> int:
+        df, _ = execute_raw_query(self._connection, _COLLECT_QUERY, (self._owner,))
+        with self._lock:
+            for task_id, succeeded, result_dill, stdout, stderr in df.itertuples(index=False):
+                self._done[task_id] = (succeeded, result_dill, stdout, stderr)
+        return len(df)
+
+    # Raises the error of the last worker when every worker has failed; returns False when only the workers started
+    # by this object can finish the tasks (own_workers_only) and none of them is running
+    def _check_workers(self, own_workers_only: bool) -> bool:
+        with self._lock:
+            errors = list(self._worker_errors)
+            alive = any(thread.is_alive() for thread in self._workers)
+        if errors and not alive:
+            raise RuntimeError("The workers of queue {name} failed: {error}".format(name=self._name,
+                                                                                   error=errors[-1]))
+        return alive or not own_workers_only
+
+    @staticmethod
+    def _unpack(succeeded, result_dill, stdout, stderr):
+        if isinstance(stdout, str):
+            print(stdout, end="")
+        if isinstance(stderr, str):
+            print(stderr, end="", file=sys.stderr)
+        result = dill.loads(result_dill)
+        if not succeeded:
+            raise result
+        return result
+
+    def _run_worker(self, builder: TaskWorkerBuilder):
+        try:
+            # The worker runs until it is idle: the query timeout of the connection does not apply
+            df, _ = execute_query(builder, self._connection, timeout=0)
+            with self._lock:
+                self._processed += int(df["processed"].iloc[0])
+        except Exception as e:
+            with self._lock:
+                self._worker_errors.append(e)
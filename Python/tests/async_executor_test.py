@@ -0,0 +1,90 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import asyncio
+import pytest
+import time
+
+from sqlmlutils import ConnectionInfo, AsyncSQLPythonExecutor
+from sqlmlutils.connectionpool import get_pool
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = AsyncSQLPythonExecutor(connection, max_workers=4)
+
+
+def _run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def test_execute_function_in_sql():
+    def add(x, y):
+        return x + y
+
+    async def gather():
+        return await asyncio.gather(*(sqlpy.execute_function_in_sql(add, x, y=1) for x in range(8)))
+
+    assert _run(gather()) == [x + 1 for x in range(8)]
+
+
+def test_execute_sql_query():
+    df = _run(sqlpy.execute_sql_query("SELECT TOP 10 * FROM airline5000"))
+    assert df.shape == (10, 30)
+
+
+def test_iter_sql_query():
+    async def collect():
+        chunks = []
+        async for chunk in sqlpy.iter_sql_query("SELECT TOP 25 * FROM airline5000", chunksize=10):
+            chunks.append(chunk)
+        return chunks
+
+    chunks = _run(collect())
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+
+
+def test_timeout_cancels_query():
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        _run(sqlpy.execute_sql_query("WAITFOR DELAY '00:00:30'; SELECT 1 AS x", timeout=1))
+    assert time.monotonic() - start < 10
+
+    # The cancelled connection is usable again
+    df = _run(sqlpy.execute_sql_query("SELECT 1 AS x"))
+    assert df["x"][0] == 1
+
+
+def test_cancel_task():
+    async def cancel():
+        task = asyncio.ensure_future(sqlpy.execute_sql_query("WAITFOR DELAY '00:00:30'; SELECT 1 AS x"))
+        await asyncio.sleep(1)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        _run(cancel())
+    assert get_pool(connection).size <= get_pool(connection).max_size
+
+
+def test_timeout_is_query_timeout():
+    def sleep(seconds):
+        import time
+        time.sleep(seconds)
+
+    timed = AsyncSQLPythonExecutor(connection, max_workers=1, timeout=1.5)
+    try:
+        # The statements get the timeout in whole seconds, so the server stops them too
+        assert timed._runner.query_timeout() == 2
+        assert timed._runner.query_timeout(0.1) == 1
+
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            _run(timed.execute_function_in_sql(sleep, 30))
+        assert time.monotonic() - start < 10
+    finally:
+        timed.close()
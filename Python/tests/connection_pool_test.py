@@ -0,0 +1,130 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import pytest
+
+from pandas import isna
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+from sqlmlutils.connectionpool import ConnectionPool, configure_pool, get_pool
+from sqlmlutils.sqlqueryexecutor import SQLQueryExecutor
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = SQLPythonExecutor(connection)
+
+
+def _spid(sqlpy):
+    return sqlpy.execute_sql_query("SELECT @@SPID AS spid")["spid"].iloc[0]
+
+
+def test_connection_reused():
+    configure_pool(connection, max_size=2)
+
+    assert _spid(sqlpy) == _spid(sqlpy)
+    assert get_pool(connection).size == 1
+    assert get_pool(connection).idle == 1
+
+
+def test_concurrent_checkout_opens_new_connection():
+    configure_pool(connection, max_size=2)
+
+    with SQLQueryExecutor(connection) as first, SQLQueryExecutor(connection) as second:
+        assert first._cnxn is not second._cnxn
+        assert get_pool(connection).size == 2
+
+    assert get_pool(connection).idle == 2
+
+
+def test_session_state_reset():
+    configure_pool(connection, max_size=1)
+
+    with SQLQueryExecutor(connection) as executor:
+        executor.execute_query("CREATE TABLE #pooled (val INT)", None)
+
+    res = sqlpy.execute_sql_query("SELECT OBJECT_ID('tempdb..#pooled') AS id")
+    assert isna(res["id"].iloc[0])
+
+
+def test_temp_table_dropped_on_release():
+    pool = ConnectionPool(connection.connection_string, max_size=1)
+    try:
+        cnxn = pool.acquire()
+        cnxn.cursor().execute("CREATE TABLE #released (val INT)")
+        pool.release(cnxn)
+
+        reused = pool.acquire()
+        assert reused is cnxn
+        assert reused.cursor().execute("SELECT OBJECT_ID('tempdb..#released')").fetchone()[0] is None
+        pool.release(reused)
+    finally:
+        pool.close()
+
+
+def test_transaction_rolled_back_on_release():
+    configure_pool(connection, max_size=1)
+
+    with SQLQueryExecutor(connection) as executor:
+        executor._cnxn.autocommit = False
+        executor.execute_query("SELECT 1", None)
+
+    with SQLQueryExecutor(connection) as executor:
+        assert executor._cnxn.autocommit
+
+
+def test_checkout_timeout():
+    configure_pool(connection, max_size=1, checkout_timeout=0.1)
+
+    with SQLQueryExecutor(connection):
+        with pytest.raises(RuntimeError):
+            get_pool(connection).acquire()
+
+
+def test_min_size_prefilled():
+    pool = configure_pool(connection, min_size=2, max_size=4)
+    assert pool.idle == 2
+
+
+def test_pool_settings_validated():
+    with pytest.raises(ValueError):
+        ConnectionPool(connection.connection_string, max_size=0)
+    with pytest.raises(ValueError):
+        ConnectionPool(connection.connection_string, min_size=3, max_size=2)
+
+
+def test_pooling_disabled():
+    unpooled = ConnectionInfo(driver=driver, server=server, database=database, uid=uid, pwd=pwd, pooling=False)
+    unpooled_sqlpy = SQLPythonExecutor(unpooled)
+
+    res = unpooled_sqlpy.execute_sql_query("SELECT 1 AS val")
+    assert res["val"].iloc[0] == 1
+
+
+def test_connection_options():
+    options = ConnectionInfo(driver=driver, server=server, database=database, uid=uid, pwd=pwd,
+                             mars=True, application_intent="readonly", options={"APP": "sqlmlutils;test"})
+    assert options.connection_string.startswith(connection.connection_string)
+    assert "MARS_Connection=Yes;" in options.connection_string
+    assert "ApplicationIntent=ReadOnly;" in options.connection_string
+    assert "APP={sqlmlutils;test};" in options.connection_string
+
+    res = SQLPythonExecutor(options).execute_sql_query("SELECT APP_NAME() AS app")
+    assert res["app"].iloc[0] == "sqlmlutils;test"
+
+    with pytest.raises(ValueError):
+        ConnectionInfo(packet_size=100)
+    with pytest.raises(ValueError):
+        ConnectionInfo(application_intent="ReadMostly")
+
+
+def test_packet_size():
+    large = ConnectionInfo(driver=driver, server=server, database=database, uid=uid, pwd=pwd, packet_size=16384)
+    assert get_pool(large) is not get_pool(connection)
+
+    query = "SELECT net_packet_size FROM sys.dm_exec_connections WHERE session_id = @@SPID"
+    assert SQLPythonExecutor(large).execute_sql_query(query)["net_packet_size"].iloc[0] == 16384
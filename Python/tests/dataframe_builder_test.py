@@ -0,0 +1,95 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import datetime
+import decimal
+import pytest
+
+from pandas import DataFrame, isna
+
+from sqlmlutils.dataframebuilder import build_dataframe
+
+# These tests need no server: the rows are passed to the builder the way pyodbc returns them
+
+
+def _description(*columns):
+    return [(name, type_code, None, None, None, None, True) for name, type_code in columns]
+
+
+def _values(df):
+    return {name: [None if isna(value) else value for value in df[name].tolist()] for name in df.columns}
+
+
+def _check(description, rows):
+    """Build the DataFrame and check it holds the same values as DataFrame.from_records."""
+    df = build_dataframe(description, rows)
+    expected = DataFrame.from_records(rows, columns=[element[0] for element in description])
+
+    assert list(df.columns) == list(expected.columns)
+    assert len(df) == len(expected)
+    assert _values(df) == _values(expected)
+    return df
+
+
+def test_typed_columns():
+    df = _check(_description(("i", int), ("f", float), ("b", bool), ("dt", datetime.datetime)),
+                [(1, 1.5, True, datetime.datetime(2020, 1, 1, 12, 30)),
+                 (2, 2.5, False, datetime.datetime(2021, 6, 30, 0, 0, 0, 123000))])
+
+    assert str(df["i"].dtype) == "int64"
+    assert str(df["f"].dtype) == "float64"
+    assert str(df["b"].dtype) == "bool"
+    assert str(df["dt"].dtype).startswith("datetime64")
+
+
+def test_null_columns():
+    df = _check(_description(("i", int), ("f", float), ("b", bool), ("dt", datetime.datetime), ("s", str)),
+                [(None, None, None, None, None), (None, None, None, None, None)])
+
+    assert df.isna().all().all()
+
+
+def test_int_with_nulls():
+    df = _check(_description(("i", int)), [(1,), (None,), (3,)])
+
+    assert str(df["i"].dtype) == "Int64"
+    assert df["i"].isna().tolist() == [False, True, False]
+
+
+def test_bool_with_nulls():
+    df = _check(_description(("b", bool)), [(True,), (None,), (False,)])
+
+    assert str(df["b"].dtype) == "boolean"
+    assert df["b"].isna().tolist() == [False, True, False]
+
+
+def test_float_with_nulls():
+    df = _check(_description(("f", float)), [(1.5,), (None,)])
+
+    assert str(df["f"].dtype) == "float64"
+
+
+def test_object_columns():
+    df = _check(_description(("d", decimal.Decimal), ("x", bytes), ("s", str), ("day", datetime.date)),
+                [(decimal.Decimal("1.25"), b"\x00\x01", "text", datetime.date(2020, 1, 1)),
+                 (None, None, None, None)])
+
+    assert df["d"].iloc[0] == decimal.Decimal("1.25")
+    assert isinstance(df["x"].iloc[0], bytes)
+
+
+def test_datetime_out_of_range():
+    # 9999-12-31 is the usual "open ended" value of DATETIME2 columns and must not wrap around
+    df = _check(_description(("dt", datetime.datetime)),
+                [(datetime.datetime(9999, 12, 31),), (None,), (datetime.datetime(1, 1, 1),)])
+
+    assert df["dt"].iloc[0] == datetime.datetime(9999, 12, 31)
+    assert df["dt"].iloc[2] == datetime.datetime(1, 1, 1)
+
+
+@pytest.mark.parametrize("type_code", [int, float, bool, datetime.datetime, str])
+def test_no_rows(type_code):
+    df = build_dataframe(_description(("a", type_code), ("b", str)), [])
+
+    assert list(df.columns) == ["a", "b"]
+    assert len(df) == 0
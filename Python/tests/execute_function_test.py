@@ -4,11 +4,16 @@
 import io
 import os
 import pytest
+import warnings
 
 from contextlib import redirect_stdout, redirect_stderr
 from pandas import DataFrame
+from pandas.api.types import is_datetime64_dtype
+from pandas.testing import assert_series_equal
 
-from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor, OutputCapture
+from sqlmlutils.sqlbuilder import wrapper_script_cache
+from sqlmlutils.scriptcache import function_key
 from conftest import driver, server, database, uid, pwd
 
 connection = ConnectionInfo(driver=driver,
@@ -45,6 +50,83 @@ def test_with_order_args():
     assert res == 3 / 2.0
 
 
+def test_with_large_args():
+    def func_with_large_args(data, repeat=1):
+        return len(data) * repeat
+
+    data = bytes(range(256)) * 4096
+    res = sqlpy.execute_function_in_sql(func_with_large_args, data, repeat=2)
+    assert res == len(data) * 2
+
+
+def test_wrapper_script_cached():
+    def func_cached(arg):
+        return arg * 2
+
+    hits = wrapper_script_cache.info().hits
+    assert sqlpy.execute_function_in_sql(func_cached, 1) == 2
+    assert sqlpy.execute_function_in_sql(func_cached, 2) == 4
+    assert wrapper_script_cache.info().hits == hits + 1
+
+    def func_cached(arg):
+        return arg * 3
+
+    assert sqlpy.execute_function_in_sql(func_cached, 2) == 6
+
+
+def test_wrapper_script_cache_source_edit(tmp_path):
+    # Changing only an annotation keeps the code object equal; the source hash tells the versions apart
+    path = str(tmp_path / "edited_module.py")
+
+    def load(text, mtime):
+        with open(path, "w") as f:
+            f.write(text)
+        os.utime(path, (mtime, mtime))
+        namespace = {}
+        exec(compile(text, path, "exec"), namespace)
+        return namespace["func_edited"]
+
+    before = load("def func_edited(x: int):\n    return x\n", 1000)
+    key_before = function_key(before)
+    after = load("def func_edited(x: str):\n    return x\n", 2000)
+
+    assert before.__code__ == after.__code__
+    assert function_key(after) != key_before
+    assert function_key(after) == function_key(after)
+
+
+def test_registered_function():
+    offset = 10
+
+    def func_registered(arg1, arg2=0):
+        print(arg1)
+        return arg1 + arg2 + offset
+
+    remote_func = sqlpy.register_function(func_registered)
+    assert sqlpy.register_function(func_registered).hash == remote_func.hash
+
+    output = io.StringIO()
+    with redirect_stderr(output), redirect_stdout(output):
+        res = remote_func(1, arg2=2)
+
+    assert res == 13
+    assert "1" in output.getvalue()
+
+    sqlpy.unregister_function(remote_func)
+    with pytest.raises(RuntimeError):
+        remote_func(1)
+
+
+def test_registered_function_with_data_frame():
+    def func_registered_df(in_df):
+        return in_df.shape
+
+    remote_func = sqlpy.register_function(func_registered_df)
+    res = remote_func(input_data_query="SELECT TOP 10 * FROM airline5000")
+    assert res == (10, 30)
+    sqlpy.unregister_function(remote_func)
+
+
 def test_return():
     def func_with_return():
         return "returned!"
@@ -53,6 +135,23 @@ def test_return():
     assert res == func_with_return()
 
 
+@pytest.mark.parametrize("compression", [None, "auto", "zlib"])
+def test_return_compression(compression):
+    def func_with_large_return(size):
+        return bytes(range(256)) * size
+
+    res = sqlpy.execute_function_in_sql(func_with_large_return, 8192, compression=compression)
+    assert res == bytes(range(256)) * 8192
+
+
+def test_return_compression_not_supported():
+    def func_with_return():
+        return "returned!"
+
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(func_with_return, compression="gzip")
+
+
 @pytest.mark.skip(reason="Do we capture warnings?")
 def test_warning():
     def func_with_warning():
@@ -121,6 +220,289 @@ def test_with_data_frame():
     assert res.shape == (10, 30)
 
 
+def test_with_result_schema():
+    def func_return_typed_df(in_df, factor):
+        print("scoring")
+        in_df["Scaled"] = in_df["DayOfWeek"].astype(float) * factor
+        return in_df
+
+    output = io.StringIO()
+    with redirect_stderr(output), redirect_stdout(output):
+        res = sqlpy.execute_function_in_sql(func_return_typed_df, factor=0.5,
+                                            input_data_query="SELECT TOP 10 DayOfWeek FROM airline5000",
+                                            result_schema={"Scaled": float, "DayOfWeek": "nvarchar(MAX)"})
+
+    assert "scoring" in output.getvalue()
+    assert list(res.columns) == ["Scaled", "DayOfWeek"]
+    assert res.shape == (10, 2)
+    assert str(res["Scaled"].dtype) == "float64"
+
+
+def test_with_result_schema_not_data_frame():
+    def func_return_list():
+        return [1, 2, 3]
+
+    with pytest.raises(RuntimeError):
+        sqlpy.execute_function_in_sql(func_return_list, result_schema={"col": int})
+
+
+def test_with_rows_per_read():
+    def func_count_rows(in_df):
+        return len(in_df)
+
+    res = sqlpy.execute_function_in_sql(func_count_rows, rows_per_read=300,
+                                        input_data_query="SELECT TOP 1000 DayOfWeek FROM airline5000")
+
+    assert sorted(res) == [100, 300, 300, 300]
+
+
+def test_with_parallel():
+    def func_count_rows(in_df):
+        return len(in_df)
+
+    res = sqlpy.execute_function_in_sql(func_count_rows, parallel=True,
+                                        input_data_query="SELECT DayOfWeek FROM airline5000")
+
+    assert type(res) == list
+    assert sum(res) == 5000
+
+
+def test_with_rows_per_read_not_valid():
+    def func_count_rows(in_df):
+        return len(in_df)
+
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(func_count_rows, rows_per_read=0, input_data_query="SELECT 1 AS x")
+
+
+def test_with_partition_by():
+    def func_count_by_day(in_df):
+        return DataFrame({"DayOfWeek": [in_df["DayOfWeek"].iloc[0]], "Flights": [len(in_df)]})
+
+    res = sqlpy.execute_function_in_sql(func_count_by_day, partition_by="DayOfWeek", parallel=True,
+                                        input_data_query="SELECT DayOfWeek FROM airline5000")
+
+    assert type(res) == DataFrame
+    assert res["DayOfWeek"].nunique() == len(res)
+    assert res["Flights"].sum() == 5000
+
+
+def test_with_partition_by_order_by():
+    def func_sorted(in_df):
+        return list(in_df["ArrDelay"]) == sorted(in_df["ArrDelay"])
+
+    res = sqlpy.execute_function_in_sql(func_sorted, partition_by=["DayOfWeek"], order_by="ArrDelay",
+                                        input_data_query="SELECT DayOfWeek, ArrDelay FROM airline5000 "
+                                                         "WHERE ArrDelay IS NOT NULL")
+
+    assert len(res) > 1
+    assert all(res)
+
+
+def test_with_order_by_no_partition_by():
+    def func_sorted(in_df):
+        return in_df
+
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(func_sorted, order_by="ArrDelay",
+                                      input_data_query="SELECT ArrDelay FROM airline5000")
+
+
+def test_with_input_df():
+    def func_describe(in_df, column):
+        return in_df.shape, list(in_df.columns), in_df[column].sum(), int(in_df["name"].isna().sum())
+
+    df = DataFrame({"id": [1, 2, 3, 4], "score": [0.5, None, 1.5, 2.0], "name": ["a", None, "c", "d"]})
+    res = sqlpy.execute_function_in_sql(func_describe, "score", input_df=df)
+
+    assert res == ((4, 3), ["id", "score", "name"], 4.0, 1)
+
+
+def test_with_input_df_options():
+    def func_count_rows(in_df):
+        return len(in_df)
+
+    df = DataFrame({"key": [i % 3 for i in range(300)], "value": list(range(300))})
+    assert sorted(sqlpy.execute_function_in_sql(func_count_rows, input_df=df, rows_per_read=100)) == [100, 100, 100]
+    assert sqlpy.execute_function_in_sql(func_count_rows, input_df=df.head(0)) == 0
+
+    def func_identity(in_df):
+        return in_df
+
+    res = sqlpy.execute_function_in_sql(func_identity, input_df=df, result_schema=df)
+    assert sorted(res["value"]) == list(range(300))
+
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(func_count_rows, input_df=df, input_data_query="SELECT 1 AS x")
+
+
+def test_with_input_df_error():
+    def func_fail(in_df):
+        raise ValueError("bad input of {} rows".format(len(in_df)))
+
+    def func_count_rows(in_df):
+        return len(in_df)
+
+    df = DataFrame({"value": list(range(10))})
+    with pytest.raises(RuntimeError, match="bad input of 10 rows"):
+        sqlpy.execute_function_in_sql(func_fail, input_df=df)
+
+    # The input table of the failed call was dropped, so the next upload starts from an empty table
+    assert sqlpy.execute_function_in_sql(func_count_rows, input_df=df.head(3)) == 3
+
+
+def test_with_server_workers():
+    def func_delay_hours(in_df, factor):
+        out = in_df.copy()
+        out["DelayHours"] = out["ArrDelay"] / factor
+        return out
+
+    res = sqlpy.execute_function_in_sql(func_delay_hours, 60, server_workers=4,
+                                        input_data_query="SELECT TOP 1000 ArrDelay FROM airline5000")
+
+    # The chunks come back concatenated in input order
+    assert type(res) == DataFrame
+    assert list(res.index) == list(range(1000))
+    assert_series_equal(res["DelayHours"] * 60, res["ArrDelay"].astype(float), check_names=False)
+
+
+def test_with_server_workers_reduce():
+    def func_count_rows(in_df):
+        return len(in_df)
+
+    def total(counts):
+        return sum(counts)
+
+    query = "SELECT TOP 1000 DayOfWeek FROM airline5000"
+    assert sqlpy.execute_function_in_sql(func_count_rows, server_workers=3, input_data_query=query) == [333, 333, 334]
+    assert sqlpy.execute_function_in_sql(func_count_rows, server_workers=3, server_reduce=total,
+                                         input_data_query=query) == 1000
+
+
+def test_with_server_workers_not_valid():
+    def func_count_rows(in_df):
+        return len(in_df)
+
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(func_count_rows, server_workers=2)
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(func_count_rows, server_workers=2, rows_per_read=100,
+                                      input_data_query="SELECT 1 AS x")
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(func_count_rows, server_reduce=sum, input_data_query="SELECT 1 AS x")
+
+
+def _chatty(n):
+    import sys
+    for i in range(n):
+        print("step {}".format(i))
+    print("done", file=sys.stderr)
+    return n
+
+
+def test_output_capture_max_chars():
+    output = io.StringIO()
+    with redirect_stderr(output), redirect_stdout(output):
+        res = sqlpy.execute_function_in_sql(_chatty, 10000, output_capture=OutputCapture(max_chars=1000))
+
+    assert res == 10000
+    assert "step 0\n" in output.getvalue()
+    assert "step 9999\n" in output.getvalue()
+    assert "characters omitted" in output.getvalue()
+    assert len(output.getvalue()) < 3000
+
+
+def test_output_capture_disabled():
+    output = io.StringIO()
+    with redirect_stderr(output), redirect_stdout(output):
+        res = sqlpy.execute_function_in_sql(_chatty, 10, output_capture=False)
+
+    assert res == 10
+    assert "step" not in output.getvalue()
+
+
+def test_output_capture_stream():
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stderr(err), redirect_stdout(out):
+        res = sqlpy.execute_function_in_sql(_chatty, 10, output_capture=OutputCapture(stream=True))
+
+    assert res == 10
+    assert out.getvalue().splitlines() == ["step {}".format(i) for i in range(10)]
+    assert err.getvalue().splitlines() == ["done"]
+
+
+def test_output_capture_stream_not_supported():
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_in_sql(_chatty, 10, input_data_query="SELECT TOP 10 * FROM airline5000",
+                                      rows_per_read=5, output_capture=OutputCapture(stream=True))
+
+
+def _sweep(alpha, l1_ratio=0.5, scale=1):
+    print("alpha", alpha)
+    if alpha < 0:
+        raise ValueError("alpha must be positive")
+    return (alpha + l1_ratio) * scale
+
+
+def test_execute_function_batch():
+    output = io.StringIO()
+    with redirect_stderr(output), redirect_stdout(output):
+        res = sqlpy.execute_function_batch(_sweep, [1, (2, 0.25), {"alpha": 3, "l1_ratio": 0}], scale=10)
+
+    assert res == [15, 22.5, 30]
+    assert "alpha 1" in output.getvalue()
+    assert "alpha 3" in output.getvalue()
+
+
+def test_execute_function_batch_exceptions():
+    output = io.StringIO()
+    with redirect_stderr(output), redirect_stdout(output):
+        res = sqlpy.execute_function_batch(_sweep, [1, -1, 2])
+
+    assert res[0] == 1.5
+    assert isinstance(res[1], ValueError)
+    assert res[2] == 2.5
+    assert "alpha must be positive" in output.getvalue()
+
+    with pytest.raises(ValueError):
+        sqlpy.execute_function_batch(_sweep, [1, -1, 2], return_exceptions=False)
+
+
+def test_execute_function_batch_input_data():
+    def count_rows(df, limit):
+        return min(len(df), limit)
+
+    res = sqlpy.execute_function_batch(count_rows, [1, 10, 100], input_data_query="SELECT TOP 50 * FROM airline5000")
+    assert res == [1, 10, 50]
+    assert sqlpy.execute_function_batch(count_rows, [], input_data_query="SELECT TOP 50 * FROM airline5000") == []
+
+
+def test_execute_function_batch_server_workers():
+    output = io.StringIO()
+    with redirect_stderr(output), redirect_stdout(output):
+        res = sqlpy.execute_function_batch(_sweep, [1, -1, (2, 0.25), 3], server_workers=2)
+
+    assert res[0] == 1.5
+    assert isinstance(res[1], ValueError)
+    assert res[2:] == [2.25, 3.5]
+
+
+def test_option_names_in_func_kwargs():
+    def func_with_timeout(x, timeout=1):
+        return x, timeout
+
+    assert sqlpy.execute_function_in_sql(func_with_timeout, 1, func_kwargs={"timeout": 5}) == (1, 5)
+    assert sqlpy.execute_function_batch(func_with_timeout, [1, 2], func_kwargs={"timeout": 5}) == [(1, 5), (2, 5)]
+
+    with pytest.warns(UserWarning, match="func_kwargs"):
+        res = sqlpy.execute_function_in_sql(func_with_timeout, 1, timeout=60)
+    assert res == (1, 1)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        sqlpy.execute_function_in_sql(func_with_timeout, 1, timeout=60, func_kwargs={"timeout": 5})
+
+
 def test_with_variables():
     def func_with_variables(s):
         print(s)
@@ -146,6 +528,105 @@ def test_execute_query():
     assert res.shape == (10, 30)
 
 
+def test_execute_query_dtypes():
+    res = sqlpy.execute_sql_query("""
+        SELECT CAST(1 AS INT) AS i, CAST(NULL AS INT) AS i_null, CAST(1.5 AS FLOAT) AS f,
+               CAST(1 AS BIT) AS b, CAST(NULL AS BIT) AS b_null,
+               CAST('2020-01-01' AS DATETIME) AS dt, N'text' AS s
+        UNION ALL
+        SELECT 2, 3, NULL, 0, 1, NULL, NULL""")
+
+    assert str(res["i"].dtype) == "int64"
+    assert str(res["i_null"].dtype) == "Int64"
+    assert str(res["f"].dtype) == "float64"
+    assert str(res["b"].dtype) == "bool"
+    assert str(res["b_null"].dtype) == "boolean"
+    assert is_datetime64_dtype(res["dt"])
+    assert res["dt"].isna().tolist() == [False, True]
+    assert res["s"].iloc[0] == "text"
+    assert res["i_null"].isna().tolist() == [True, False]
+
+
+def test_execute_query_arrow():
+    pa = pytest.importorskip("pyarrow")
+    res = sqlpy.execute_sql_query("""
+        SELECT CAST(1 AS INT) AS i, CAST(NULL AS INT) AS i_null, CAST(1.25 AS DECIMAL(10, 2)) AS d, N'text' AS s
+        UNION ALL
+        SELECT 2, 3, NULL, NULL""", result_format="arrow")
+
+    assert isinstance(res, pa.Table)
+    assert res.schema.field("i").type == pa.int64()
+    assert res.schema.field("d").type == pa.decimal128(10, 2)
+    assert res.schema.field("s").type == pa.string()
+    assert res.column("i_null").null_count == 1
+
+
+def test_execute_query_arrow_stream():
+    pytest.importorskip("pyarrow")
+    reader = sqlpy.execute_sql_query("SELECT TOP 25 * FROM airline5000", result_format="arrow_stream")
+    table = reader.read_all()
+
+    assert table.shape == (25, 30)
+
+
+def test_execute_query_pandas_arrow():
+    pytest.importorskip("pyarrow")
+    res = sqlpy.execute_sql_query("SELECT TOP 10 * FROM airline5000", result_format="pandas_arrow")
+
+    assert res.shape == (10, 30)
+    assert all(str(dtype).endswith("[pyarrow]") for dtype in res.dtypes)
+
+
+def test_execute_query_result_format_not_supported():
+    with pytest.raises(ValueError):
+        sqlpy.execute_sql_query("SELECT 1 AS x", result_format="polars")
+
+
+def test_iter_sql_query():
+    chunks = list(sqlpy.iter_sql_query("SELECT TOP 25 * FROM airline5000", chunksize=10))
+
+    assert [chunk.shape for chunk in chunks] == [(10, 30), (10, 30), (5, 30)]
+    assert all(list(chunk.columns) == list(chunks[0].columns) for chunk in chunks)
+
+
+def test_iter_sql_query_stop_early():
+    chunks = sqlpy.iter_sql_query("SELECT * FROM airline5000", chunksize=100)
+    first = next(chunks)
+    chunks.close()
+
+    assert first.shape == (100, 30)
+    res = sqlpy.execute_sql_query("SELECT TOP 10 * FROM airline5000")
+    assert res.shape == (10, 30)
+
+
+def test_execute_query_multi():
+    query = "SELECT TOP 25 * FROM airline5000; SELECT 1 AS x, 'a' AS y; SELECT TOP 0 * FROM airline5000"
+    with sqlpy.execute_sql_query_multi(query) as results:
+        chunks = list(results[0].iter_chunks(chunksize=10))
+        second = results[1].fetch()
+
+        assert [chunk.shape for chunk in chunks] == [(10, 30), (10, 30), (5, 30)]
+        assert second.to_dict("records") == [{"x": 1, "y": "a"}]
+        assert results[2].fetch().shape == (0, 30)
+        assert len(results) == 3
+        assert results.done
+
+
+def test_execute_query_multi_skipped_sets_kept():
+    with sqlpy.execute_sql_query_multi("SELECT 1 AS x; SELECT 2 AS x; SELECT 3 AS x") as results:
+        assert results[2].fetch()["x"].iloc[0] == 3
+        assert [df["x"].iloc[0] for df in results.fetch_all()] == [1, 2, 3]
+
+
+def test_execute_query_multi_streamed_set_not_kept():
+    with sqlpy.execute_sql_query_multi("SELECT TOP 10 * FROM airline5000; SELECT 1 AS x") as results:
+        next(results[0].iter_chunks(chunksize=5))
+        results[1].fetch()
+
+        with pytest.raises(RuntimeError):
+            results[0].fetch()
+
+
 def test_execute_script():
     path = os.path.join(script_dir, "exec_script.py")
 
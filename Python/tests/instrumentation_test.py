@@ -0,0 +1,84 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import logging
+import pytest
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor, instrumentation
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = SQLPythonExecutor(connection)
+
+
+@pytest.fixture
+def events():
+    recorded = []
+    instrumentation.add_listener(recorded.append)
+    yield recorded
+    instrumentation.remove_listener(recorded.append)
+
+
+def test_function_event(events):
+    def func_with_args(arg1, arg2):
+        return [arg1] * arg2
+
+    sqlpy.execute_function_in_sql(func_with_args, "abc", 100)
+
+    assert len(events) == 1
+    event = events[0]
+    assert event.operation == "execute_function_in_sql"
+    assert event.builder == "SpeesBuilderFromFunction"
+    assert event.error is None
+    assert set(event.phases) == {instrumentation.CONNECT, instrumentation.BUILD, instrumentation.EXECUTE,
+                                 instrumentation.FETCH, instrumentation.DESERIALIZE}
+    assert event.duration >= sum(event.phases.values())
+    assert event.script_bytes > 0
+    assert event.argument_bytes > 0
+    assert event.result_bytes > 0
+    assert event.rows == 1
+
+
+def test_query_event(events):
+    sqlpy.execute_sql_query("SELECT TOP 10 * FROM airline5000")
+
+    assert [event.operation for event in events] == ["execute_sql_query"]
+    assert events[0].rows == 10
+
+
+def test_error_event(events):
+    with pytest.raises(RuntimeError):
+        sqlpy.execute_sql_query("SELECT * FROM table_that_does_not_exist")
+
+    assert isinstance(events[0].error, RuntimeError)
+
+
+def test_latency_aggregator():
+    aggregator = instrumentation.LatencyAggregator()
+    instrumentation.add_listener(aggregator)
+    try:
+        for _ in range(5):
+            sqlpy.execute_sql_query("SELECT 1 AS x")
+    finally:
+        instrumentation.remove_listener(aggregator)
+
+    summary = aggregator.summary()["execute_sql_query"]
+    assert summary["count"] == 5
+    assert summary["p50"] <= summary["p95"] <= summary["max"]
+
+
+def test_slow_call_logger(caplog):
+    slow_calls = instrumentation.SlowCallLogger(threshold=0)
+    instrumentation.add_listener(slow_calls)
+    try:
+        with caplog.at_level(logging.WARNING, logger="sqlmlutils.instrumentation"):
+            sqlpy.execute_sql_query("SELECT 1 AS x")
+    finally:
+        instrumentation.remove_listener(slow_calls)
+
+    assert "execute_sql_query" in caplog.text
@@ -0,0 +1,134 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import datetime
+import io
+import pytest
+
+from contextlib import redirect_stderr
+from pandas import DataFrame
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+from sqlmlutils.mapreduce import range_queries, sql_literal
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = SQLPythonExecutor(connection)
+
+table = "dbo.sqlmlutils_map_reduce_test"
+
+
+def _drop_table():
+    sqlpy.execute_sql_query("IF OBJECT_ID(N'{table}', N'U') IS NOT NULL DROP TABLE {table}".format(table=table))
+
+
+@pytest.fixture(autouse=True)
+def sample_table():
+    _drop_table()
+    sqlpy.write_dataframe(DataFrame({"id": list(range(1, 1001)), "value": [i % 7 for i in range(1, 1001)]}), table)
+    yield
+    _drop_table()
+
+
+def _sum_values(df, scale=1):
+    return int(df["value"].sum()) * scale, len(df)
+
+
+def _total(partials):
+    return sum(total for total, _ in partials), sum(rows for _, rows in partials)
+
+
+def test_map_reduce():
+    expected = sum(i % 7 for i in range(1, 1001))
+
+    assert sqlpy.map_reduce_in_sql(_sum_values, _total, table, "id", splits=4) == (expected, 1000)
+    assert sqlpy.map_reduce_in_sql(_sum_values, _total, table, "id", 10, splits=3) == (expected * 10, 1000)
+    assert sqlpy.map_reduce_in_sql(_sum_values, _total, table, "id", splits=4, reduce_in_sql=True,
+                                   scale=2) == (expected * 2, 1000)
+
+
+def test_map_reduce_ranges():
+    def row_counts(partials):
+        return [rows for _, rows in partials]
+
+    assert sqlpy.map_reduce_in_sql(_sum_values, row_counts, table, "id", splits=4) == [250, 250, 250, 250]
+    assert sqlpy.map_reduce_in_sql(_sum_values, row_counts, table, "id", splits=1) == [1000]
+
+    # fewer distinct keys than splits
+    assert len(sqlpy.map_reduce_in_sql(_sum_values, row_counts, table, "value", splits=20)) == 7
+
+
+def test_map_reduce_columns():
+    def column_names(df):
+        return list(df.columns)
+
+    res = sqlpy.map_reduce_in_sql(column_names, list, table, "id", splits=2, columns=["value"])
+    assert res == [["value"], ["value"]]
+
+
+def test_map_reduce_retries_failed_range():
+    def fail_once(df):
+        import os
+        import tempfile
+        marker = os.path.join(tempfile.gettempdir(), "sqlmlutils_map_reduce_test_{}".format(df["id"].min()))
+        if df["id"].min() > 1 and not os.path.exists(marker):
+            open(marker, "w").close()
+            raise RuntimeError("transient failure")
+        if os.path.exists(marker):
+            os.remove(marker)
+        return len(df)
+
+    output = io.StringIO()
+    with redirect_stderr(output):
+        res = sqlpy.map_reduce_in_sql(fail_once, sum, table, "id", splits=2, retries=1)
+
+    assert res == 1000
+    assert "retrying" in output.getvalue()
+
+
+def test_map_reduce_raises_after_retries():
+    def always_fail(df):
+        raise RuntimeError("permanent failure")
+
+    with redirect_stderr(io.StringIO()):
+        with pytest.raises(RuntimeError):
+            sqlpy.map_reduce_in_sql(always_fail, sum, table, "id", splits=2, retries=1)
+
+
+def test_map_reduce_datetime_key():
+    # datetime (not datetime2) keys only accept literals with up to 3 fractional digits
+    datetime_table = "dbo.sqlmlutils_map_reduce_datetime_test"
+    sqlpy.execute_sql_query("IF OBJECT_ID(N'{table}', N'U') IS NOT NULL DROP TABLE {table}; "
+                            "SELECT id, value, CAST(DATEADD(millisecond, id * 7, '2020-01-01') AS datetime) AS ts "
+                            "INTO {table} FROM {source}".format(table=datetime_table, source=table))
+    try:
+        res = sqlpy.map_reduce_in_sql(_sum_values, _total, datetime_table, "ts", splits=4)
+    finally:
+        sqlpy.execute_sql_query("DROP TABLE {table}".format(table=datetime_table))
+
+    assert res == (sum(i % 7 for i in range(1, 1001)), 1000)
+
+
+def test_map_reduce_not_valid():
+    with pytest.raises(ValueError):
+        sqlpy.map_reduce_in_sql(_sum_values, _total, table, "id", splits=0)
+    with pytest.raises(ValueError):
+        sqlpy.map_reduce_in_sql(_sum_values, _total, table, "id", retries=-1)
+
+
+def test_range_queries():
+    assert range_queries("t", "id", []) == ["SELECT * FROM [t]"]
+    assert range_queries("dbo.t", "id", [1, 5, 5, 9], "x") == [
+        "SELECT [x] FROM [dbo].[t] WHERE [id] <= 1 OR [id] IS NULL",
+        "SELECT [x] FROM [dbo].[t] WHERE [id] > 1 AND [id] <= 5",
+        "SELECT [x] FROM [dbo].[t] WHERE [id] > 5"]
+    assert sql_literal("it's") == "N'it''s'"
+    assert sql_literal(datetime.datetime(2020, 1, 1, 10, 0, 0, 123000)) == "'2020-01-01T10:00:00.123'"
+    assert sql_literal(datetime.datetime(2020, 1, 1, 10, 0, 0)) == "'2020-01-01T10:00:00'"
+    assert sql_literal(datetime.datetime(2020, 1, 1, 10, 0, 0, 123456)) == "'2020-01-01T10:00:00.123456'"
+    assert sql_literal(datetime.date(2020, 1, 1)) == "'2020-01-01'"
@@ -0,0 +1,99 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import time
+import pytest
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor, querycache
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = SQLPythonExecutor(connection)
+
+
+@pytest.fixture
+def cache():
+    return querycache.configure_cache(ttl=60, max_entries=4)
+
+
+def _time(sqlpy, cache):
+    return sqlpy.execute_sql_query("SELECT SYSDATETIME() AS now", cache=cache)["now"].iloc[0]
+
+
+def test_cached_query(cache):
+    first = _time(sqlpy, True)
+    time.sleep(0.01)
+
+    assert _time(sqlpy, True) == first
+    assert _time(sqlpy, False) != first
+    assert cache.stats["hits"] == 1
+
+
+def test_normalized_query(cache):
+    sqlpy.execute_sql_query("SELECT TOP 5 *  FROM airline5000", cache=True)
+    sqlpy.execute_sql_query("SELECT TOP 5 *\n  FROM airline5000 ", cache=True)
+
+    assert cache.stats == {"hits": 1, "misses": 1, "entries": 1, "bytes": cache.stats["bytes"]}
+
+
+def test_params_in_key(cache):
+    query = "SELECT ? AS x"
+    assert sqlpy.execute_sql_query(query, 1, cache=True)["x"].iloc[0] == 1
+    assert sqlpy.execute_sql_query(query, 2, cache=True)["x"].iloc[0] == 2
+
+
+def test_returns_copy(cache):
+    df = sqlpy.execute_sql_query("SELECT 1 AS x", cache=True)
+    df["x"] = 2
+
+    assert sqlpy.execute_sql_query("SELECT 1 AS x", cache=True)["x"].iloc[0] == 1
+
+
+def test_ttl_and_lru():
+    cache = querycache.configure_cache(ttl=0.5, max_entries=2)
+    first = _time(sqlpy, True)
+    time.sleep(0.6)
+    assert _time(sqlpy, True) != first
+
+    for i in range(3):
+        sqlpy.execute_sql_query("SELECT ? AS x", i, cache=True)
+    assert cache.size == 2
+
+
+def test_explicit_invalidation(cache):
+    first = _time(sqlpy, True)
+    querycache.invalidate(connection)
+    time.sleep(0.01)
+
+    assert _time(sqlpy, True) != first
+
+
+def test_metadata_not_cached_by_default(cache):
+    assert not cache.metadata
+    assert not querycache.cache_metadata()
+
+
+def test_sproc_changes_invalidate():
+    def func():
+        return None
+
+    cache = querycache.configure_cache(metadata=True)
+    try:
+        name = "cache_test_sproc"
+        sqlpy.drop_sproc(name)
+        assert not sqlpy.check_sproc(name)
+
+        sqlpy.create_sproc_from_function(name, func)
+        assert sqlpy.check_sproc(name)
+
+        sqlpy.drop_sproc(name)
+        assert not sqlpy.check_sproc(name)
+        assert cache.stats["misses"] > 0
+    finally:
+        # Other tests must not get cached answers about their stored procedures and packages
+        querycache.configure_cache()
@@ -0,0 +1,92 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import pytest
+
+from concurrent.futures import as_completed
+
+from sqlmlutils import ConnectionInfo, SQLServerExecutor
+from sqlmlutils.connectionpool import configure_pool, get_pool
+from sqlmlutils.sqlqueryexecutor import SQLQueryExecutor
+from sqlmlutils.sqlserverexecutor import register_joblib_backend
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+
+def test_submit():
+    def square(x):
+        print("squaring", x)
+        return x * x
+
+    with SQLServerExecutor(connection, max_workers=4) as executor:
+        futures = {executor.submit(square, x): x for x in range(8)}
+        for future in as_completed(futures):
+            x = futures[future]
+            assert future.result() == x * x
+            assert "squaring {}".format(x) in future.stdout
+
+
+def test_map():
+    def add(x, y):
+        return x + y
+
+    with SQLServerExecutor(connection, max_workers=2) as executor:
+        assert list(executor.map(add, [1, 2, 3], [10, 20, 30])) == [11, 22, 33]
+
+
+def test_submit_error():
+    def fail():
+        raise ValueError("bad value")
+
+    with SQLServerExecutor(connection, max_workers=1) as executor:
+        future = executor.submit(fail)
+        with pytest.raises(RuntimeError):
+            future.result()
+
+
+def test_max_workers_not_valid():
+    with pytest.raises(ValueError):
+        SQLServerExecutor(connection, max_workers=0)
+
+
+def test_own_connections():
+    def identity(x):
+        return x
+
+    # Tasks do not wait for the shared pool, even when all of its connections are checked out
+    configure_pool(connection, max_size=1, checkout_timeout=1)
+    try:
+        with SQLQueryExecutor(connection):
+            with SQLServerExecutor(connection, max_workers=3) as executor:
+                assert list(executor.map(identity, range(6))) == list(range(6))
+        assert get_pool(connection).size == 1
+    finally:
+        configure_pool(connection)
+
+
+def test_submit_after_shutdown():
+    def noop():
+        return None
+
+    executor = SQLServerExecutor(connection, max_workers=1)
+    executor.shutdown()
+    with pytest.raises(RuntimeError):
+        executor.submit(noop)
+
+
+def test_joblib_backend():
+    joblib = pytest.importorskip("joblib")
+
+    def cube(x):
+        return x ** 3
+
+    register_joblib_backend(connection)
+    with joblib.parallel_config(backend="sqlserver", n_jobs=4):
+        results = joblib.Parallel()(joblib.delayed(cube)(x) for x in range(10))
+
+    assert results == [x ** 3 for x in range(10)]
@@ -159,6 +159,31 @@ def test_out_df_no_params():
     assert not sqlpy.check_sproc(name)
 
 
+def test_all_result_sets():
+    """Test a stored procedure returning several result sets"""
+    name = "test_all_result_sets"
+    sqlpy.drop_sproc(name)
+
+    sqlpy.execute_sql_query("""
+CREATE PROCEDURE {name} @n int, @_stdout_ nvarchar(MAX) OUTPUT, @_stderr_ nvarchar(MAX) OUTPUT
+AS
+BEGIN
+    SELECT TOP (@n) * FROM airline5000;
+    SELECT @n AS n;
+END
+""".format(name=name))
+
+    results = sqlpy.execute_sproc(name, all_result_sets=True, n=3)
+    features, n = results.fetch_all()
+    assert features.shape == (3, 30)
+    assert n["n"].iloc[0] == 3
+    assert results.done
+    assert results.output_params == {}
+
+    sqlpy.drop_sproc(name)
+    assert not sqlpy.check_sproc(name)
+
+
 def test_out_df_with_args():
     """Test a function with output data set and input args"""
     def my_func_with_args(arg1: str, arg2: str):
@@ -205,6 +230,55 @@ def test_out_df_in_df():
     assert not sqlpy.check_sproc(name)
 
 
+def test_out_df_in_df_rows_per_read():
+    """Test a function streaming its input data set in batches"""
+    def count_rows(in_df: DataFrame):
+        return DataFrame({"rows": [len(in_df)]})
+
+    name = "test_out_df_in_df_rows_per_read"
+    sqlpy.drop_sproc(name)
+
+    sqlpy.create_sproc_from_function(name, count_rows, rows_per_read=300)
+    assert sqlpy.check_sproc(name)
+
+    res, outparams = sqlpy.execute_sproc(name, in_df="SELECT TOP 1000 * FROM airline5000")
+
+    assert sorted(res["rows"]) == [100, 300, 300, 300]
+    assert not outparams
+
+    sqlpy.drop_sproc(name)
+    assert not sqlpy.check_sproc(name)
+
+
+def test_out_df_in_df_partition_by():
+    """Test a function called once per partition of its input data set"""
+    def count_by_day(in_df: DataFrame):
+        return DataFrame({"DayOfWeek": [in_df["DayOfWeek"].iloc[0]], "Flights": [len(in_df)]})
+
+    name = "test_out_df_in_df_partition_by"
+    sqlpy.drop_sproc(name)
+
+    sqlpy.create_sproc_from_function(name, count_by_day, partition_by="DayOfWeek", parallel=True)
+    assert sqlpy.check_sproc(name)
+
+    res, outparams = sqlpy.execute_sproc(name, in_df="SELECT DayOfWeek FROM airline5000")
+
+    assert res.iloc[:, 0].nunique() == len(res)
+    assert res.iloc[:, 1].sum() == 5000
+    assert not outparams
+
+    sqlpy.drop_sproc(name)
+    assert not sqlpy.check_sproc(name)
+
+
+def test_partition_by_no_in_df():
+    def no_in_df(val1: int):
+        return DataFrame({"val1": [val1]})
+
+    with pytest.raises(ValueError):
+        sqlpy.create_sproc_from_function("test_partition_by_no_in_df", no_in_df, partition_by="val1")
+
+
 def test_out_df_mixed_args_in_df():
     """Test a function with input, output data set and input params"""
     def mixed(val1: int, val2: str, val3: float, val4: DataFrame, val5: bool):
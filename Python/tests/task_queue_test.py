@@ -0,0 +1,80 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import io
+import pytest
+
+from contextlib import redirect_stdout
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor, QueryTimeoutError
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = SQLPythonExecutor(connection)
+
+
+def _square(x, scale=1):
+    print("square", x)
+    if x < 0:
+        raise ValueError("negative input")
+    return x * x * scale
+
+
+def test_task_queue():
+    queue = sqlpy.task_queue("task_queue_test")
+    task_ids = queue.map(_square, range(20), scale=2)
+    assert queue.pending >= 20
+
+    queue.start_workers(count=2, idle_timeout=2, poll_interval=0.1)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        results = queue.results(task_ids, timeout=120)
+
+    assert results == [x * x * 2 for x in range(20)]
+    assert "square 19" in output.getvalue()
+
+    assert queue.join(timeout=60)
+    assert queue.processed == 20
+
+
+def test_task_exception():
+    queue = sqlpy.task_queue("task_queue_test")
+    good = queue.submit(_square, 3)
+    bad = queue.submit(_square, -1)
+    queue.start_workers(idle_timeout=2, poll_interval=0.1)
+
+    assert queue.result(good, timeout=120) == 9
+    with pytest.raises(ValueError):
+        queue.result(bad, timeout=120)
+
+
+def test_registered_function_task():
+    remote_square = sqlpy.register_function(_square)
+    queue = sqlpy.task_queue("task_queue_test")
+    queue.start_workers(idle_timeout=2, poll_interval=0.1, max_tasks=1)
+    assert queue.result(queue.submit(remote_square, 4, scale=3), timeout=120) == 48
+    assert queue.join(timeout=60)
+
+
+def test_result_timeout():
+    queue = sqlpy.task_queue("task_queue_without_workers")
+    task_id = queue.submit(_square, 1)
+    with pytest.raises(QueryTimeoutError):
+        queue.result(task_id, timeout=1)
+    assert queue.clear() >= 1
+    assert queue.pending == 0
+
+
+def test_results_without_workers():
+    queue = sqlpy.task_queue("task_queue_without_workers")
+    task_id = queue.submit(_square, 1)
+    try:
+        # Nothing would ever finish the task, so waiting without a timeout fails instead of blocking
+        with pytest.raises(RuntimeError, match="No worker"):
+            queue.result(task_id)
+    finally:
+        queue.clear()
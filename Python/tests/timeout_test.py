@@ -0,0 +1,126 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import threading
+import time
+import pytest
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor, CancellationToken, QueryCancelledError, QueryTimeoutError
+from sqlmlutils.connectionpool import configure_pool, get_pool
+from sqlmlutils.sqlqueryexecutor import SQLQueryExecutor
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = SQLPythonExecutor(connection)
+
+
+def _sleep(seconds):
+    import time
+    time.sleep(seconds)
+    return seconds
+
+
+def test_query_timeout():
+    start = time.monotonic()
+    with pytest.raises(QueryTimeoutError):
+        sqlpy.execute_sql_query("WAITFOR DELAY '00:00:30'; SELECT 1 AS x", timeout=1)
+    assert time.monotonic() - start < 10
+
+    # The timed out connection was discarded; the next call gets a working one
+    df = sqlpy.execute_sql_query("SELECT 1 AS x")
+    assert df["x"][0] == 1
+
+
+def test_timeout_is_a_timeout_error():
+    with pytest.raises(TimeoutError):
+        sqlpy.execute_sql_query("WAITFOR DELAY '00:00:30'; SELECT 1 AS x", timeout=1)
+
+
+def test_function_timeout():
+    start = time.monotonic()
+    with pytest.raises(QueryTimeoutError):
+        sqlpy.execute_function_in_sql(_sleep, 30, timeout=2)
+    assert time.monotonic() - start < 15
+
+    assert sqlpy.execute_function_in_sql(_sleep, 0, timeout=30) == 0
+
+
+def test_connection_default_timeout():
+    quick = SQLPythonExecutor(ConnectionInfo(driver=driver, server=server, database=database, uid=uid, pwd=pwd,
+                                             query_timeout=1))
+    with pytest.raises(QueryTimeoutError):
+        quick.execute_sql_query("WAITFOR DELAY '00:00:30'; SELECT 1 AS x")
+
+    # A timeout given with the call overrides the default
+    df = quick.execute_sql_query("WAITFOR DELAY '00:00:02'; SELECT 1 AS x", timeout=30)
+    assert df["x"][0] == 1
+
+
+def test_sproc_timeout():
+    sqlpy.execute_sql_query("CREATE OR ALTER PROCEDURE sleep_sproc AS "
+                            "BEGIN WAITFOR DELAY '00:00:30'; SELECT 1 AS x END")
+    try:
+        with pytest.raises(QueryTimeoutError):
+            sqlpy.execute_sproc("sleep_sproc", timeout=1)
+    finally:
+        sqlpy.drop_sproc("sleep_sproc")
+
+
+def test_cancellation_token():
+    token = CancellationToken()
+    errors = []
+
+    def run():
+        with token:
+            try:
+                sqlpy.execute_function_in_sql(_sleep, 30)
+            except Exception as e:
+                errors.append(e)
+
+    size = get_pool(connection).size
+    thread = threading.Thread(target=run)
+    start = time.monotonic()
+    thread.start()
+    time.sleep(2)
+    token.cancel()
+    thread.join()
+
+    assert time.monotonic() - start < 15
+    assert len(errors) == 1
+    assert isinstance(errors[0], QueryCancelledError)
+    assert not isinstance(errors[0], QueryTimeoutError)
+    assert get_pool(connection).size <= size
+
+
+def test_cancelled_while_waiting_for_connection():
+    # The cancel arrives while the call waits for a pooled connection: the statement must not run afterwards
+    configure_pool(connection, max_size=1)
+    token = CancellationToken()
+    errors = []
+
+    def run():
+        with token:
+            try:
+                sqlpy.execute_sql_query("WAITFOR DELAY '00:00:30'; SELECT 1 AS x")
+            except Exception as e:
+                errors.append(e)
+
+    try:
+        with SQLQueryExecutor(connection):
+            thread = threading.Thread(target=run)
+            thread.start()
+            time.sleep(1)
+            token.cancel()
+        start = time.monotonic()
+        thread.join()
+
+        assert time.monotonic() - start < 10
+        assert len(errors) == 1
+        assert isinstance(errors[0], QueryCancelledError)
+    finally:
+        configure_pool(connection)
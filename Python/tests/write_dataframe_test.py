@@ -0,0 +1,113 @@
+# Copyright(c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import pytest
+
+from pandas import DataFrame
+
+from sqlmlutils import ConnectionInfo, SQLPythonExecutor
+from sqlmlutils.sqltypes import quote_table_name
+from conftest import driver, server, database, uid, pwd
+
+connection = ConnectionInfo(driver=driver,
+                            server=server,
+                            database=database,
+                            uid=uid,
+                            pwd=pwd)
+
+sqlpy = SQLPythonExecutor(connection)
+
+table = "dbo.sqlmlutils_write_test"
+
+
+def _drop_table():
+    sqlpy.execute_sql_query("IF OBJECT_ID(N'{table}', N'U') IS NOT NULL DROP TABLE {table}".format(table=table))
+
+
+def _read_table():
+    return sqlpy.execute_sql_query("SELECT * FROM {table} ORDER BY id".format(table=table))
+
+
+@pytest.fixture(autouse=True)
+def clean_table():
+    _drop_table()
+    yield
+    _drop_table()
+
+
+def test_append_creates_table():
+    df = DataFrame({"id": [1, 2, 3], "score": [0.5, None, 1.5], "name": ["a", None, "c"], "flag": [True, False, True]})
+
+    assert sqlpy.write_dataframe(df, table) == 3
+    assert sqlpy.write_dataframe(df, table, chunksize=2) == 3
+
+    res = _read_table()
+    assert res.shape == (6, 4)
+    assert list(res["id"]) == [1, 1, 2, 2, 3, 3]
+    assert res["name"].isna().sum() == 2
+    assert str(res["score"].dtype) == "float64"
+
+
+def test_replace():
+    sqlpy.write_dataframe(DataFrame({"id": [1, 2, 3]}), table)
+    sqlpy.write_dataframe(DataFrame({"id": [4], "extra": ["x"]}), table, mode="replace")
+
+    res = _read_table()
+    assert list(res.columns) == ["id", "extra"]
+    assert list(res["id"]) == [4]
+
+
+def test_upsert():
+    sqlpy.write_dataframe(DataFrame({"id": [1, 2], "score": [0.1, 0.2]}), table)
+    sqlpy.write_dataframe(DataFrame({"id": [2, 3], "score": [2.0, 3.0]}), table, mode="upsert", keys="id")
+
+    res = _read_table()
+    assert list(res["id"]) == [1, 2, 3]
+    assert list(res["score"]) == [0.1, 2.0, 3.0]
+
+
+def test_upsert_identity_key():
+    sqlpy.execute_sql_query("CREATE TABLE {table} (id INT IDENTITY(1, 1) PRIMARY KEY, name NVARCHAR(50))"
+                            .format(table=table))
+    sqlpy.execute_sql_query("INSERT INTO {table} (name) VALUES (N'a'), (N'b')".format(table=table))
+
+    df = DataFrame({"id": [2, 10], "name": ["B", "j"]})
+    assert sqlpy.write_dataframe(df, table, mode="upsert", keys="id") == 2
+
+    res = _read_table()
+    assert list(res["id"]) == [1, 2, 10]
+    assert list(res["name"]) == ["a", "B", "j"]
+
+    # The identity still applies to rows inserted without an id
+    sqlpy.execute_sql_query("INSERT INTO {table} (name) VALUES (N'k')".format(table=table))
+    assert _read_table()["id"].iloc[-1] == 11
+
+
+def test_upsert_without_keys():
+    with pytest.raises(ValueError):
+        sqlpy.write_dataframe(DataFrame({"id": [1]}), table, mode="upsert")
+
+
+def test_bad_mode():
+    with pytest.raises(ValueError):
+        sqlpy.write_dataframe(DataFrame({"id": [1]}), table, mode="overwrite")
+
+
+def test_non_bmp_strings():
+    # Characters outside the BMP take two UTF-16 code units, so the parameter size must count those
+    df = DataFrame({"id": [1, 2], "name": ["\U0001F600" * 3, "abc"]})
+    assert sqlpy.write_dataframe(df, table) == 2
+
+    res = _read_table()
+    assert list(res["name"]) == ["\U0001F600" * 3, "abc"]
+
+
+def test_quote_table_name():
+    assert quote_table_name("dbo.sqlmlutils_write_test") == "[dbo].[sqlmlutils_write_test]"
+    assert quote_table_name("[dbo].[my table]") == "[dbo].[my table]"
+    assert quote_table_name("[my.schema].[a]]b]") == "[my.schema].[a]]b]"
+    assert quote_table_name("db..t") == "[db]..[t]"
+
+    for name in ["[dbo", "dbo.[a]b]", "dbo.t]; DROP TABLE t; --", "x[y]", ".t", "t.", "a.b.c.d.e"]:
+        with pytest.raises(ValueError):
+            quote_table_name(name)